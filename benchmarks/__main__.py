@@ -0,0 +1,100 @@
+"""Benchmarks of the index.
+
+Usage:
+    python -m benchmarks run [--files N] [--output results.json] ...
+    python -m benchmarks compare old.json new.json [--threshold 0.1]
+
+'run' generates a synthetic corpus (or reuses the one already generated with
+the same parameters), measures how fast the index is built from it and how
+long queries take, and prints the results as JSON (or writes them to a
+file). 'compare' compares the results of 2 runs, and exits with 1 if a
+metric got worse than the threshold.
+
+"""
+from benchmarks.compare import compare, format_comparison
+from benchmarks.runner import run
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+
+
+def _run(args):
+    directory = args.corpus or os.path.join(
+            tempfile.gettempdir(), f'cdl-corpus-{args.files}')
+    results = run(directory, args.files, args.words_per_file,
+                  args.vocabulary, args.queries, args.workers, args.mode,
+                  args.seed, args.instrument)
+    text = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, 'w') as file:
+            file.write(text + '\n')
+    else:
+        print(text)
+    return 0
+
+
+def _compare(args):
+    with open(args.old) as file:
+        old = json.load(file)
+    with open(args.new) as file:
+        new = json.load(file)
+    if old.get('params') != new.get('params'):
+        print('[Warning] The runs were done with different parameters, '
+              'the results may not be comparable.\n')
+    rows = compare(old, new, args.threshold)
+    print(format_comparison(rows))
+    regressions = [row for row in rows if row[4]]
+    if regressions:
+        print(f'\n{len(regressions)} metric(s) got worse by more than '
+              f'{args.threshold:.0%}.')
+        return 1
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(prog='python -m benchmarks')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = commands.add_parser(
+            'run', help='run the benchmarks on a synthetic corpus')
+    run_parser.add_argument('--files', type=int, default=1000,
+                            help='number of files in the corpus')
+    run_parser.add_argument('--words-per-file', type=int, default=200,
+                            help='average number of words in a file')
+    run_parser.add_argument('--vocabulary', type=int, default=50000,
+                            help='number of distinct words in the corpus')
+    run_parser.add_argument('--queries', type=int, default=200,
+                            help='queries per shape and selectivity')
+    run_parser.add_argument('--workers', type=int, default=None,
+                            help='add the files with this many worker '
+                                 'processes, instead of one by one')
+    run_parser.add_argument('--mode', choices=('auto', 'sparse', 'dense'),
+                            default='auto', help='query evaluation mode')
+    run_parser.add_argument('--seed', type=int, default=0)
+    run_parser.add_argument('--instrument', action='store_true',
+                            help='add the time spent in every step of '
+                                 'indexing and querying to the results')
+    run_parser.add_argument('--corpus', metavar='DIR',
+                            help='directory of the corpus (defaults to a '
+                                 'directory in the temporary directory)')
+    run_parser.add_argument('--output', metavar='FILE',
+                            help='write the results to FILE')
+    run_parser.set_defaults(function=_run)
+
+    compare_parser = commands.add_parser(
+            'compare', help='compare the results of 2 runs')
+    compare_parser.add_argument('old', help='results of the baseline run')
+    compare_parser.add_argument('new', help='results of the run to check')
+    compare_parser.add_argument('--threshold', type=float, default=0.1,
+                                help='allowed slowdown, as a fraction')
+    compare_parser.set_defaults(function=_compare)
+
+    args = parser.parse_args()
+    return args.function(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,68 @@
+# The metrics that are compared, as (path in the results, whether higher is
+# better). A '*' matches every key at that level.
+METRICS = [
+    (('ingestion', 'files_per_second'), True),
+    (('ingestion', 'mb_per_second'), True),
+    (('queries', '*', 'p50_ms'), False),
+    (('queries', '*', 'p99_ms'), False),
+    (('peak_rss_mb',), False),
+]
+
+
+def _values(results, path, prefix=()):
+    """Yield (name, value) for every value at a path in the results."""
+    if not path:
+        if isinstance(results, (int, float)):
+            yield '.'.join(prefix), results
+        return
+    if not isinstance(results, dict):
+        return
+    key, rest = path[0], path[1:]
+    keys = sorted(results) if key == '*' else [key]
+    for key in keys:
+        if key in results:
+            yield from _values(results[key], rest, prefix + (key,))
+
+
+def compare(old, new, threshold=0.1):
+    """Compare the results of 2 benchmark runs.
+
+    Args:
+        old: The results of the baseline run.
+        new: The results of the run to check.
+        threshold: How much worse (as a fraction, 0.1 is 10%) a metric can
+        get before it counts as a regression.
+
+    Returns:
+        A list of (metric, old value, new value, relative change, regressed)
+        tuples, for the metrics found in both runs. The relative change is
+        positive when the metric got better.
+
+    """
+    rows = []
+    for path, higher_is_better in METRICS:
+        old_values = dict(_values(old, path))
+        for name, new_value in _values(new, path):
+            old_value = old_values.get(name)
+            if old_value is None:
+                continue
+            if old_value:
+                change = (new_value - old_value) / old_value
+            else:
+                change = 0.0 if not new_value else float('inf')
+            if not higher_is_better:
+                change = -change
+            rows.append((name, old_value, new_value, change,
+                         change < -threshold))
+    return rows
+
+
+def format_comparison(rows):
+    """Format the rows returned by compare as a table."""
+    width = max([len(row[0]) for row in rows] + [6])
+    lines = [f'{"metric":<{width}} {"old":>12} {"new":>12} {"change":>8}']
+    for name, old_value, new_value, change, regressed in rows:
+        flag = '  REGRESSION' if regressed else ''
+        lines.append(f'{name:<{width}} {old_value:>12.3f} '
+                     f'{new_value:>12.3f} {change:>+8.1%}{flag}')
+    return '\n'.join(lines)
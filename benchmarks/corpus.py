@@ -0,0 +1,113 @@
+from itertools import accumulate
+import json
+import os
+import random
+
+
+# The file describing a generated corpus, written in its directory
+MANIFEST = 'corpus.json'
+
+# How many files go in every subdirectory of the corpus, so that no
+# directory gets too big
+FILES_PER_DIRECTORY = 1000
+
+_LETTERS = 'abcdefghijklmnopqrstuvwxyz'
+
+
+def make_word(rank):
+    """Return the word of a rank in the vocabulary: 'qaa', 'qab', ...,
+    'qzz', 'qbaa', ... (rank 0 is the most frequent word).
+
+    Every word is at least 3 letters long and starts with a 'q', so that no
+    word is a stop word, or is dropped for being too short.
+
+    """
+    word = ''
+    while rank or len(word) < 2:
+        rank, letter = divmod(rank, len(_LETTERS))
+        word = _LETTERS[letter] + word
+    return 'q' + word
+
+
+class Corpus():
+    """A synthetic corpus of text files, whose words follow a Zipf
+    distribution: the word of rank r appears with a frequency proportional to
+    1 / (r + 1) ** exponent, as words do in natural language.
+
+    The corpus is generated from a seed, so the same parameters always give
+    the same files.
+
+    """
+
+    def __init__(self, directory, files=1000, words_per_file=200,
+                 vocabulary=50000, exponent=1.1, seed=0):
+        """Initialization of the corpus.
+
+        Args:
+            directory: The directory the files are written to.
+            files: The number of files.
+            words_per_file: The average number of words in a file. The
+            lengths of the files are spread between half and one and a half
+            times this.
+            vocabulary: The number of distinct words.
+            exponent: The exponent of the Zipf distribution.
+            seed: The seed of the random number generator.
+
+        """
+        self.directory = directory
+        self.params = {
+            'files': files,
+            'words_per_file': words_per_file,
+            'vocabulary': vocabulary,
+            'exponent': exponent,
+            'seed': seed,
+        }
+        self.words = [make_word(rank) for rank in range(vocabulary)]
+        self._cum_weights = list(accumulate(
+                1 / (rank + 1) ** exponent for rank in range(vocabulary)))
+
+    def file_names(self):
+        """Return the names of the files of the corpus, in order."""
+        return [os.path.join(self.directory,
+                             f'{number // FILES_PER_DIRECTORY:04}',
+                             f'{number:07}.txt')
+                for number in range(self.params['files'])]
+
+    def is_generated(self):
+        """Whether the directory already holds a corpus with the same
+        parameters.
+
+        """
+        try:
+            with open(os.path.join(self.directory, MANIFEST)) as manifest:
+                return json.load(manifest) == self.params
+        except (FileNotFoundError, ValueError):
+            return False
+
+    def generate(self):
+        """Write the files of the corpus, unless they were already generated
+        with the same parameters.
+
+        Returns:
+            The file names of the corpus.
+
+        """
+        file_names = self.file_names()
+        if self.is_generated():
+            return file_names
+
+        rng = random.Random(self.params['seed'])
+        average = self.params['words_per_file']
+        for file_name in file_names:
+            os.makedirs(os.path.dirname(file_name), exist_ok=True)
+            count = rng.randint(max(1, average // 2), average * 3 // 2)
+            words = rng.choices(self.words, cum_weights=self._cum_weights,
+                                k=count)
+            with open(file_name, 'w') as file:
+                # Ten words a line, like some text would have
+                for start in range(0, count, 10):
+                    file.write(' '.join(words[start:start + 10]) + '\n')
+
+        with open(os.path.join(self.directory, MANIFEST), 'w') as manifest:
+            json.dump(self.params, manifest)
+        return file_names
@@ -0,0 +1,204 @@
+from benchmarks.corpus import Corpus
+from model import Index, Metrics
+
+import math
+import os
+import platform
+import random
+import statistics
+import sys
+import time
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows
+    resource = None
+
+
+# The version of the format of the results
+RESULTS_VERSION = 1
+
+# The shapes of the queries that are measured, with a placeholder for every
+# word
+QUERY_SHAPES = {
+    'and': '{} && {}',
+    'or': '{} || {}',
+    'not': '{} && !{}',
+    'mixed': '({} || {}) && !{}',
+}
+
+# The words of the queries are picked from these ranges of ranks in the
+# vocabulary (as fractions of the vocabulary, from the most frequent word),
+# which gives queries matching many files, some files or almost none
+SELECTIVITIES = {
+    'frequent': (0.0, 0.001),
+    'medium': (0.01, 0.05),
+    'rare': (0.5, 1.0),
+}
+
+
+def percentile(values, fraction):
+    """Return a percentile of a list of values, with the nearest rank
+    method.
+
+    Args:
+        values: A non-empty list of numbers.
+        fraction: The percentile, between 0 and 1 (e.g. 0.99 for p99).
+
+    """
+    ordered = sorted(values)
+    rank = math.ceil(fraction * len(ordered))
+    return ordered[min(max(rank, 1), len(ordered)) - 1]
+
+
+def peak_rss_mb():
+    """Return the peak resident memory of this process, in MB, or None if it
+    can't be measured on this platform.
+
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS, and in kilobytes everywhere else
+    if sys.platform == 'darwin':
+        return peak / (1 << 20)
+    return peak / (1 << 10)
+
+
+def make_queries(words, count, seed=0):
+    """Generate the queries to measure.
+
+    Args:
+        words: The vocabulary, from the most frequent word.
+        count: How many queries to generate for every shape and selectivity.
+        seed: The seed of the random number generator.
+
+    Returns:
+        A dictionary of 'shape/selectivity' names to lists of queries.
+
+    """
+    rng = random.Random(seed)
+    queries = {}
+    for shape, template in QUERY_SHAPES.items():
+        for selectivity, (low, high) in SELECTIVITIES.items():
+            start = int(low * len(words))
+            stop = max(start + 1, int(high * len(words)))
+            pool = words[start:stop]
+            queries[f'{shape}/{selectivity}'] = [
+                    template.format(*(rng.choice(pool)
+                                      for _ in range(template.count('{}'))))
+                    for _ in range(count)]
+    return queries
+
+
+def measure_ingestion(file_names, workers=None, metrics=None):
+    """Build an index from files, and measure how fast it was built.
+
+    Args:
+        file_names: The files to add to the index.
+        workers: If given, the files are added with Index.add_files and that
+        many worker processes. Otherwise they are added one by one with
+        Index.add_file.
+        metrics: A Metrics to instrument the index with.
+
+    Returns:
+        An (index, results) tuple: the Index, and a dictionary with the
+        'seconds' it took, and the 'files_per_second' and 'mb_per_second'.
+
+    """
+    size = sum(os.path.getsize(file_name) for file_name in file_names)
+    # The results are not cached, so every query is measured in full
+    index = Index(query_cache_size=0, metrics=metrics)
+
+    start = time.perf_counter()
+    if workers is None:
+        for file_name in file_names:
+            index.add_file(file_name)
+    else:
+        index.add_files(file_names, workers)
+    seconds = time.perf_counter() - start
+
+    return index, {
+        'seconds': seconds,
+        'files_per_second': len(file_names) / seconds,
+        'mb_per_second': size / (1 << 20) / seconds,
+    }
+
+
+def measure_queries(index, queries, mode='auto'):
+    """Measure the latency of queries.
+
+    Args:
+        index: The Index to run the queries on.
+        queries: A dictionary of names to lists of queries, as returned by
+        make_queries.
+        mode: The mode the queries are evaluated in.
+
+    Returns:
+        A dictionary with, for every name, the number of queries, the p50,
+        p99 and mean latency in milliseconds, and the mean number of files
+        that matched.
+
+    """
+    results = {}
+    for name, texts in queries.items():
+        latencies = []
+        matches = []
+        for text in texts:
+            start = time.perf_counter()
+            files = index.get_result_for_query(text, mode)
+            latencies.append((time.perf_counter() - start) * 1000)
+            matches.append(len(files))
+        results[name] = {
+            'queries': len(texts),
+            'p50_ms': percentile(latencies, 0.5),
+            'p99_ms': percentile(latencies, 0.99),
+            'mean_ms': statistics.mean(latencies),
+            'mean_matches': statistics.mean(matches),
+        }
+    return results
+
+
+def run(directory, files=1000, words_per_file=200, vocabulary=50000,
+        queries=200, workers=None, mode='auto', seed=0, instrument=False):
+    """Run the whole benchmark: generate (or reuse) a corpus, build an index
+    from it, and run queries on it.
+
+    Args:
+        directory: The directory of the corpus.
+        files, words_per_file, vocabulary, seed: The parameters of the
+        corpus, see Corpus.
+        queries: How many queries to run for every shape and selectivity.
+        workers: The number of worker processes to add the files with, see
+        measure_ingestion.
+        mode: The mode the queries are evaluated in.
+        instrument: Whether to instrument the index (see model/metrics.py),
+        and add the time spent in every step to the results. This slows the
+        benchmark down a little.
+
+    Returns:
+        A dictionary with the results, that can be saved as JSON.
+
+    """
+    corpus = Corpus(directory, files, words_per_file, vocabulary, seed=seed)
+    file_names = corpus.generate()
+
+    metrics = Metrics() if instrument else None
+    index, ingestion = measure_ingestion(file_names, workers, metrics)
+    query_results = measure_queries(
+            index, make_queries(corpus.words, queries, seed), mode)
+
+    results = {
+        'version': RESULTS_VERSION,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'params': dict(corpus.params, queries=queries, workers=workers,
+                       mode=mode),
+        'ingestion': ingestion,
+        'queries': query_results,
+        'peak_rss_mb': peak_rss_mb(),
+    }
+    if metrics is not None:
+        results['metrics'] = metrics.snapshot()
+    return results
@@ -1 +1 @@
-from config.config import Config
+from config.config import Config, ConfigSnapshot, ConfigWatcher
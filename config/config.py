@@ -1,76 +1,277 @@
+from collections import namedtuple
 import json
 import warnings
 import os
+import threading
+
+
+# The settings that change which terms are kept in the index. If one of them
+# changes, an index built before the change has to be built again.
+ANALYZER_SETTINGS = ('remove_stopwords', 'language', 'use_stemming')
+
+
+class ConfigSnapshot(namedtuple('ConfigSnapshot', ANALYZER_SETTINGS + (
+        'stem_cache_size',))):
+    """The resolved settings of a config.json file.
+
+    Every setting is validated, defaulted and derived from the others (e.g.
+    use_stemming is False when stop words are removed for a language other
+    than english) once, when the snapshot is made. A snapshot is a tuple, so
+    it can't be changed afterwards.
+
+    """
+
+    __slots__ = ()
+
+    def analyzer_settings(self):
+        """Return the settings that change which terms are kept in the
+        index, in a dictionary, in the same form as Analyzer.settings.
+
+        """
+        return {name: getattr(self, name) for name in ANALYZER_SETTINGS}
 
 
 class Config():
     """This is a simple class to read configuration data from the config.json
     file and store it here.
 
+    The file is read and resolved into a ConfigSnapshot once, when the Config
+    is created, so asking for a setting never touches the filesystem. The
+    file can be read again with reload, which swaps in a new snapshot.
+
     """
 
-    def __init__(self):
+    def __init__(self, file_name='config.json'):
         """Initialization of the Config.
 
         _config: A dictionary used to hold the configuration read from the
         'config.json' file.
 
+        _snapshot: The ConfigSnapshot resolved from _config.
+
+        reindex_required: Set to True by reload when a setting that changes
+        which terms are kept in the index changed.
+
+        Args:
+            file_name: The file to read the configuration from.
+
         Raises:
             ValueError: if the config.json has wrong format.
 
+        """
+        self._file_name = file_name
+        self._config = self._read()
+        self._snapshot = self._resolve(self._config)
+        self.reindex_required = False
+
+    def _read(self):
+        """Read the configuration file.
+
+        Returns:
+            A dictionary with the configuration.
+
+        Raises:
+            ValueError: if the file has wrong format.
+
         """
         try:
 
-            with open('config.json') as config_file:
-                self._config = json.load(config_file)
+            with open(self._file_name) as config_file:
+                return json.load(config_file)
 
         except FileNotFoundError:
-            warnings.warn('[Warning] Could not find config.json. Continuing with defaults.')
-            self._config = {}
+            warnings.warn(f'[Warning] Could not find {self._file_name}. Continuing with defaults.')
+            return {}
         except json.decoder.JSONDecodeError as e:
-            raise json.decoder.JSONDecodeError('[JSON Error] Please check that your config.json file is correct.', e.doc, e.pos)
+            raise json.decoder.JSONDecodeError(f'[JSON Error] Please check that your {self._file_name} file is correct.', e.doc, e.pos)
+
+    @staticmethod
+    def _resolve(config):
+        """Validate the configuration, and resolve it into a ConfigSnapshot.
+
+        Args:
+            config: The dictionary read from the configuration file.
+
+        """
+        # If the configuration file is not present or the parameter
+        # 'remove_stop_words' is missing, don't remove stop words
+        remove_stopwords = config.get('remove_stop_words', False)
+        if remove_stopwords not in [False, True]:
+            remove_stopwords = False
+
+        language = config.get('stop_words_language', 'english')
+        if (not isinstance(language, str)
+                or language not in os.listdir('stopwords')):
+            warnings.warn(f"[Warning] Language '{language}' not supported, continuing with english.")
+            language = 'english'
+
+        use_stemming = config.get('use_stemming', False)
+        if use_stemming not in [False, True]:
+            use_stemming = False
+        # If 'remove_stop_words' is set to true and language is not english,
+        # don't apply stemming
+        if remove_stopwords and language != 'english':
+            use_stemming = False
+
+        stem_cache_size = config.get('stem_cache_size', 50000)
+        if (not isinstance(stem_cache_size, int)
+                or isinstance(stem_cache_size, bool)
+                or stem_cache_size < 0):
+            stem_cache_size = 50000
+
+        return ConfigSnapshot(bool(remove_stopwords), language,
+                              bool(use_stemming), stem_cache_size)
+
+    @property
+    def snapshot(self):
+        """The current ConfigSnapshot."""
+        return self._snapshot
+
+    @property
+    def file_name(self):
+        return self._file_name
+
+    def reload(self):
+        """Read the configuration file again, and swap in a new snapshot.
+
+        The new snapshot replaces the old one in a single step, so a reader
+        sees either the old settings or the new ones, never a mix of them.
+        If a setting that changes which terms are kept in the index changed,
+        reindex_required is set.
+
+        Returns:
+            True if the settings changed, False otherwise.
+
+        Raises:
+            ValueError: if the file has wrong format. The old settings are
+                kept.
+
+        """
+        config = self._read()
+        snapshot = self._resolve(config)
+        old, self._config, self._snapshot = self._snapshot, config, snapshot
+        if old.analyzer_settings() != snapshot.analyzer_settings():
+            self.reindex_required = True
+        return old != snapshot
 
     def remove_stopwords(self):
         """This function returns whether the program should remove stopwords or
         no, based on the configuration file. If the configuration file is not
         present or the parameter 'remove_stop_words' is missing, it defaults to
-        True.
+        False.
 
         Returns:
             True if stopwords should be removed, False otherwise.
 
         """
-        remove_stopwords = self._config.get('remove_stop_words', False)
-        if remove_stopwords not in [False, True]:
-            return False
-        return remove_stopwords
+        return self._snapshot.remove_stopwords
 
     def language(self):
         """This function returns the language used for stop word removal.
-        Defaults to english if the parameter is missing.
+        Defaults to english if the parameter is missing, or if there are no
+        stop words for the language (a warning is given when the Config is
+        created).
 
         Returns:
             The language used for stopwords removal.
 
         """
-        language = self._config.get('stop_words_language', 'english')
-        if language not in os.listdir('stopwords'):
-            warnings.warn(f"[Warning] Language '{language}' not supported, continuing with english.")
-            return 'english'
-        return language
+        return self._snapshot.language
 
     def use_stemming(self):
         """This function returns whether the program should use stemming.
+        Stemming is only used for english, so it is disabled when stop words
+        are removed for another language.
 
         Returns:
             True if stemming should be used, False otherwise.
 
         """
-        use_stemming = self._config.get('use_stemming', False)
-        if use_stemming not in [False, True]:
+        return self._snapshot.use_stemming
+
+    def stem_cache_size(self):
+        """This function returns how many words the stemming cache can hold.
+        Defaults to 50000 if the parameter is missing or is not a
+        non-negative integer.
+
+        Returns:
+            The maximum size of the stemming cache (0 disables it).
+
+        """
+        return self._snapshot.stem_cache_size
+
+
+class ConfigWatcher():
+    """Watches the file of a Config, and reloads the Config when the file
+    changes.
+
+    The file is checked every interval seconds, by a background thread,
+    comparing its modification time and size with the ones it had before.
+
+    """
+
+    def __init__(self, config, interval=1.0, on_change=None):
+        """Initialization of the watcher.
+
+        Args:
+            config: The Config to reload.
+            interval: How often to check the file, in seconds.
+            on_change: A callable called with the Config after it was
+            reloaded with new settings, e.g. to check
+            config.reindex_required.
+
+        """
+        self._config = config
+        self._interval = interval
+        self._on_change = on_change
+        self._stamp = self._file_stamp()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _file_stamp(self):
+        try:
+            stat = os.stat(self._config.file_name)
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def check(self):
+        """Reload the Config if its file changed since the last check.
+
+        Returns:
+            True if the Config was reloaded with new settings.
+
+        """
+        stamp = self._file_stamp()
+        if stamp == self._stamp:
             return False
-        # If 'remove_stop_words' is set to true and language is not english,
-        # don't apply stemming
-        if self.remove_stopwords() and self.language() != 'english':
+        self._stamp = stamp
+        try:
+            changed = self._config.reload()
+        except ValueError as e:
+            # Keep the old settings until the file is fixed
+            warnings.warn(f'[Warning] {e} Keeping the previous settings.')
             return False
-        return use_stemming
+        if changed and self._on_change is not None:
+            self._on_change(self._config)
+        return changed
+
+    def start(self):
+        """Start checking the file in a background thread."""
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop the background thread."""
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+
+    def _run(self):
+        while not self._stop.wait(self._interval):
+            self.check()
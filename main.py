@@ -1,4 +1,11 @@
 from model import Index
+from model.query import MODES
+from server import QueryServer
+
+import argparse
+import asyncio
+import os
+import sys
 
 
 def add_file_to_index(file, index):
@@ -8,35 +15,200 @@ def add_file_to_index(file, index):
             IndexError,
             FileNotFoundError,
             IsADirectoryError,
-            PermissionError
+            PermissionError,
+            ValueError,
+            OSError
             ) as e:
         print(e)
     else:
         print(msg)
 
 
-def main():
+def print_progress(report):
+    # Rewrite the same line of the standard error after every batch
+    print(f'\r{report["added"]} files added, {report["skipped"]} skipped, '
+          f'{len(report["errors"])} errors '
+          f'({report["files_per_second"]:.0f} files/s)',
+          end='', file=sys.stderr, flush=True)
+
+
+def add_directories(index, directories, include, exclude):
+    for directory in directories:
+        try:
+            report = index.add_directory(directory, include, exclude,
+                                         progress=print_progress)
+        except (FileNotFoundError, NotADirectoryError) as e:
+            print(e)
+            continue
+        print(file=sys.stderr)
+        for error in report['errors']:
+            print(error)
+        print(f'[Success] {report["added"]} files of "{directory}" were '
+              f'added to index!')
+
+
+def build_index(positions=False, directories=None, include=None,
+                exclude=None):
     # create a new index
     try:
-        index = Index()
+        index = Index(positions=positions)
     except ValueError as e:
         print(e)
 
+    if directories:
+        add_directories(index, directories, include, exclude)
+        # Nothing else is added, the index can be compacted
+        index.freeze()
+        return index
+
     try:
         with open('files.txt') as file:
-            for line in file:
-                if not line.strip() or line.strip().startswith('#'):
-                    continue
-                add_file_to_index(line.split()[0], index)
+            files = [line.split()[0] for line in file
+                     if line.strip() and not line.strip().startswith('#')]
+        # The files are scanned in parallel, on all the CPUs
+        for msg in index.add_files(files):
+            print(msg)
+        index.freeze()
     except FileNotFoundError:
         print('files.txt was not found, continuing with manual file addition.')
         prompt = 'File to add to index (or simply press enter for query): '
         while (file := input(prompt)) != "":
             add_file_to_index(file, index)
 
+    return index
+
+
+def read_queries(file):
+    # Every line is a query, empty lines and comments are skipped
+    for line in file:
+        line = line.strip()
+        if line and not line.startswith('#'):
+            yield line
+
+
+def ranked_results(index, queries, top_k):
+    # The top_k best files for every query, from the best one
+    for query in queries:
+        try:
+            yield query, index.get_result_for_query(query, top_k=top_k)
+        except ValueError as e:
+            yield query, e
+
+
+def run_queries(index, file_name, top_k=None, mode='auto'):
+    # The results are printed as they come, one line per query: the query,
+    # then the files that matched it, separated by tabs
+    file = sys.stdin if file_name == '-' else open(file_name)
+    with file:
+        if top_k is None:
+            results = index.iter_results_for_queries(read_queries(file),
+                                                     mode)
+        else:
+            results = ranked_results(index, read_queries(file), top_k)
+        for query, result in results:
+            if isinstance(result, ValueError):
+                print(query, result, sep='\t')
+            else:
+                print(query, *result, sep='\t', flush=True)
+
+
+async def serve(index, address, workers):
+    server = QueryServer(index, workers=workers)
+    if address.startswith('unix:'):
+        listening = await server.start(path=address[len('unix:'):])
+    else:
+        host, _, port = address.rpartition(':')
+        listening = await server.start(host or '127.0.0.1', int(port))
+    print(f'[Success] Serving queries on {listening}!')
+    try:
+        await server.serve_forever()
+    finally:
+        await server.close()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+            '--index', metavar='FILE',
+            help='load the index from FILE if it exists, otherwise build it '
+                 'and save it to FILE')
+    parser.add_argument(
+            '--queries', metavar='FILE',
+            help='answer the queries in FILE (one per line, or - for the '
+                 'standard input) instead of asking for a query')
+    parser.add_argument(
+            '--serve', metavar='ADDRESS',
+            help='serve queries on ADDRESS (HOST:PORT, or unix:PATH for a '
+                 'Unix socket) instead of asking for a query')
+    parser.add_argument(
+            '--dir', action='append', metavar='DIR',
+            help='build the index from all the files under DIR, at any '
+                 'depth, instead of files.txt (can be given many times)')
+    parser.add_argument(
+            '--include', action='append', metavar='PATTERN',
+            help='with --dir, only index the files that match the glob '
+                 'PATTERN (e.g. "*.txt", can be given many times)')
+    parser.add_argument(
+            '--exclude', action='append', metavar='PATTERN',
+            help='with --dir, leave out the files and directories that '
+                 'match the glob PATTERN (can be given many times)')
+    parser.add_argument(
+            '--positions', action='store_true',
+            help='keep the positions of the words when building the index, '
+                 'to answer phrase ("...") and NEAR/k queries')
+    parser.add_argument(
+            '--top', type=int, metavar='K',
+            help='only show the K files that match every query best, '
+                 'ranked by relevance')
+    parser.add_argument(
+            '--mode', choices=MODES, default='auto',
+            help='with --queries, how to evaluate the queries ("vector" '
+                 'needs NumPy)')
+    parser.add_argument(
+            '--explain', action='store_true',
+            help='show how the query is evaluated (the plan, with the '
+                 'estimated number of files and cost of every part of it)')
+    parser.add_argument(
+            '--workers', type=int, default=0,
+            help='with --serve, evaluate the queries in this many worker '
+                 'processes')
+    args = parser.parse_args()
+
+    if args.index and os.path.isfile(args.index):
+        try:
+            index = Index.load(args.index)
+        except ValueError as e:
+            print(e)
+            return
+        print(f'[Success] The index was loaded from "{args.index}"!')
+    else:
+        index = build_index(args.positions, args.dir, args.include,
+                            args.exclude)
+        if args.index:
+            index.save(args.index)
+            print(f'[Success] The index was saved to "{args.index}"!')
+
+    if args.serve:
+        try:
+            asyncio.run(serve(index, args.serve, args.workers))
+        except KeyboardInterrupt:
+            pass
+        except (ValueError, OSError) as e:
+            print(f'[Error] Could not serve on "{args.serve}": {e}')
+        return
+
+    if args.queries:
+        try:
+            run_queries(index, args.queries, args.top, args.mode)
+        except FileNotFoundError:
+            print(f'[Error] The file "{args.queries}" does not exist!')
+        return
+
     query = input("Query: ")
     try:
-        print('Files that matched the query:', *index.get_result_for_query(query))
+        if args.explain and query:
+            print(index.explain(query))
+        print('Files that matched the query:', *index.get_result_for_query(query, top_k=args.top))
     except ValueError as e:
         print(e)
 
@@ -1 +1,3 @@
 from model.index import Index
+from model.metrics import Metrics
+from model.shard import ShardedIndex
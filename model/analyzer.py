@@ -0,0 +1,278 @@
+from model.cache import LRUCache
+
+from collections import Counter
+from nltk.stem.snowball import EnglishStemmer
+from os import path
+
+
+class StopwordFilter():
+    """Analysis stage that drops the stop words of a language.
+
+    The stop words are read from the stopwords directory once, when the stage
+    is created, and kept in a frozenset.
+
+    """
+
+    def __init__(self, language):
+        """Initialization of the stage.
+
+        Args:
+            language: The language of the stop words, that is the name of a
+            file in the stopwords directory.
+
+        """
+        stop_words = []
+        stop_words_path = f'stopwords/{language}'
+        if path.isfile(stop_words_path):
+            with open(stop_words_path) as stopwords_file:
+                stop_words = [x.strip() for x in stopwords_file.readlines()]
+        self.stop_words = frozenset(stop_words)
+
+    def __call__(self, word):
+        return None if word in self.stop_words else word
+
+
+class MinLengthFilter():
+    """Analysis stage that drops the words shorter than a minimum length."""
+
+    def __init__(self, min_length):
+        self.min_length = min_length
+
+    def __call__(self, word):
+        return word if len(word) >= self.min_length else None
+
+
+class Stemmer():
+    """Analysis stage that applies the (english) stemming algorithm.
+
+    Since the same words come up again and again, in files and in queries,
+    the stems are kept in an LRUCache instead of being computed every time.
+
+    """
+
+    def __init__(self, cache_size=0):
+        """Initialization of the stage.
+
+        Args:
+            cache_size: How many stems to cache.
+
+        """
+        self._stemmer = EnglishStemmer()
+        self.cache = LRUCache(cache_size)
+
+    def __call__(self, word):
+        stem = self.cache.get(word)
+        if stem is None:
+            stem = self._stemmer.stem(word)
+            self.cache.put(word, stem)
+        return stem
+
+
+class Analyzer():
+    """This class turns the words of a file, or of a query, into the terms
+    that are kept in the index.
+
+    It is built once from the Config, and then shared by indexing and
+    querying. The words go through a list of stages: every stage is a
+    callable that receives a word and returns the word to keep (possibly
+    changed), or None to drop it.
+
+    The stages built from the Config are:
+      1. StopwordFilter and MinLengthFilter(3), if 'remove_stop_words' is set.
+      2. Stemmer, if 'use_stemming' is set.
+    More stages can be added with add_stage.
+
+    Only the stages that change words, and not the ones that filter them out,
+    are applied to query words: a query for a stop word simply matches
+    nothing.
+
+    """
+
+    def __init__(self, config):
+        """Initialization of the analyzer.
+
+        _stages: A list of (stage, on_query) tuples, in the order the stages
+        are applied. on_query is True if the stage is applied to query words
+        as well.
+
+        _stemmer: The Stemmer stage, if stemming is used.
+
+        settings: The settings of the Config the analyzer was built from. An
+        index built with some settings must be rebuilt to be used with other
+        settings.
+
+        Args:
+            config: The Config the analysis settings are read from.
+
+        """
+        self._stages = []
+        self.settings = {
+            'remove_stopwords': config.remove_stopwords(),
+            'language': config.language(),
+            'use_stemming': config.use_stemming(),
+        }
+
+        # If 'remove_stopwords' is set, remove the stopwords and the words
+        # shorter than 3 letters
+        if self.settings['remove_stopwords']:
+            self.add_stage(StopwordFilter(self.settings['language']))
+            self.add_stage(MinLengthFilter(3))
+
+        # If 'use_stemming' is set, stem the words
+        self._stemmer = None
+        if self.settings['use_stemming']:
+            self._stemmer = Stemmer(config.stem_cache_size())
+            self.add_stage(self._stemmer, on_query=True)
+
+    def add_stage(self, stage, on_query=False):
+        """Add a stage at the end of the analysis.
+
+        Args:
+            stage: A callable taking a word and returning a word, or None
+            to leave the word out.
+            on_query: Whether to apply the stage to query words too. A
+            query word left out matches no file.
+
+        """
+        self._stages.append((stage, on_query))
+
+    @property
+    def stem_cache(self):
+        """The LRUCache of the stemming stage, or None without stemming."""
+        return self._stemmer.cache if self._stemmer is not None else None
+
+    @property
+    def stages(self):
+        """The stages of the analysis, in order."""
+        return [stage for stage, _ in self._stages]
+
+    def analyze(self, words, metrics=None):
+        """Analyze the words of a file.
+
+        Args:
+            words: An iterable of lowercase words.
+            metrics: A Metrics to record the time spent in every stage to,
+            as 'index.analyze.<name of the stage>'. For more see
+            model/metrics.py.
+
+        Returns:
+            A set with the terms to add to the index for the words.
+
+        """
+        if metrics is not None and metrics.enabled:
+            return self._analyze_by_stage(words, metrics)
+
+        terms = set()
+        stages = self.stages
+        for word in words:
+            for stage in stages:
+                word = stage(word)
+                if word is None:
+                    break
+            else:
+                terms.add(word)
+        return terms
+
+    def _analyze_by_stage(self, words, metrics):
+        # The same as analyze, but every stage is applied to all the words
+        # before the next one, so every stage can be timed on its own
+        terms = set(words)
+        for stage in self.stages:
+            name = getattr(stage, '__name__', type(stage).__name__)
+            with metrics.timer(f'index.analyze.{name}'):
+                terms = {term for term in map(stage, terms)
+                         if term is not None}
+        return terms
+
+    def analyze_frequencies(self, frequencies, metrics=None):
+        """Analyze the words of a file, keeping how many times they appear.
+
+        Args:
+            frequencies: A dictionary of lowercase words to the number of
+            times they appear in the file.
+            metrics: A Metrics to record the time spent in every stage to,
+            see analyze.
+
+        Returns:
+            A Counter of the terms to add to the index for the words to the
+            number of times they appear. Words that give the same term (e.g.
+            'cycling' and 'cycled' when stemming) add up.
+
+        """
+        return Counter(self._analyze_values(frequencies, metrics,
+                                            lambda old, new: old + new))
+
+    def analyze_positions(self, positions, metrics=None):
+        """Analyze the words of a file, keeping their positions.
+
+        Args:
+            positions: A dictionary of lowercase words to the sorted lists
+            of their positions in the file.
+            metrics: A Metrics to record the time spent in every stage to,
+            see analyze.
+
+        Returns:
+            A dictionary of the terms to add to the index for the words to
+            the sorted lists of their positions. The positions of words that
+            give the same term are merged, and the positions of the words
+            that are left out (e.g. stop words) are not reused, so the
+            distance between the other words stays the same.
+
+        """
+        return self._analyze_values(positions, metrics,
+                                    lambda old, new: sorted(old + new))
+
+    def _analyze_values(self, values, metrics, merge):
+        """Analyze words that have a value each, merging the values of the
+        words that give the same term with merge(old, new).
+
+        """
+        stages = self.stages
+        if metrics is not None and metrics.enabled:
+            # Every stage is applied to all the words before the next one,
+            # so every stage can be timed on its own
+            terms = dict(values)
+            for stage in stages:
+                name = getattr(stage, '__name__', type(stage).__name__)
+                with metrics.timer(f'index.analyze.{name}'):
+                    staged = {}
+                    for term, value in terms.items():
+                        term = stage(term)
+                        if term is not None:
+                            old = staged.get(term)
+                            staged[term] = value if old is None \
+                                else merge(old, value)
+                    terms = staged
+            return terms
+
+        if not stages:
+            return values
+        terms = {}
+        for word, value in values.items():
+            for stage in stages:
+                word = stage(word)
+                if word is None:
+                    break
+            else:
+                old = terms.get(word)
+                terms[word] = value if old is None else merge(old, value)
+        return terms
+
+    def normalize(self, word):
+        """Analyze a word from a query.
+
+        Args:
+            word: The word, as written in the query.
+
+        Returns:
+            The term to look up in the index for the word, or None if a
+            stage left it out (so it matches no file).
+
+        """
+        word = word.lower()
+        for stage, on_query in self._stages:
+            if on_query:
+                word = stage(word)
+                if word is None:
+                    return None
+        return word
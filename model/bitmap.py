@@ -0,0 +1,433 @@
+from array import array
+from bisect import bisect_left, bisect_right
+
+
+# Every value is split into a high part (the chunk key) and a low part (the
+# position inside the chunk). Each chunk holds at most 65536 values.
+CHUNK_BITS = 16
+CHUNK_SIZE = 1 << CHUNK_BITS
+LOW_MASK = CHUNK_SIZE - 1
+
+# Chunks with at most this many values are stored as sorted arrays.
+ARRAY_LIMIT = 4096
+
+# Size in bytes of a bitset container (65536 bits).
+BITSET_BYTES = CHUNK_SIZE // 8
+
+# For every byte value, the positions of the bits set in it.
+_BYTE_BITS = tuple(tuple(bit for bit in range(8) if byte >> bit & 1)
+                   for byte in range(256))
+
+try:
+    _popcount = int.bit_count
+except AttributeError:  # Python < 3.10
+    def _popcount(bits):
+        return bin(bits).count('1')
+
+
+def _bit_positions(bits):
+    """Yield the positions of the bits set in an integer, in increasing order.
+
+    Args:
+        bits: A non-negative integer used as a bitset.
+
+    """
+    data = bits.to_bytes((bits.bit_length() + 7) // 8, 'little')
+    for offset, byte in enumerate(data):
+        if byte:
+            base = offset * 8
+            for bit in _BYTE_BITS[byte]:
+                yield base + bit
+
+
+def _bits_from_positions(positions):
+    """Build an integer bitset out of an iterable of positions in a chunk.
+
+    Args:
+        positions: Values between 0 and 65535.
+
+    Returns:
+        An integer with the bits at the given positions set.
+
+    """
+    buffer = bytearray(BITSET_BYTES)
+    for position in positions:
+        buffer[position >> 3] |= 1 << (position & 7)
+    return int.from_bytes(buffer, 'little')
+
+
+def _container_from_bits(bits):
+    """Choose the most compact container for a bitset.
+
+    Args:
+        bits: A non-negative integer holding the bits of one chunk.
+
+    Returns:
+        An ArrayContainer, RunContainer or BitsetContainer, or None if no bit
+        is set.
+
+    """
+    if not bits:
+        return None
+    cardinality = _popcount(bits)
+    starts = bits & ~(bits << 1)
+    runs = _popcount(starts)
+    # Serialized sizes: 2 bytes per array value, 4 bytes per run, and a fixed
+    # 8192 bytes for a bitset
+    if 4 * runs < min(2 * cardinality, BITSET_BYTES):
+        ends = bits & ~(bits >> 1)
+        return RunContainer(list(zip(_bit_positions(starts),
+                                     _bit_positions(ends))))
+    if cardinality <= ARRAY_LIMIT:
+        return ArrayContainer(array('H', _bit_positions(bits)))
+    return BitsetContainer(bits, cardinality)
+
+
+class ArrayContainer():
+    """A chunk holding few values, stored as a sorted array of 16 bit
+    integers.
+
+    """
+
+    __slots__ = ('values',)
+
+    def __init__(self, values):
+        self.values = values
+
+    @property
+    def cardinality(self):
+        return len(self.values)
+
+    def bits(self):
+        return _bits_from_positions(self.values)
+
+    def __iter__(self):
+        return iter(self.values)
+
+    def __contains__(self, low):
+        values = self.values
+        position = bisect_right(values, low)
+        return position > 0 and values[position - 1] == low
+
+    def and_(self, other):
+        if isinstance(other, ArrayContainer):
+            values = sorted(set(self.values).intersection(other.values))
+        else:
+            values = [value for value in self.values if value in other]
+        return ArrayContainer(array('H', values)) if values else None
+
+    def or_(self, other):
+        if (isinstance(other, ArrayContainer)
+                and self.cardinality + other.cardinality <= ARRAY_LIMIT):
+            values = sorted(set(self.values).union(other.values))
+            return ArrayContainer(array('H', values))
+        return _container_from_bits(self.bits() | other.bits())
+
+    def andnot(self, other):
+        values = [value for value in self.values if value not in other]
+        return ArrayContainer(array('H', values)) if values else None
+
+
+class BitsetContainer():
+    """A dense chunk, stored as a 65536 bit integer. Operations between two
+    bitsets are done a machine word at a time by Python's integer
+    arithmetic.
+
+    """
+
+    __slots__ = ('_bits', 'cardinality')
+
+    def __init__(self, bits, cardinality):
+        self._bits = bits
+        self.cardinality = cardinality
+
+    def bits(self):
+        return self._bits
+
+    def __iter__(self):
+        return _bit_positions(self._bits)
+
+    def __contains__(self, low):
+        return self._bits >> low & 1 == 1
+
+    def and_(self, other):
+        if isinstance(other, ArrayContainer):
+            return other.and_(self)
+        return _container_from_bits(self._bits & other.bits())
+
+    def or_(self, other):
+        return _container_from_bits(self._bits | other.bits())
+
+    def andnot(self, other):
+        return _container_from_bits(self._bits & ~other.bits())
+
+
+class RunContainer():
+    """A chunk made of long runs of consecutive values, stored as a sorted list
+    of (start, end) pairs, both inclusive.
+
+    """
+
+    __slots__ = ('runs', '_starts')
+
+    def __init__(self, runs):
+        self.runs = runs
+        self._starts = [start for start, _ in runs]
+
+    @property
+    def cardinality(self):
+        return sum(end - start + 1 for start, end in self.runs)
+
+    def bits(self):
+        bits = 0
+        for start, end in self.runs:
+            bits |= ((1 << (end - start + 1)) - 1) << start
+        return bits
+
+    def __iter__(self):
+        for start, end in self.runs:
+            yield from range(start, end + 1)
+
+    def __contains__(self, low):
+        position = bisect_right(self._starts, low)
+        return position > 0 and self.runs[position - 1][1] >= low
+
+    def and_(self, other):
+        if isinstance(other, ArrayContainer):
+            return other.and_(self)
+        return _container_from_bits(self.bits() & other.bits())
+
+    def or_(self, other):
+        return _container_from_bits(self.bits() | other.bits())
+
+    def andnot(self, other):
+        return _container_from_bits(self.bits() & ~other.bits())
+
+
+class Bitmap():
+    """A compressed bitmap of non-negative integers, in the style of Roaring
+    bitmaps.
+
+    The values are split in chunks of 65536 by their high bits. Every chunk
+    that has at least one value keeps its low bits in the most compact of
+    three containers:
+      1. ArrayContainer: a sorted array, for sparse chunks.
+      2. BitsetContainer: a 65536 bit integer, for dense chunks.
+      3. RunContainer: a list of runs, for chunks made of long intervals.
+
+    Example:
+        Bitmap([1, 2, 3, 100000]) has 2 chunks: chunk 0 holding [1, 2, 3] and
+        chunk 1 holding [34464].
+
+    """
+
+    __slots__ = ('_keys', '_containers')
+
+    def __init__(self, values=()):
+        """Initialize a bitmap from an iterable of non-negative integers.
+
+        _keys: The sorted chunk keys (the high bits) that hold values.
+
+        _containers: The containers for the chunks in _keys, in the same
+        order.
+
+        Args:
+            values: The integers to add to the bitmap, in any order.
+
+        """
+        self._keys = []
+        self._containers = []
+
+        chunks = {}
+        for value in values:
+            chunks.setdefault(value >> CHUNK_BITS, set()).add(value & LOW_MASK)
+
+        for key in sorted(chunks):
+            lows = chunks[key]
+            if len(lows) <= ARRAY_LIMIT:
+                container = ArrayContainer(array('H', sorted(lows)))
+            else:
+                container = _container_from_bits(_bits_from_positions(lows))
+            self._keys.append(key)
+            self._containers.append(container)
+
+    @classmethod
+    def _from_chunks(cls, keys, containers):
+        bitmap = cls.__new__(cls)
+        bitmap._keys = keys
+        bitmap._containers = containers
+        return bitmap
+
+    @classmethod
+    def from_sorted(cls, values, offset=0):
+        """Build a bitmap from a sorted sequence, without hashing every value.
+
+        Args:
+            values: A sorted sequence (list or array) of distinct integers,
+            all >= offset.
+            offset: A value subtracted from every value before it is added.
+
+        Returns:
+            A new Bitmap.
+
+        """
+        keys = []
+        containers = []
+        start = 0
+        while start < len(values):
+            key = (values[start] - offset) >> CHUNK_BITS
+            base = (key << CHUNK_BITS) + offset
+            end = bisect_left(values, base + CHUNK_SIZE, start)
+            if end - start <= ARRAY_LIMIT:
+                container = ArrayContainer(
+                        array('H', [value - base
+                                    for value in values[start:end]]))
+            else:
+                buffer = bytearray(BITSET_BYTES)
+                for value in values[start:end]:
+                    value -= base
+                    buffer[value >> 3] |= 1 << (value & 7)
+                container = _container_from_bits(
+                        int.from_bytes(buffer, 'little'))
+            keys.append(key)
+            containers.append(container)
+            start = end
+        return cls._from_chunks(keys, containers)
+
+    @classmethod
+    def range(cls, start, stop):
+        """Build a bitmap holding every integer in [start, stop).
+
+        Args:
+            start: The first value in the bitmap.
+            stop: The value after the last one in the bitmap.
+
+        Returns:
+            A bitmap made of run containers.
+
+        """
+        keys = []
+        containers = []
+        value = start
+        while value < stop:
+            key = value >> CHUNK_BITS
+            last = min(stop, (key + 1) << CHUNK_BITS) - 1
+            keys.append(key)
+            containers.append(RunContainer([(value & LOW_MASK,
+                                             last & LOW_MASK)]))
+            value = last + 1
+        return cls._from_chunks(keys, containers)
+
+    def add(self, value):
+        """Add a single value to the bitmap.
+
+        Args:
+            value: A non-negative integer.
+
+        """
+        key = value >> CHUNK_BITS
+        position = bisect_right(self._keys, key) - 1
+        single = ArrayContainer(array('H', [value & LOW_MASK]))
+        if position >= 0 and self._keys[position] == key:
+            self._containers[position] = \
+                self._containers[position].or_(single)
+        else:
+            self._keys.insert(position + 1, key)
+            self._containers.insert(position + 1, single)
+
+    def __contains__(self, value):
+        key = value >> CHUNK_BITS
+        position = bisect_right(self._keys, key) - 1
+        return (position >= 0 and self._keys[position] == key
+                and value & LOW_MASK in self._containers[position])
+
+    def __len__(self):
+        """The cardinality of the bitmap (the number of values in it)."""
+        return sum(container.cardinality for container in self._containers)
+
+    def __bool__(self):
+        return bool(self._keys)
+
+    def __iter__(self):
+        """Iterate over the values in the bitmap, in increasing order."""
+        for key, container in zip(self._keys, self._containers):
+            base = key << CHUNK_BITS
+            for low in container:
+                yield base + low
+
+    def __and__(self, other):
+        keys = []
+        containers = []
+        i = j = 0
+        while i < len(self._keys) and j < len(other._keys):
+            if self._keys[i] < other._keys[j]:
+                i += 1
+            elif self._keys[i] > other._keys[j]:
+                j += 1
+            else:
+                container = self._containers[i].and_(other._containers[j])
+                if container is not None:
+                    keys.append(self._keys[i])
+                    containers.append(container)
+                i += 1
+                j += 1
+        return Bitmap._from_chunks(keys, containers)
+
+    def __or__(self, other):
+        keys = []
+        containers = []
+        i = j = 0
+        while i < len(self._keys) or j < len(other._keys):
+            if j == len(other._keys) or (i < len(self._keys)
+                                         and self._keys[i] < other._keys[j]):
+                keys.append(self._keys[i])
+                containers.append(self._containers[i])
+                i += 1
+            elif i == len(self._keys) or self._keys[i] > other._keys[j]:
+                keys.append(other._keys[j])
+                containers.append(other._containers[j])
+                j += 1
+            else:
+                keys.append(self._keys[i])
+                containers.append(
+                        self._containers[i].or_(other._containers[j]))
+                i += 1
+                j += 1
+        return Bitmap._from_chunks(keys, containers)
+
+    def __sub__(self, other):
+        """ANDNOT: the values in this bitmap that are not in other."""
+        keys = []
+        containers = []
+        j = 0
+        for key, container in zip(self._keys, self._containers):
+            while j < len(other._keys) and other._keys[j] < key:
+                j += 1
+            if j < len(other._keys) and other._keys[j] == key:
+                container = container.andnot(other._containers[j])
+            if container is not None:
+                keys.append(key)
+                containers.append(container)
+        return Bitmap._from_chunks(keys, containers)
+
+    def flip(self, stop):
+        """NOT: the values in [0, stop) that are not in this bitmap.
+
+        Args:
+            stop: The size of the universe the complement is taken in.
+
+        Returns:
+            A new Bitmap.
+
+        """
+        return Bitmap.range(0, stop) - self
+
+    def __eq__(self, other):
+        if not isinstance(other, Bitmap):
+            return NotImplemented
+        return (self._keys == other._keys
+                and all(a.bits() == b.bits() for a, b in
+                        zip(self._containers, other._containers)))
+
+    def __repr__(self):
+        return f'Bitmap({list(self)})'
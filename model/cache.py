@@ -0,0 +1,149 @@
+from collections import OrderedDict
+import json
+import sys
+
+
+class LRUCache():
+    """A dictionary with a maximum size, that evicts the least recently used
+    entries when it is full.
+
+    It counts hits, misses and evictions, so its size can be tuned.
+
+    """
+
+    def __init__(self, maxsize, maxbytes=None, sizeof=sys.getsizeof):
+        """Initialization of the cache.
+
+        _data: The entries, from the least to the most recently used.
+
+        _sizes: The size in bytes of every entry, if maxbytes is set.
+
+        Args:
+            maxsize: The maximum number of entries. With 0, nothing is cached.
+            maxbytes: The maximum total size of the values, in bytes. Defaults
+            to no limit.
+            sizeof: The function that returns the size of a value, in bytes.
+
+        """
+        self._maxsize = maxsize
+        self._maxbytes = maxbytes
+        self._sizeof = sizeof
+        self._data = OrderedDict()
+        self._sizes = {}
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def maxsize(self):
+        return self._maxsize
+
+    @property
+    def maxbytes(self):
+        return self._maxbytes
+
+    def get(self, key, default=None):
+        """Return the value for a key, and mark it as the most recently used.
+
+        Args:
+            key: The key to look up.
+            default: What to return if the key is not in the cache.
+
+        """
+        try:
+            value = self._data[key]
+            self._data.move_to_end(key)
+        except KeyError:
+            # The key may also have been evicted by another thread in between
+            self.misses += 1
+            return default
+        self.hits += 1
+        return value
+
+    def put(self, key, value):
+        """Add an entry, evicting the least recently used ones if the cache
+        is full. A value bigger than maxbytes is not cached at all.
+
+        """
+        if self._maxsize <= 0:
+            return
+        if self._maxbytes is not None:
+            size = self._sizeof(value)
+            if size > self._maxbytes:
+                return
+            self.bytes += size - self._sizes.get(key, 0)
+            self._sizes[key] = size
+        self._data[key] = value
+        self._data.move_to_end(key)
+        while (len(self._data) > self._maxsize
+                or self._maxbytes is not None and self.bytes > self._maxbytes):
+            old_key, _ = self._data.popitem(last=False)
+            self.bytes -= self._sizes.pop(old_key, 0)
+            self.evictions += 1
+
+    def clear(self):
+        self._data.clear()
+        self._sizes.clear()
+        self.bytes = 0
+
+    def items(self):
+        """Return the entries, from the most to the least recently used."""
+        return list(reversed(self._data.items()))
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self):
+        """Return the counters of the cache.
+
+        Returns:
+            A dictionary with the size, maxsize, bytes, maxbytes, hits,
+            misses, evictions and hit rate of the cache.
+
+        """
+        lookups = self.hits + self.misses
+        return {
+            'size': len(self._data),
+            'maxsize': self._maxsize,
+            'bytes': self.bytes,
+            'maxbytes': self._maxbytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+        }
+
+    def save(self, file_name, limit=None):
+        """Save the most recently used entries to a JSON file, so the cache
+        can be warmed up later with load. Keys and values must be strings.
+
+        Args:
+            file_name: The file to save the entries to.
+            limit: How many entries to save. Defaults to all of them.
+
+        """
+        entries = self.items()[:limit]
+        with open(file_name, 'w') as file:
+            json.dump(entries, file)
+
+    def load(self, file_name):
+        """Add the entries saved by save to the cache.
+
+        Args:
+            file_name: The file the entries were saved to.
+
+        Raises:
+            FileNotFoundError: If the file does not exist.
+            ValueError: If the file has wrong format.
+
+        """
+        with open(file_name) as file:
+            entries = json.load(file)
+        # The entries were saved from the most recently used, put them back
+        # so that order is kept
+        for key, value in reversed(entries):
+            self.put(key, value)
@@ -0,0 +1,108 @@
+from fnmatch import fnmatch
+import os
+
+
+# How many bytes at the start of a file are looked at to tell if it is binary
+SNIFF_BYTES = 8192
+
+
+def is_binary(file, size=SNIFF_BYTES):
+    """Whether a file looks binary, that is has a NUL byte in its first size
+    bytes (text files, in any of the usual encodings but UTF-16/32, never
+    do). The file is rewound to where it was.
+
+    Args:
+        file: A file opened in binary mode.
+        size: How many bytes to look at.
+
+    """
+    position = file.tell()
+    start = file.read(size)
+    file.seek(position)
+    return b'\0' in start
+
+
+def _matches(patterns, name, relative):
+    """Whether a file or directory matches any of the glob patterns. A
+    pattern with a '/' is matched against the path relative to the root,
+    any other against the name only.
+
+    """
+    return any(fnmatch(relative if '/' in pattern else name, pattern)
+               for pattern in patterns)
+
+
+def walk_files(root, include=None, exclude=None, follow_symlinks=False,
+               onerror=None):
+    """Yield the paths of the files under a directory, at any depth, as they
+    are found.
+
+    The directories are listed with os.scandir, whose entries already know
+    if they are files or directories, so no file is stat'ed. The files of a
+    directory are yielded in sorted order, before the files of its
+    subdirectories, so the order doesn't depend on the file system.
+
+    Args:
+        root: The directory to walk.
+        include: Glob patterns (e.g. '*.txt', or 'docs/*.md' for a path
+        relative to root); if given, only the files that match one of them
+        are yielded.
+        exclude: Glob patterns of files and directories to leave out. An
+        excluded directory is not walked at all.
+        follow_symlinks: Whether to follow symbolic links to files and
+        directories. If False, they are left out. If True, every directory
+        is only walked once, so links that loop are harmless.
+        onerror: A function called with the OSError raised when a directory
+        can't be listed. By default the directory is silently skipped.
+
+    Yields:
+        The paths of the files, starting with root.
+
+    """
+    include = [include] if isinstance(include, str) else include or []
+    exclude = [exclude] if isinstance(exclude, str) else exclude or []
+    visited = set()
+    # The directories to walk, with their paths relative to root
+    stack = [(root, '')]
+    while stack:
+        directory, relative = stack.pop()
+        if follow_symlinks:
+            try:
+                stat = os.stat(directory)
+            except OSError as e:
+                if onerror is not None:
+                    onerror(e)
+                continue
+            if (stat.st_dev, stat.st_ino) in visited:
+                continue
+            visited.add((stat.st_dev, stat.st_ino))
+
+        files = []
+        directories = []
+        try:
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    try:
+                        if not follow_symlinks and entry.is_symlink():
+                            continue
+                        path = f'{relative}{entry.name}'
+                        if _matches(exclude, entry.name, path):
+                            continue
+                        if entry.is_dir(follow_symlinks=follow_symlinks):
+                            directories.append((entry.path, f'{path}/'))
+                        elif (entry.is_file(follow_symlinks=follow_symlinks)
+                              and (not include or _matches(
+                                  include, entry.name, path))):
+                            files.append(entry.path)
+                    except OSError:
+                        # e.g. a broken link, or the entry was removed
+                        continue
+        except OSError as e:
+            if onerror is not None:
+                onerror(e)
+            continue
+
+        yield from sorted(files)
+        # The stack is last in, first out, so the first directory in sorted
+        # order is walked first
+        stack.extend(sorted(directories, reverse=True))
@@ -0,0 +1,443 @@
+from array import array
+from collections.abc import MutableMapping, Sequence
+
+
+# How many file names are front coded together. A name is found by decoding
+# at most this many names.
+BLOCK_SIZE = 16
+
+# The size of the hashes of the files (see new_digest in model/tokenizer.py).
+# Every file has a slot of this size for its hash, all zeros if it is not
+# known.
+DIGEST_SIZE = 16
+_NO_DIGEST = bytes(DIGEST_SIZE)
+
+# The file names are encoded with surrogatepass, so any Python string (e.g.
+# a name decoded from the file system with surrogateescape) round trips
+_ENCODING = 'utf-8'
+_ERRORS = 'surrogatepass'
+
+
+def _shared_prefix(first, second):
+    """Return the length of the common prefix of 2 strings.
+
+    It is binary searched, comparing slices of the strings, so no character
+    is compared in Python.
+
+    """
+    low = 0
+    high = min(len(first), len(second))
+    if first[:high] == second[:high]:
+        return high
+    # The common prefix is at least low and less than high characters long
+    while high - low > 1:
+        middle = (low + high) // 2
+        if first[low:middle] == second[low:middle]:
+            low = middle
+        else:
+            high = middle
+    return low if first[low] != second[low] else high
+
+
+def _encode_block(names):
+    """Front code a list of file names: every name is written as the number
+    of characters it shares with the previous name, then the length in bytes
+    and the bytes of the rest of it, both lengths as varints.
+
+    """
+    data = bytearray()
+    previous = ''
+    for name in names:
+        shared = _shared_prefix(previous, name)
+        suffix = name[shared:].encode(_ENCODING, _ERRORS)
+        _write_varint(data, shared)
+        _write_varint(data, len(suffix))
+        data += suffix
+        previous = name
+    return bytes(data)
+
+
+def _write_varint(data, value):
+    """Append a varint (7 bits per byte, see encode_postings in
+    model/storage.py) to a bytearray.
+
+    """
+    while value >= 0x80:
+        data.append(value & 0x7f | 0x80)
+        value >>= 7
+    data.append(value)
+
+
+def _read_varint(data, position):
+    """Return the varint at a position in data, and the position after it."""
+    byte = data[position]
+    if byte < 0x80:
+        return byte, position + 1
+    value = 0
+    shift = 0
+    while True:
+        byte = data[position]
+        position += 1
+        value |= (byte & 0x7f) << shift
+        if not byte & 0x80:
+            return value, position
+        shift += 7
+
+
+def _decode_block(data):
+    """Decode the file names front coded by _encode_block."""
+    names = []
+    previous = ''
+    position = 0
+    while position < len(data):
+        shared, position = _read_varint(data, position)
+        length, position = _read_varint(data, position)
+        end = position + length
+        previous = previous[:shared] + data[position:end].decode(_ENCODING,
+                                                                 _ERRORS)
+        names.append(previous)
+        position = end
+    return names
+
+
+class DocumentTable(Sequence):
+    """The names of the files in an index, in order, and what is known about
+    them (size, modification time and hash), kept compact.
+
+    It is a sequence of the file names, like the list it replaces (the file
+    with number n, starting from 1, is table[n - 1]), but:
+      - finding the number of a name takes O(1), through a dictionary of the
+      hashes of the names, instead of a scan of the list;
+      - the names are front coded in blocks of BLOCK_SIZE, so the long
+      directory prefixes files share are only kept once per block;
+      - the sizes and modification times are kept in arrays of integers, and
+      the hashes in a single bytearray, in slots of DIGEST_SIZE bytes.
+
+    """
+
+    def __init__(self, names=()):
+        """Initialization of the table.
+
+        _data: The front coded blocks of BLOCK_SIZE names, one after the
+        other.
+
+        _offsets: An array of where every block starts in _data.
+
+        _tail: The names after the last full block, not encoded yet.
+
+        _numbers: A dictionary of the hashes of the names to the number of
+        the file, or to a list of numbers for the (rare) hashes shared by
+        many names. The name of the file is compared, so collisions are
+        harmless. It is None until a name is first looked up, so a table
+        that is only read by number (e.g. loaded to answer queries) never
+        builds it.
+
+        _sizes, _mtimes: The size and modification time of every file, in
+        order. A size of -1 means the stats are not known.
+
+        _digests: The hashes of the files, in order, DIGEST_SIZE bytes per
+        file. A hash of all zeros means it is not known.
+
+        _cached: The number and the names of the block decoded last, so
+        reading the names in order decodes every block once.
+
+        _read_stats: A function returning the _sizes, _mtimes and _digests
+        of the files, called the first time they are needed (see
+        set_stats_source), or None once they are read.
+
+        Args:
+            names: The file names to start with.
+
+        """
+        self._data = bytearray()
+        self._offsets = array('Q')
+        self._tail = []
+        self._numbers = None
+        self._sizes = array('q')
+        self._mtimes = array('q')
+        self._digests = bytearray()
+        self._cached = (None, None)
+        self._read_stats = None
+        for name in names:
+            self.append(name)
+
+    @classmethod
+    def from_blocks(cls, data, offsets, size, read_stats=None):
+        """Create a table from the blocks written by blocks, without
+        decoding them (but the last one, if it is not full).
+
+        Args:
+            data: The front coded blocks.
+            offsets: An array of where every block starts in data.
+            size: The number of names.
+            read_stats: A function returning the stats of the files, see
+            set_stats_source. By default the stats are not known.
+
+        Returns:
+            A new DocumentTable.
+
+        """
+        table = cls()
+        full = size // BLOCK_SIZE
+        end = offsets[full] if full < len(offsets) else len(data)
+        table._data = bytearray(data[:end])
+        table._offsets = offsets[:full]
+        if size > full * BLOCK_SIZE:
+            table._tail = _decode_block(data[end:])
+        if read_stats is None:
+            table.clear_stats()
+        else:
+            table.set_stats_source(read_stats)
+        return table
+
+    def blocks(self):
+        """Return the front coded names, as a (data, offsets) tuple: the
+        blocks one after the other, the last one possibly not full, and an
+        array of where every block starts. See from_blocks.
+
+        """
+        if not self._tail:
+            return bytes(self._data), array('Q', self._offsets)
+        return (bytes(self._data) + _encode_block(self._tail),
+                self._offsets + array('Q', [len(self._data)]))
+
+    def __len__(self):
+        return len(self._offsets) * BLOCK_SIZE + len(self._tail)
+
+    def _encoded(self, block):
+        """Return the bytes of a full block, given its number."""
+        start = self._offsets[block]
+        if block + 1 < len(self._offsets):
+            return self._data[start:self._offsets[block + 1]]
+        return self._data[start:]
+
+    def _block(self, block):
+        """Return the names of a block, given its number."""
+        if block == len(self._offsets):
+            return self._tail
+        cached_block, names = self._cached
+        if cached_block != block:
+            names = _decode_block(self._encoded(block))
+            self._cached = (block, names)
+        return names
+
+    def __getitem__(self, position):
+        if isinstance(position, slice):
+            return [self[number]
+                    for number in range(*position.indices(len(self)))]
+        if position < 0:
+            position += len(self)
+        if not 0 <= position < len(self):
+            raise IndexError('[Error] File number out of range!')
+        block, offset = divmod(position, BLOCK_SIZE)
+        return self._block(block)[offset]
+
+    def __iter__(self):
+        for block in range(len(self._offsets)):
+            yield from _decode_block(self._encoded(block))
+        yield from list(self._tail)
+
+    def __contains__(self, name):
+        return self.number(name) is not None
+
+    def __eq__(self, other):
+        if isinstance(other, (DocumentTable, list, tuple)):
+            return len(self) == len(other) and all(
+                    name == other_name for name, other_name
+                    in zip(self, other))
+        return NotImplemented
+
+    def __repr__(self):
+        return f'DocumentTable({list(self)!r})'
+
+    def __getstate__(self):
+        # The hashes of strings change from one process to another, so the
+        # dictionary of the names is built again when the table is unpickled
+        self._load_stats()
+        state = self.__dict__.copy()
+        state['_numbers'] = None
+        state['_cached'] = (None, None)
+        return state
+
+    def _build_numbers(self):
+        """Build the dictionary of the hashes of the names, see __init__."""
+        self._numbers = {}
+        for number, name in enumerate(self, 1):
+            self._add_number(name, number)
+
+    def _add_number(self, name, number):
+        key = hash(name)
+        found = self._numbers.get(key)
+        if found is None:
+            self._numbers[key] = number
+        elif isinstance(found, list):
+            found.append(number)
+        else:
+            self._numbers[key] = [found, number]
+
+    def number(self, name):
+        """Return the number of a file (starting from 1), or None if it is
+        not in the table.
+
+        """
+        if self._numbers is None:
+            self._build_numbers()
+        found = self._numbers.get(hash(name))
+        if found is None:
+            return None
+        for number in found if isinstance(found, list) else (found,):
+            if self[number - 1] == name:
+                return number
+        return None
+
+    def names(self, numbers):
+        """Return the names of the files with the given numbers (starting
+        from 1). Every block is decoded once for sorted numbers.
+
+        """
+        names = []
+        for number in numbers:
+            block, offset = divmod(number - 1, BLOCK_SIZE)
+            names.append(self._block(block)[offset])
+        return names
+
+    def set_stats_source(self, read):
+        """Read the stats of all the files only when they are first needed.
+
+        Args:
+            read: A function returning the sizes and the modification times
+            of all the files, as arrays of 'q', and their hashes, as a
+            bytearray of DIGEST_SIZE bytes per file (see __init__).
+
+        """
+        self._read_stats = read
+
+    def _load_stats(self):
+        if self._read_stats is not None:
+            read, self._read_stats = self._read_stats, None
+            self._sizes, self._mtimes, self._digests = read()
+
+    def clear_stats(self):
+        """Forget the stats of all the files."""
+        size = len(self)
+        self._read_stats = None
+        self._sizes = array('q', [-1]) * size
+        self._mtimes = array('q', [0]) * size
+        self._digests = bytearray(DIGEST_SIZE * size)
+
+    def stats_arrays(self):
+        """Return the sizes, modification times and hashes of all the
+        files, in the form set_stats_source takes them.
+
+        """
+        self._load_stats()
+        return self._sizes, self._mtimes, self._digests
+
+    def append(self, name, stats=None):
+        """Add a file at the end of the table.
+
+        Args:
+            name: The name of the file. It must not be in the table yet.
+            stats: The (size, mtime, digest) of the file, or None if they
+            are not known.
+
+        """
+        self._load_stats()
+        self._tail.append(name)
+        if self._numbers is not None:
+            self._add_number(name, len(self))
+        if len(self._tail) == BLOCK_SIZE:
+            self._offsets.append(len(self._data))
+            self._data += _encode_block(self._tail)
+            self._tail = []
+        self._sizes.append(-1)
+        self._mtimes.append(0)
+        self._digests += _NO_DIGEST
+        if stats is not None:
+            self.set_stats(len(self), stats)
+
+    def stats(self, number):
+        """Return the (size, mtime, digest) of a file, given its number, or
+        None if they are not known.
+
+        """
+        self._load_stats()
+        size = self._sizes[number - 1]
+        if size < 0:
+            return None
+        start = (number - 1) * DIGEST_SIZE
+        digest = self._digests[start:start + DIGEST_SIZE]
+        if digest == _NO_DIGEST:
+            return size, self._mtimes[number - 1]
+        return size, self._mtimes[number - 1], digest.hex()
+
+    def set_stats(self, number, stats):
+        """Set the (size, mtime, digest) of a file, given its number, or
+        forget them with None. The digest can be left out.
+
+        Raises:
+            ValueError: If the digest is not DIGEST_SIZE bytes long.
+
+        """
+        self._load_stats()
+        digest = _NO_DIGEST
+        if stats is not None and len(stats) > 2:
+            digest = bytes.fromhex(stats[2])
+            if len(digest) != DIGEST_SIZE:
+                raise ValueError(f'[Error] A file hash must be {DIGEST_SIZE} '
+                                 f'bytes long!')
+        start = (number - 1) * DIGEST_SIZE
+        self._digests[start:start + DIGEST_SIZE] = digest
+        if stats is None:
+            self._sizes[number - 1] = -1
+            return
+        self._sizes[number - 1] = stats[0]
+        self._mtimes[number - 1] = stats[1]
+
+    @property
+    def file_stats(self):
+        """A dictionary-like view of the names of the files to their
+        stats, for the files whose stats are known.
+
+        """
+        return FileStats(self)
+
+
+class FileStats(MutableMapping):
+    """The stats of the files of a DocumentTable, by file name, see
+    DocumentTable.file_stats. Only the files in the table can have stats.
+
+    """
+
+    def __init__(self, table):
+        self._table = table
+
+    def _number(self, name):
+        number = self._table.number(name)
+        if number is None:
+            raise KeyError(name)
+        return number
+
+    def __getitem__(self, name):
+        stats = self._table.stats(self._number(name))
+        if stats is None:
+            raise KeyError(name)
+        return stats
+
+    def __setitem__(self, name, stats):
+        self._table.set_stats(self._number(name), stats)
+
+    def __delitem__(self, name):
+        number = self._number(name)
+        if self._table.stats(number) is None:
+            raise KeyError(name)
+        self._table.set_stats(number, None)
+
+    def __iter__(self):
+        sizes = self._table.stats_arrays()[0]
+        for number, name in enumerate(self._table, 1):
+            if sizes[number - 1] >= 0:
+                yield name
+
+    def __len__(self):
+        return sum(size >= 0 for size in self._table.stats_arrays()[0])
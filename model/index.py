@@ -1,27 +1,70 @@
+from model.analyzer import Analyzer
+from model.cache import LRUCache
+from model.directory import walk_files, is_binary
+from model.documents import DocumentTable
 from model.list import IndexList
+from model.metrics import Metrics, NULL_METRICS, MeteredReader
+from model.positional import Pattern, match
+from model.postings import union
+from model.query import CompiledQuery, MODES, Term, Near, Wildcard
+from model.ranking import (BM25, TermCursor, scoring_words, is_disjunction,
+                           top_k_wand, top_k_max_score)
+from model.storage import (IndexFile, LazyPostings, write_index,
+                           encode_postings, encode_array)
+from model.terms import TermDictionary
+from model.tokenizer import unique_words, file_digest, new_digest
 from config import Config
 
-from collections import defaultdict
-from nltk.stem.snowball import EnglishStemmer
-from os import path
-import re
+from array import array
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
+from functools import partial
+import os
+import sys
+import time
+import warnings
+
+
+# How many files add_directory sends to a worker process at once
+DIRECTORY_BATCH_SIZE = 64
+
+# The posting lists and frequencies shorter than this are kept as lists by
+# Index.freeze: an array has a bigger fixed cost than a list, which only
+# pays off for longer lists
+ARRAY_MIN_LENGTH = 8
+
+# The Analyzer of a worker process of add_files and add_directory, set once
+# by _init_worker when the process starts, so it isn't sent with every batch
+# of files
+_worker_analyzer = None
+
+# The typecodes of the arrays of unsigned integers, from the smallest, with
+# the first value too big for them
+_TYPECODES = [(typecode, 1 << 8 * array(typecode).itemsize)
+              for typecode in 'BHIQ']
 
 
 class Index():
     """This class is meant to hold information about the index.
 
     The way we hold an index is through these 2 fields:
-      1. files: A list keeping the names of the files scanned so far.
+      1. files: A DocumentTable keeping the names of the files scanned so
+      far, in order (see model/documents.py).
       2. index: A dictionary that holds words as keys, and the files' number
       they appear in as values. The values are lists of integers representing
       the files a word appears in.
 
     """
 
-    def __init__(self):
+    def __init__(self, query_cache_size=1000, query_cache_bytes=32 << 20,
+                 metrics=None, positions=False, max_expansions=1000):
         """Initialization of the index.
 
-        _files: Initialize the files to an empty list.
+        _documents: A DocumentTable with the names of the files, in order,
+        and, for every file, the size, modification time and hash of the file
+        when it was scanned, so sync can tell which files changed since. The
+        _files and _file_stats properties give the names and the stats.
 
         _index: The index has a structure like this:
             {
@@ -29,26 +72,151 @@ class Index():
                 'kernel': [1],
                 'c': [2, 3],
             }
-        where 'from', 'kernel' and 'c' are words from the documents.
+        where 'from', 'kernel' and 'c' are words from the documents. It is
+        a plain dictionary, so looking up a word that is not in the index
+        (e.g. a typo in a query) never adds it. After freeze, the long
+        posting lists are arrays.
 
-        _regex: A regex expression to match words only, since that is what
-        we're interested in.
+        _frequencies: A dictionary holding, for every word, how many times it
+        appears in each file of its posting list, in the same order. The
+        frequencies of a word are only used if they have the same length as
+        its posting list (e.g. not for an index saved without them).
+
+        _lengths: The number of words in every file, in the order of _files,
+        or 0 if it is not known. For a loaded index, it is only read from the
+        file the first time it is needed, by the _read_lengths function.
+
+        _positions: If the index keeps positions, a dictionary holding, for
+        every word, its positions in each file of its posting list, in the
+        same order. The positions in a file are encoded as deltas, like the
+        postings in a saved index (see encode_postings in model/storage.py),
+        and only decoded by phrase and NEAR queries. As for _frequencies,
+        they are only used if they are aligned with the posting list.
+
+        _term_dictionary: A TermDictionary of the terms in _index, built the
+        first time a wildcard query is run, to find the terms a wildcard
+        matches. New terms are added to it as files are added, and it is
+        built again when files are removed or _index is replaced.
 
         _config: A Config instance through which the Index receives certain
         configs from the external file 'config.json'.
         For more see config/config.py.
 
+        _analyzer: An Analyzer built from the config, which turns the words
+        of files and queries into the terms kept in the index.
+        For more see model/analyzer.py.
+
+        _generation: A counter increased every time files are added to or
+        removed from the index.
+
+        _result_cache, _subquery_cache: LRUCaches for the results of queries
+        and of the && and || clauses in them, keyed by their canonical syntax
+        tree (see canonical in model/query.py). They are cleared when the
+        generation of the index changes.
+
+        _bm25, _max_frequencies: The BM25 scoring function for the files of
+        the index, and the highest frequency of every word, kept for ranked
+        queries until the generation of the index changes.
+
+        Args:
+            query_cache_size: How many query results (and as many subquery
+            results) to cache. With 0, nothing is cached.
+            query_cache_bytes: The maximum memory used by each of the 2 query
+            caches, in bytes.
+            metrics: A Metrics to record the time spent in every step of
+            indexing and querying to. Defaults to no instrumentation, see the
+            metrics property.
+            positions: Whether to keep the positions of the words in the
+            files, so phrase ("...") and NEAR queries can be answered. It
+            takes more memory and makes scanning files slower.
+            max_expansions: How many terms a wildcard of a query can match.
+            A query with a wildcard that matches more is refused.
+
         Raises:
             ValueError: If the config.json has wrong format.
 
         """
-        self._files = []
-        self._index = defaultdict(list)
-        self._regex = re.compile(r'\w+')
+        self._documents = DocumentTable()
+        self._index = {}
+        self._frequencies = {}
+        self._read_lengths = None
+        self._lengths = []
+        self._store_positions = positions
+        self._positions = {}
+        self._max_expansions = max_expansions
+        self._term_dictionary = None
+        self._term_source = None
         try:
             self._config = Config()
         except ValueError as e:
             raise ValueError(e)
+        self._analyzer = Analyzer(self._config)
+
+        self._generation = 0
+        self._cache_generation = 0
+        self._invalidations = 0
+        self._result_cache = LRUCache(query_cache_size, query_cache_bytes)
+        self._subquery_cache = LRUCache(query_cache_size, query_cache_bytes,
+                                        sizeof=_subquery_size)
+        self._bm25 = None
+        self._max_frequencies = {}
+        self.metrics = metrics
+
+    @property
+    def _files(self):
+        """The DocumentTable of the files, a sequence of their names. It can
+        be set to any sequence of names.
+
+        """
+        return self._documents
+
+    @_files.setter
+    def _files(self, names):
+        self._documents = DocumentTable(names)
+
+    @property
+    def _file_stats(self):
+        """A dictionary-like view of the names of the files to their (size,
+        mtime, digest), see DocumentTable.file_stats. It can be set to a
+        dictionary, the stats of the files not in the index are ignored.
+
+        """
+        return self._documents.file_stats
+
+    @_file_stats.setter
+    def _file_stats(self, file_stats):
+        # The stats are set by number, in the order of the files
+        self._documents.clear_stats()
+        for number, file_name in enumerate(self._documents, 1):
+            stats = file_stats.get(file_name)
+            if stats is not None:
+                self._documents.set_stats(number, stats)
+
+    @property
+    def _lengths(self):
+        if self._read_lengths is not None:
+            read, self._read_lengths = self._read_lengths, None
+            self._file_lengths = read()
+        return self._file_lengths
+
+    @_lengths.setter
+    def _lengths(self, lengths):
+        self._read_lengths = None
+        self._file_lengths = lengths
+
+    @property
+    def metrics(self):
+        """The Metrics the index records its timings and counters to, or a
+        NullMetrics that records nothing if instrumentation is disabled.
+        Setting it to a Metrics enables instrumentation, and setting it to
+        None disables it. For more see model/metrics.py.
+
+        """
+        return self._metrics
+
+    @metrics.setter
+    def metrics(self, metrics):
+        self._metrics = NULL_METRICS if metrics is None else metrics
 
     def add_file(self, file_name):
         """Scan a file and add the words to the index.
@@ -66,56 +234,668 @@ class Index():
             IsADirectoryError: If a directory was passed.
             PermissionError: If the user running the script doesn't have
                 permission on a file.
+            ValueError: If the file is not valid text (e.g. it is not
+                UTF-8).
+            OSError: If the file can't be read for another reason.
+
+        """
+        with self._metrics.timer('index.add_file'):
+            self._check_file_name(file_name)
+            scanned = _scan_file(file_name, self._analyzer, self._metrics,
+                                 self._store_positions)
+            return self._add_words(file_name, *scanned)
+
+    def add_files(self, file_names, workers=None):
+        """Scan many files and add their words to the index.
+
+        The files are read and their words are extracted, cleaned of stop
+        words and stemmed in a pool of worker processes. The words are then
+        added to the index in this process, in the order of file_names, so the
+        files get the same numbers they would get by calling add_file for
+        each one of them.
+
+        Args:
+            file_names: The files to be scanned.
+            workers: The number of worker processes. Defaults to the number
+            of CPUs. With 1 worker, the files are scanned in this process.
+
+        Returns:
+            A list with a result for every file name, in order: the success
+            string if the file was added to the index, or otherwise the
+            exception add_file would have raised for it (see add_file).
+
+        """
+        file_names = list(file_names)
+        results = [None] * len(file_names)
+
+        # Check the file names first, so the workers only get files that will
+        # be added to the index
+        to_scan = []
+        seen = set()
+        for position, file_name in enumerate(file_names):
+            try:
+                self._check_file_name(file_name, seen)
+            except (ValueError, IndexError) as e:
+                results[position] = e
+            else:
+                seen.add(file_name)
+                to_scan.append(position)
+
+        if workers is None:
+            workers = os.cpu_count() or 1
+        scan = partial(_scan_file_or_error,
+                       instrument=self._metrics.enabled,
+                       positions=self._store_positions)
+        names = [file_names[position] for position in to_scan]
+
+        if workers <= 1 or len(names) <= 1:
+            scanned = map(partial(scan, analyzer=self._analyzer), names)
+            for position, (scanned_file, error, metrics) in zip(
+                    to_scan, scanned):
+                self._metrics.merge(metrics)
+                results[position] = error or self._add_words(
+                        file_names[position], *scanned_file)
+        else:
+            chunksize = max(1, min(64, len(names) // (workers * 4)))
+            with self._executor(workers) as executor:
+                scanned = executor.map(scan, names, chunksize=chunksize)
+                for position, (scanned_file, error, metrics) in zip(
+                        to_scan, scanned):
+                    # The timings of the worker process are added to ours
+                    self._metrics.merge(metrics)
+                    results[position] = error or self._add_words(
+                            file_names[position], *scanned_file)
+
+        return results
+
+    def _executor(self, workers):
+        """Return a pool of worker processes to scan files, that get the
+        Analyzer of the index once, when they start, instead of with every
+        batch of files (its stem cache can be big).
+
+        """
+        return ProcessPoolExecutor(max_workers=workers,
+                                   initializer=_init_worker,
+                                   initargs=(self._analyzer,))
+
+    def add_directory(self, root, include=None, exclude=None,
+                      follow_symlinks=False, workers=None, progress=None):
+        """Scan all the files under a directory, at any depth, and add their
+        words to the index.
+
+        The paths are streamed from the walk of the directory (see
+        walk_files in model/directory.py) to the worker processes in
+        batches, so the scanning starts right away and the list of all the
+        files is never built. As in add_files, the files are added in the
+        order they are found, whatever the number of workers.
+
+        Files that are already in the index, and files that look binary
+        (they have a NUL byte in their first bytes), are skipped.
+
+        Args:
+            root: The directory to scan.
+            include: Glob patterns of the files to scan, see walk_files.
+            exclude: Glob patterns of the files and directories to leave
+            out, see walk_files.
+            follow_symlinks: Whether to follow symbolic links, see
+            walk_files.
+            workers: The number of worker processes. Defaults to the number
+            of CPUs. With 1 worker, the files are scanned in this process.
+            progress: A function called with the report below after every
+            batch of files, and once at the end.
+
+        Returns:
+            A dictionary with the number of files 'added', 'skipped' and
+            'binary' (skipped because they look binary), the 'bytes' of the
+            files added, the 'errors' (exceptions, as in add_files, e.g. for
+            the files that are not valid text, and the OSErrors of the
+            directories that couldn't be listed), the
+            'seconds' it took and the 'files_per_second' added.
+
+        Raises:
+            FileNotFoundError: If the directory does not exist.
+            NotADirectoryError: If root is not a directory.
+
+        """
+        if not os.path.exists(root):
+            raise FileNotFoundError(
+                    f'[Error] The directory "{root}" does not exist!')
+        if not os.path.isdir(root):
+            raise NotADirectoryError(f'[Error] "{root}" is not a directory!')
+
+        report = {'added': 0, 'skipped': 0, 'binary': 0, 'bytes': 0,
+                  'errors': [], 'seconds': 0.0, 'files_per_second': 0.0}
+        start = time.perf_counter()
+
+        def new_files():
+            seen = set()
+            for file_name in walk_files(root, include, exclude,
+                                        follow_symlinks,
+                                        report['errors'].append):
+                if file_name in seen or file_name in self._documents:
+                    report['skipped'] += 1
+                else:
+                    seen.add(file_name)
+                    yield file_name
+
+        def update_report():
+            report['seconds'] = time.perf_counter() - start
+            if report['seconds'] > 0:
+                report['files_per_second'] = (report['added']
+                                              / report['seconds'])
+            if progress is not None:
+                progress(report)
+
+        if workers is None:
+            workers = os.cpu_count() or 1
+        scan = partial(_scan_files_or_errors,
+                       instrument=self._metrics.enabled,
+                       positions=self._store_positions, skip_binary=True)
+        batches = _batches(new_files(), DIRECTORY_BATCH_SIZE)
+
+        # With 1 worker there is no executor, the files are scanned here
+        with self._executor(workers) if workers > 1 \
+                else nullcontext() as executor:
+            if executor is None:
+                scanned = ((batch, scan(batch, analyzer=self._analyzer))
+                           for batch in batches)
+            else:
+                scanned = _bounded_map(executor, scan, batches, workers * 2)
+            for batch, results in scanned:
+                for file_name, (scanned_file, error, metrics) in zip(
+                        batch, results):
+                    self._metrics.merge(metrics)
+                    if error is not None:
+                        report['errors'].append(error)
+                    elif scanned_file is None:
+                        report['binary'] += 1
+                        report['skipped'] += 1
+                    else:
+                        self._add_words(file_name, *scanned_file)
+                        report['added'] += 1
+                        stats = scanned_file[1]
+                        if stats is not None:
+                            report['bytes'] += stats[0]
+                update_report()
+
+        update_report()
+        return report
+
+    def sync(self, file_names, use_hash=False, workers=None):
+        """Bring the index up to date with a list of files, scanning only the
+        files that changed.
+
+        Every file is compared to what the index remembers about it:
+          - files that are not in the index yet are added;
+          - files whose size or modification time changed are scanned again
+            (with use_hash, a file whose content hash didn't change is
+            skipped anyway, e.g. if it was only touched);
+          - files of the index that are not in file_names anymore, or that
+            don't exist anymore, are removed from the index;
+          - all the other files are skipped.
+
+        Removing files renumbers the files after them, and files that are
+        scanned again go to the end of the index. A file that changed but
+        can't be scanned anymore is removed and reported in the errors.
+
+        Args:
+            file_names: All the files that should be in the index.
+            use_hash: Whether to compare the content hash of files whose
+            size or modification time changed.
+            workers: The number of worker processes used to scan files, see
+            add_files.
+
+        Returns:
+            A dictionary with the number of files 'added', 'updated',
+            'removed' and 'skipped', and the 'errors' (exceptions, as in
+            add_files) for the files that couldn't be scanned.
+
+        """
+        file_names = list(dict.fromkeys(file_names))
+        wanted = set(file_names)
+
+        to_remove = [name for name in self._documents if name not in wanted]
+        to_update = []
+        to_add = []
+        skipped = 0
+        for file_name in file_names:
+            number = self._documents.number(file_name)
+            if number is None:
+                to_add.append(file_name)
+                continue
+            stats = self._documents.stats(number)
+            current = _file_stats(file_name)
+            if current is None:
+                to_remove.append(file_name)
+            elif stats is not None and stats[:2] == current:
+                skipped += 1
+            elif (use_hash and stats is not None
+                    and stats[2] == _digest_or_none(file_name)):
+                self._documents.set_stats(number, current + stats[2:])
+                skipped += 1
+            else:
+                to_update.append(file_name)
+
+        self._remove_files(to_remove + to_update)
+        results = self.add_files(to_update + to_add, workers)
+        updated = results[:len(to_update)]
+        added = results[len(to_update):]
+
+        return {
+            'added': sum(isinstance(result, str) for result in added),
+            'updated': sum(isinstance(result, str) for result in updated),
+            'removed': len(to_remove),
+            'skipped': skipped,
+            'errors': [result for result in results
+                       if isinstance(result, Exception)],
+        }
+
+    def _remove_files(self, file_names):
+        """Remove files and their postings from the index.
+
+        The files are first marked as removed (tombstoned), then every
+        posting list is purged of them and renumbered in a single pass, so
+        the remaining files keep their order.
+
+        Args:
+            file_names: The names of the files to remove.
+
+        """
+        removed = {self._documents.number(name) for name in set(file_names)}
+        removed.discard(None)
+        if not removed:
+            return
+        self._generation += 1
+
+        # The new number of every file, or 0 if the file was removed
+        numbers = [0] * (len(self._documents) + 1)
+        documents = DocumentTable()
+        lengths = []
+        for number, file_name in enumerate(self._documents, 1):
+            if number not in removed:
+                documents.append(file_name, self._documents.stats(number))
+                lengths.append(self._file_length(number))
+                numbers[number] = len(documents)
+        self._documents = documents
+        self._lengths = lengths
+        self._term_dictionary = None
+
+        for word in list(self._index):
+            old_postings = self._index[word]
+            postings = [numbers[number] for number in old_postings
+                        if numbers[number]]
+            if postings:
+                self._index[word] = postings
+            else:
+                del self._index[word]
+            # The frequencies and positions are purged the same way
+            for values in (self._frequencies, self._positions):
+                old_values = values.pop(word, None)
+                if (postings and old_values is not None
+                        and len(old_values) == len(old_postings)):
+                    values[word] = [value for number, value
+                                    in zip(old_postings, old_values)
+                                    if numbers[number]]
+
+    def stem_cache_stats(self):
+        """Return the counters of the stemming cache (size, hits, misses,
+        evictions and hit rate), or None if stemming is not used. The cache
+        size can be set with 'stem_cache_size' in config.json.
+
+        Files scanned in worker processes by add_files use their own copy of
+        the cache, which is not counted here.
+
+        """
+        cache = self._analyzer.stem_cache
+        return cache.stats() if cache is not None else None
+
+    def needs_reindex(self):
+        """Whether the index has to be built again to follow the config.
+
+        The analysis settings are read from the Config once, when the index
+        is created. If the Config was reloaded since (see Config.reload and
+        ConfigWatcher) with other stop words or stemming settings, the terms
+        in the index don't match the ones the new settings would give.
+
+        Returns:
+            True if the index was built with other analysis settings than
+            the current ones of the Config.
+
+        """
+        return (self._analyzer.settings
+                != self._config.snapshot.analyzer_settings())
+
+    def query_cache_stats(self):
+        """Return the counters of the query caches.
+
+        Returns:
+            A dictionary with the stats of the 'results' and 'subqueries'
+            caches (see LRUCache.stats), the 'generation' of the index and
+            the number of times the caches were cleared because the index
+            changed ('invalidations').
+
+        """
+        return {
+            'results': self._result_cache.stats(),
+            'subqueries': self._subquery_cache.stats(),
+            'generation': self._generation,
+            'invalidations': self._invalidations,
+        }
+
+    def _check_query_caches(self):
+        """Clear the query caches if the index changed since they were
+        filled.
+
+        """
+        if self._cache_generation != self._generation:
+            if len(self._result_cache) or len(self._subquery_cache):
+                self._invalidations += 1
+            self._result_cache.clear()
+            self._subquery_cache.clear()
+            self._bm25 = None
+            self._max_frequencies = {}
+            self._cache_generation = self._generation
+
+    def _check_file_name(self, file_name, files=None):
+        """Check that a file name can be added to the index.
+
+        Args:
+            file_name: The file name to check.
+            files: A set of other file names already taken, besides the files
+            in the index.
+
+        Raises:
+            ValueError: If the file_name is not a string.
+            IndexError: If the file is already in the index.
 
         """
         if not isinstance(file_name, str):
             raise ValueError("[Error] That is not a file name!")
 
         # Return if file was already scanned
-        if file_name in self._files:
+        if file_name in self._documents or (files is not None
+                                            and file_name in files):
             raise IndexError(f'[Error] "{file_name}" is already in the index!')
 
-        try:
+    def _add_words(self, file_name, words, stats=None, positions=None):
+        """Add a scanned file and its words to the index.
+
+        Args:
+            file_name: The name of the file.
+            words: The distinct words in the file, either as a dictionary of
+            the words to the number of times they appear in the file, or as a
+            set (every word then appears once).
+            stats: The (size, mtime, digest) of the file when it was scanned,
+            or None if they are not known.
+            positions: A dictionary of the words to the sorted lists of
+            their positions in the file. They are only kept if the index
+            keeps positions.
+
+        Returns:
+            Success string.
+
+        """
+        # Add the file name to the files list
+        self._lengths.extend([0] * (len(self._files) - len(self._lengths)))
+        self._documents.append(file_name, stats)
+        self._generation += 1
+
+        # Add the words to the index
+        with self._metrics.timer('index.postings'):
+            number = len(self._files)
+            if isinstance(words, dict):
+                self._lengths.append(sum(words.values()))
+                counts = words.items()
+            else:
+                self._lengths.append(len(words))
+                counts = ((word, 1) for word in words)
+            index = self._index
+            all_frequencies = self._frequencies
+            for word, count in counts:
+                postings = index.get(word)
+                if postings is None:
+                    index[word] = [number]
+                    all_frequencies[word] = [count]
+                    if self._term_dictionary is not None:
+                        self._term_dictionary.add(word)
+                    continue
+                # Frequencies not aligned with the postings are never used
+                frequencies = all_frequencies.get(word)
+                if frequencies is not None and \
+                        len(frequencies) == len(postings):
+                    try:
+                        frequencies.append(count)
+                    except OverflowError:
+                        # A frozen array that is too small, see freeze
+                        all_frequencies[word] = _smallest_array(
+                                frequencies, count)
+                try:
+                    postings.append(number)
+                except OverflowError:
+                    index[word] = _smallest_array(postings, number)
+            if positions is not None and self._store_positions:
+                self._add_positions(number, positions)
+        self._metrics.count('index.files')
+        self._metrics.count('index.postings', len(words))
+
+        return f'[Success] The file "{file_name}" was added to index!'
+
+    def _add_positions(self, number, positions):
+        """Add the positions of the words of the file with the given number,
+        which was just added to the posting lists.
+
+        """
+        all_positions = self._positions
+        for word, word_positions in positions.items():
+            encoded = encode_postings(word_positions)
+            old = all_positions.get(word)
+            if old is None:
+                # Only aligned if the word is new to the index
+                if len(self._index[word]) == 1:
+                    all_positions[word] = [encoded]
+            elif len(old) == len(self._index[word]) - 1:
+                old.append(encoded)
+
+    def freeze(self):
+        """Compact the index in memory, e.g. after adding many files.
+
+        The posting lists and term frequencies of at least ARRAY_MIN_LENGTH
+        files are turned into arrays of the smallest integers that fit their
+        values: a posting list of an index of less than 65536 files takes 2
+        bytes per file, and most frequencies 1 byte, instead of the 8 bytes
+        of a pointer in a list (and the int object it points to, for the
+        posting lists decoded from a saved index). Shorter lists, and the
+        positions, are copied without the room lists keep to grow. The words
+        are interned, so the dictionaries share a single copy of every word,
+        and the dictionaries are built again without the room left by
+        removed words.
+
+        For an index loaded from a file, only the posting lists and
+        frequencies decoded so far are in memory: they are compacted now,
+        and the others when they are first decoded (see
+        LazyPostings.compact).
+
+        The index can still be changed afterwards: an array is widened when
+        a value doesn't fit in it anymore.
+
+        """
+        def compact(values):
+            if len(values) < ARRAY_MIN_LENGTH:
+                return list(values)
+            return _smallest_array(values)
 
-            with open(file_name) as file:
-                # Add the file name to the files list
-                self._files.append(file_name)
+        if isinstance(self._index, LazyPostings):
+            # The lists of a loaded index are compacted as they are decoded
+            self._index.compact(compact)
+            self._frequencies.compact(compact)
+        else:
+            self._index = {sys.intern(word): compact(postings)
+                           for word, postings in self._index.items()}
+            self._frequencies = {sys.intern(word): compact(frequencies)
+                                 for word, frequencies
+                                 in self._frequencies.items()}
+            self._positions = {sys.intern(word): list(positions)
+                               for word, positions
+                               in self._positions.items()}
+        self._lengths = array('I', self._lengths)
+        self._term_dictionary = None
+
+    def save(self, file_name):
+        """Save the index to a file, so it can be loaded later without
+        scanning the files again.
+
+        The file holds the file names, the sorted words with their postings
+        (as varint encoded deltas) and term frequencies, and the analysis
+        settings, see model/storage.py. The lengths of the files and their
+        stats (size, mtime and hash) are saved as binary arrays, so loading
+        the index doesn't have to read them. If stemming is used, the most
+        recently used stems are saved as well, in file_name + '.stems'.
+
+        Args:
+            file_name: The file to save the index to.
+
+        Raises:
+            ValueError: If a file name in the index contains a NUL character.
+            PermissionError: If the file can not be written.
+
+        """
+        sizes, mtimes, digests = self._documents.stats_arrays()
+        data, offsets = self._documents.blocks()
+        lengths = (self._file_length(number)
+                   for number in range(1, len(self._files) + 1))
+        write_index(file_name, self._files, self._index,
+                    {'analyzer': self._analyzer.settings,
+                     'positions': self._store_positions},
+                    self._aligned(self._frequencies),
+                    self._aligned(self._positions),
+                    {'names': data,
+                     'blocks': encode_array(offsets, 'Q'),
+                     'lengths': encode_array(lengths, 'I'),
+                     'sizes': encode_array(sizes, 'q'),
+                     'mtimes': encode_array(mtimes, 'q'),
+                     'digests': bytes(digests)})
+        cache = self._analyzer.stem_cache
+        if cache is not None and len(cache):
+            cache.save(f'{file_name}.stems')
 
-                # Construct a set from the words within the file
-                words = set(self._regex.findall(file.read().lower()))
+    @classmethod
+    def load(cls, file_name):
+        """Load an index saved with save.
 
-                # If 'remove_stopwords' is set, remove the stopwords
-                if self._config.remove_stopwords():
-                    words = self._remove_stopwords(words)
+        The file is memory mapped and only the front coded file names are
+        read right away, without being decoded: the postings of a word are
+        decoded the first time the word is queried, and the lengths and stats
+        of the files are read the first time they are needed (e.g. by a
+        ranked query, or by sync). Files can
+        still be added to a loaded index.
 
-                # If 'use_stemming' is set, stem the words
-                if self._config.use_stemming():
-                    words = self._apply_stemming(words)
+        Args:
+            file_name: The file the index was saved to.
+
+        Returns:
+            A new Index.
 
-                # Add the words to the index
-                for word in words:
-                    self._index[word].append(len(self._files))
+        Raises:
+            FileNotFoundError: If the file does not exist.
+            ValueError: If the file is not an index file, or if the
+                config.json has wrong format.
 
+        """
+        index = cls()
+        try:
+            index_file = IndexFile(file_name)
         except FileNotFoundError:
             raise FileNotFoundError(
                     f'[Error] The file "{file_name}" does not exist!')
-        except IsADirectoryError:
-            raise IsADirectoryError(
-                    f'[Error] "{file_name}" is a directory!')
-        except PermissionError:
-            raise PermissionError(
-                    f'[Error] Permission denied for "{file_name}"!')
+
+        metadata = index_file.metadata()
+        settings = metadata.get('analyzer')
+        if settings != index._analyzer.settings:
+            warnings.warn('[Warning] The index was built with other stop '
+                          'words or stemming settings, rebuild it to get '
+                          'correct results.')
+
+        index._index = LazyPostings(index_file)
+        index._frequencies = LazyPostings(index_file,
+                                          index_file.frequencies)
+        index._store_positions = metadata.get('positions', False)
+        index._positions = LazyPostings(index_file, index_file.positions)
+        if index_file.has_section('lengths'):
+            index._documents = index_file.documents(
+                    partial(_read_file_stats, index_file))
+            index._read_lengths = partial(index_file.array, 'lengths', 'I')
         else:
-            return f'[Success] The file "{file_name}" was added to index!'
+            # Older versions of the format keep them in the metadata
+            index._documents = index_file.documents()
+            index._lengths = metadata.get('lengths', [])
+            index._file_stats = {
+                    name: tuple(stats) for name, stats in
+                    metadata.get('file_stats', {}).items()}
 
-    def get_result_for_query(self, query):
+        cache = index._analyzer.stem_cache
+        if cache is not None and os.path.isfile(f'{file_name}.stems'):
+            cache.load(f'{file_name}.stems')
+        return index
+
+    def compile_query(self, query):
+        """Parse a query once, so it can be executed many times.
+
+        Args:
+            query: The query string. See get_result_for_query for its form.
+
+        Returns:
+            A CompiledQuery. For more see model/query.py.
+
+        Raises:
+            ValueError: If the query is wrong! The error is a
+                QuerySyntaxError, which also holds the position in the query
+                where the error was found.
+
+        """
+        return CompiledQuery(query)
+
+    def explain(self, query):
+        """Describe how a query is evaluated on the posting lists of the
+        index: the plan the query is rewritten into (see plan in
+        model/query.py), with the number of files every part of it is
+        estimated to match and what it costs.
+
+        Args:
+            query: The query, as a string or a CompiledQuery.
+
+        Returns:
+            The plan, as a string with one line per node of its tree.
+
+        Raises:
+            ValueError: If the query is wrong!
+
+        """
+        if not isinstance(query, CompiledQuery):
+            query = self.compile_query(query)
+        return query.explain(self)
+
+    def get_result_for_query(self, query, mode='auto', top_k=None):
         """This function returns a result for a query.
 
+        The results are cached, so running the same query again (even
+        written differently, e.g. 'b && a' instead of 'a && b') costs only
+        a lookup until files are added to or removed from the index.
+
         Args:
-            query: The query to return a result for.
+            query: The query to return a result for, either as a string or as
+            a CompiledQuery returned by compile_query.
             A query has the form of:
             - word1 && word2 || (word3 && !word4)
-            It can have any variations of words and signs.
+            It can have any variations of words and signs. If the index
+            keeps positions, it can also have phrases ("word1 word2") and
+            words or phrases at most k words apart (word1 NEAR/k word2).
+            mode: How to evaluate the query: on sparse posting lists
+            ('sparse'), on IndexLists ('dense'), on NumPy bit arrays
+            ('vector', dense if NumPy is not installed), or whichever of
+            sparse and dense is estimated to be cheaper ('auto'). For more
+            see model/query.py.
+            top_k: If given, only return the top_k files that match best,
+            ranked by their BM25 score, see get_top_results.
 
         Returns:
             A list containing the files that matched the query.
@@ -124,65 +904,338 @@ class Index():
             ValueError: If the query is wrong!
 
         """
-        # If the query contains punctuation signs, raise error
-        if re.findall(r'[,./?\'"]', query):
-            raise ValueError('[Error] Query contains punctuation!')
+        # If the query is empty, there is nothing to match
+        if not query:
+            return None
 
-        # Replace every word with the corresponding IndexList object
-        query = self._regex.sub(
-                lambda match:
-                str(self._get_index_list_for_word(match.group(0))),
-                query)
+        if top_k is not None:
+            return [file_name for file_name, _ in
+                    self.get_top_results(query, top_k)]
 
-        # Replace && with &, || with |, and ! with ~
-        query = re.sub(r'\s*&&\s*', ' & ', query)
-        query = re.sub(r'\s*\|\|\s*', ' | ', query)
-        query = re.sub(r'\s*!', ' ~', query)
+        with self._metrics.timer('query.total'):
+            return self._documents.names(
+                    self._get_numbers_for_query(query, mode))
 
-        # If the query is not empty, return the files that match the query
-        if query:
-            try:
-                res = eval(query)
-            except SyntaxError:
-                raise ValueError('[Error] Query is wrong!')
-            files = [self._files[index]
-                     for index, item in enumerate(list(res))
-                     if item == 1]
-            return files
+    def _get_numbers_for_query(self, query, mode='auto'):
+        """Same as get_result_for_query, but returns the sorted numbers of
+        the files that matched the query instead of their names.
+
+        """
+        if not isinstance(query, CompiledQuery):
+            with self._metrics.timer('query.parse'):
+                query = self.compile_query(query)
+
+        if mode not in MODES:
+            raise ValueError(f'[Error] Unknown query mode "{mode}"!')
+
+        self._check_query_caches()
+        return self._numbers_for_query(query, mode, self,
+                                       self._subquery_cache)
+
+    def get_top_results(self, query, k=10):
+        """This function returns the files that match a query best.
+
+        The files that match the query are ranked by their BM25 score (see
+        model/ranking.py), computed from the number of times the words of
+        the query that are not negated appear in them and from their length.
+        Only the k best files are scored fully: a query that is a single word
+        or words joined by || is evaluated with WAND, and any other query
+        with MaxScore over the files that match it, both skipping the files
+        that can't make it to the top k.
 
-    def _remove_stopwords(self, words_list):
-        """This function uses the stopwords directory to remove stopwords from
-        a list of words.
+        The results are cached like the ones of get_result_for_query.
 
         Args:
-            words_list: The word list that needs to be picked for stopwords.
+            query: The query, as a string or as a CompiledQuery.
+            k: How many files to return.
 
         Returns:
-            A new list with the stopwords removed.
+            A list of (file, score) tuples, from the best score to the worst.
+            Files with the same score are in the order they were added.
+
+        Raises:
+            ValueError: If the query is wrong, or if k is not a positive
+                integer.
 
         """
-        stop_words = []
-        stop_words_path = f'stopwords/{self._config.language()}'
-        if path.isfile(stop_words_path):
-            with open(stop_words_path) as stopwords_file:
-                stop_words = [x.strip() for x in stopwords_file.readlines()]
+        # If the query is empty, there is nothing to match
+        if not query:
+            return None
+
+        with self._metrics.timer('query.total'):
+            return [(self._documents[number - 1], score)
+                    for number, score in self._get_top_numbers(query, k)]
 
-        return [word for word in words_list if word not in stop_words and
-                len(word) > 2]
+    def _get_top_numbers(self, query, k=10):
+        """Same as get_top_results, but returns (number, score) tuples, with
+        the numbers of the files instead of their names.
+
+        """
+        if not isinstance(k, int) or isinstance(k, bool) or k < 1:
+            raise ValueError('[Error] The number of results must be a '
+                             'positive integer!')
+        if not isinstance(query, CompiledQuery):
+            with self._metrics.timer('query.parse'):
+                query = self.compile_query(query)
 
-    def _apply_stemming(self, words_list):
-        """This function applies the stemming algorithm to every word in the
-        words list.
+        self._check_query_caches()
+        self._metrics.count('query.count')
+        key = ('top', k, query.canonical)
+        ranked = self._result_cache.get(key)
+        if ranked is None:
+            ranked = self._rank(query, k)
+            self._result_cache.put(key, ranked)
+        else:
+            self._metrics.count('query.cache_hits')
+        return ranked
+
+    def _rank(self, query, k):
+        """Return the (number, score) pairs of the k best files for a
+        compiled query, best first.
+
+        """
+        if self._bm25 is None:
+            self._bm25 = BM25([self._file_length(number) for number
+                               in range(1, len(self._files) + 1)])
+        bm25 = self._bm25
+
+        ast = query.canonical
+        cursors = []
+        terms = set()
+        with self._metrics.timer('query.lookup'):
+            words = []
+            for word in scoring_words(ast):
+                if isinstance(word, Wildcard):
+                    words.extend(self._expand_wildcard(word.pattern))
+                else:
+                    words.append(self._analyzer.normalize(word))
+            for term in words:
+                if term is None or term in terms:
+                    continue
+                terms.add(term)
+                postings = self._index.get(term)
+                if not postings:
+                    continue
+                frequencies = self._frequencies.get(term)
+                if (frequencies is not None
+                        and len(frequencies) != len(postings)):
+                    frequencies = None
+                max_frequency = self._max_frequencies.get(term)
+                if max_frequency is None:
+                    max_frequency = max(frequencies) if frequencies else 1
+                    self._max_frequencies[term] = max_frequency
+                idf = bm25.idf(len(postings))
+                cursors.append(TermCursor(postings, frequencies, idf,
+                                          bm25.upper_bound(idf,
+                                                           max_frequency)))
+
+        if is_disjunction(ast):
+            with self._metrics.timer('query.rank'):
+                return tuple(top_k_wand(cursors, k, bm25))
+        candidates = query.documents(self, 'auto', self._subquery_cache,
+                                     self._metrics)
+        with self._metrics.timer('query.rank'):
+            return tuple(top_k_max_score(cursors, candidates, k, bm25))
+
+    def _aligned(self, values):
+        """Return a dictionary of the words to their values (frequencies or
+        positions), for the words whose values are aligned with their
+        posting lists.
+
+        """
+        aligned = {}
+        if not values:
+            return aligned
+        for word, postings in self._index.items():
+            word_values = values.get(word)
+            if word_values is not None and len(word_values) == len(postings):
+                aligned[word] = word_values
+        return aligned
+
+    def _file_length(self, number):
+        """Return the length of a file, given its number, or 0 if it is not
+        known.
+
+        """
+        return self._lengths[number - 1] if number <= len(self._lengths) \
+            else 0
+
+    def get_results_for_queries(self, queries, mode='auto'):
+        """This function returns the results for many queries.
+
+        It gives the same results as calling get_result_for_query for every
+        query, but the work is shared between the queries, see
+        iter_results_for_queries.
 
         Args:
-            words_list: The word list to which to apply the stemming algorithm.
+            queries: The queries, as strings or CompiledQuery objects.
+            mode: How to evaluate the queries, see get_result_for_query.
 
         Returns:
-            A new list with stemming applied to the words.
+            A list with a result for every query, in order: the list of
+            files that matched, None for an empty query, or the ValueError
+            get_result_for_query would have raised for a wrong query.
+
+        """
+        return [result for _, result in
+                self.iter_results_for_queries(queries, mode)]
+
+    def iter_results_for_queries(self, queries, mode='auto'):
+        """Run many queries, yielding every result as soon as it is ready.
+
+        The queries share the work:
+          - every distinct word is normalized (and stemmed) and its posting
+          list is looked up only once;
+          - every && and || clause that appears in more than one query (in
+          any order of its operands) is evaluated only once;
+          - in vector mode, the bit array of every word and clause is built
+          only once;
+          - identical queries are answered from the result cache.
+
+        Args:
+            queries: An iterable of queries, as strings or CompiledQuery
+            objects. It is consumed lazily, so it can be e.g. a file.
+            mode: How to evaluate the queries, see get_result_for_query.
+
+        Yields:
+            A (query, result) tuple for every query, in order, with the
+            result as in get_results_for_queries.
+
+        Raises:
+            ValueError: If the mode is unknown.
+
+        """
+        if mode not in MODES:
+            raise ValueError(f'[Error] Unknown query mode "{mode}"!')
+
+        lookup = None
+        generation = None
+        for query in queries:
+            if not query:
+                yield query, None
+                continue
+
+            with self._metrics.timer('query.total'):
+                try:
+                    compiled = query
+                    if not isinstance(query, CompiledQuery):
+                        with self._metrics.timer('query.parse'):
+                            compiled = self.compile_query(query)
+                except ValueError as e:
+                    result = e
+                else:
+                    # The index may be changed between 2 results
+                    if generation != self._generation:
+                        self._check_query_caches()
+                        lookup = _SharedLookup(self)
+                        subqueries = LRUCache(sys.maxsize)
+                        vectors = {}
+                        generation = self._generation
+                    numbers = self._numbers_for_query(compiled, mode, lookup,
+                                                      subqueries, vectors)
+                    result = self._documents.names(numbers)
+            yield query, result
+
+    def _numbers_for_query(self, query, mode, source, subqueries,
+                           vectors=None):
+        """Return the numbers of the files that match a compiled query, from
+        the result cache if possible.
+
+        Args:
+            query: The CompiledQuery.
+            mode: How to evaluate the query.
+            source: What to look up the posting lists of the words in, the
+            index itself or a _SharedLookup.
+            subqueries: The LRUCache for the results of subqueries.
+            vectors: In vector mode, the dictionary to keep the bit arrays of
+            the words and subqueries in, see CompiledQuery.documents.
+
+        """
+        self._metrics.count('query.count')
+        numbers = self._result_cache.get(query.canonical)
+        if numbers is None:
+            numbers = tuple(query.documents(source, mode, subqueries,
+                                            self._metrics, vectors))
+            self._result_cache.put(query.canonical, numbers)
+        else:
+            self._metrics.count('query.cache_hits')
+        return numbers
+
+    def _get_positional_postings(self, node):
+        """This function returns the sorted numbers of the files a phrase
+        or a NEAR of a query matches.
+
+        Args:
+            node: The Phrase or Near node of the query.
+
+        Raises:
+            ValueError: If the index doesn't keep positions.
+
+        """
+        if not self._store_positions:
+            raise ValueError('[Error] Phrase and NEAR queries need an index '
+                             'that keeps positions!')
+        operands = node.operands if isinstance(node, Near) else [node]
+        patterns = []
+        for operand in operands:
+            words = [operand.word] if isinstance(operand, Term) \
+                else operand.words
+            terms = []
+            for offset, word in enumerate(words):
+                # The words are analyzed as in the files, so the words that
+                # are left out of the index (e.g. stop words) leave a gap
+                analyzed = self._analyzer.analyze([word.lower()])
+                if analyzed:
+                    terms.append((offset, analyzed.pop()))
+            patterns.append(Pattern(terms, len(words)))
+
+        terms = {term for pattern in patterns for _, term in pattern.terms}
+        postings = {term: self._index.get(term, []) for term in terms}
+        positions = {}
+        for term in terms:
+            term_positions = self._positions.get(term)
+            if (term_positions is not None
+                    and len(term_positions) != len(postings[term])):
+                term_positions = None
+            positions[term] = term_positions
+        return match(patterns, postings, positions,
+                     node.distance if isinstance(node, Near) else None)
+
+    def _get_wildcard_postings(self, pattern):
+        """This function returns the sorted numbers of the files that have
+        any of the terms a wildcard of a query matches.
+
+        Args:
+            pattern: The wildcard, as written in the query.
+
+        Raises:
+            ValueError: If the wildcard matches more than max_expansions
+                terms.
 
         """
-        stemmer = EnglishStemmer()
-        return [stemmer.stem(word) for word in words_list]
+        return union([self._index[term]
+                      for term in self._expand_wildcard(pattern)])
+
+    def _expand_wildcard(self, pattern):
+        """Return the sorted terms of the index that a wildcard matches.
+
+        The wildcard is only lowercased, not stemmed, so it is matched
+        against the terms as they are kept in the index.
+
+        Raises:
+            ValueError: If the wildcard matches more than max_expansions
+                terms.
+
+        """
+        if (self._term_dictionary is None
+                or self._term_source is not self._index):
+            self._term_dictionary = TermDictionary(self._index)
+            self._term_source = self._index
+        terms = self._term_dictionary.wildcard(pattern.lower())
+        if len(terms) > self._max_expansions:
+            raise ValueError(f'[Error] "{pattern}" matches more than '
+                             f'{self._max_expansions} terms!')
+        return terms
 
     def _get_index_list_for_word(self, word):
         """This function returns an IndexList associated with a word.
@@ -197,14 +1250,273 @@ class Index():
             word: The word to return an IndexList for.
 
         """
-        # Populate the lists with 0's
-        word_list = [0] * len(self._files)
+        return IndexList.from_postings(self._get_postings(word),
+                                       len(self._files))
+
+    def _get_postings(self, word):
+        """This function returns the posting list of a query word, that is the
+        sorted numbers of the files it appears in.
+
+        Args:
+            word: The word to return the postings for, as written in the query.
+
+        """
+        term = self._analyzer.normalize(word)
+        if term is None:
+            # An analysis stage left the word out, it matches no file
+            return []
+        return self._index.get(term, [])
+
+
+class _SharedLookup():
+    """Looks up the posting list of every distinct query word only once, for
+    queries run together by Index.iter_results_for_queries. It looks like an
+    Index to CompiledQuery.documents.
+
+    """
+
+    def __init__(self, index):
+        self._index = index
+        self._files = index._files
+        self._postings = {}
+
+    def _get_postings(self, word):
+        postings = self._postings.get(word)
+        if postings is None:
+            postings = self._index._get_postings(word)
+            self._postings[word] = postings
+        return postings
+
+    def _get_positional_postings(self, node):
+        postings = self._postings.get(node)
+        if postings is None:
+            postings = self._index._get_positional_postings(node)
+            self._postings[node] = postings
+        return postings
+
+    def _get_wildcard_postings(self, pattern):
+        # A pattern has wildcards, so it can't be mistaken for a word
+        postings = self._postings.get(pattern)
+        if postings is None:
+            postings = self._index._get_wildcard_postings(pattern)
+            self._postings[pattern] = postings
+        return postings
+
+
+def _scan_file(file_name, analyzer, metrics=NULL_METRICS, positions=False,
+               skip_binary=False):
+    """Read a file and return the terms that should be indexed for it.
+
+    This is a function, not a method of Index, so it can be run in worker
+    processes by Index.add_files.
+
+    Args:
+        file_name: The file to be scanned.
+        analyzer: The Analyzer to apply to the words of the file.
+        metrics: The Metrics to record the timings and counters of the scan
+        to.
+        positions: Whether to return the positions of the terms too.
+        skip_binary: Whether to leave out the files that look binary (see
+        is_binary in model/directory.py).
+
+    Returns:
+        A (terms, stats) tuple: a Counter of the terms for the file to the
+        number of times they appear in it, and the (size, mtime, digest) of
+        the file, or None if the file can't be stat'ed. With positions, a
+        (terms, stats, positions) tuple, where positions is a dictionary of
+        the terms to the sorted lists of their positions in the file. None
+        if the file was left out because it is binary.
+
+    Raises:
+        FileNotFoundError: If the file does not exist.
+        IsADirectoryError: If a directory was passed.
+        PermissionError: If the user running the script doesn't have
+            permission on a file.
+        ValueError: If the file is not valid text in the encoding of the
+            files.
+        OSError: If the file can't be read for another reason.
+
+    """
+    try:
+
+        with open(file_name, 'rb') as file:
+            if skip_binary and is_binary(file):
+                return None
+            stats = _file_stats(file_name)
+
+            # Construct a set from the words within the file, reading it in
+            # chunks, and hash it at the same time
+            digest = new_digest()
+            if metrics.enabled:
+                words = _unique_words_metered(file, digest, metrics,
+                                              positions)
+            else:
+                words = unique_words(file, digest=digest,
+                                     frequencies=not positions,
+                                     positions=positions)
+
+    except FileNotFoundError:
+        raise FileNotFoundError(
+                f'[Error] The file "{file_name}" does not exist!')
+    except IsADirectoryError:
+        raise IsADirectoryError(
+                f'[Error] "{file_name}" is a directory!')
+    except PermissionError:
+        raise PermissionError(
+                f'[Error] Permission denied for "{file_name}"!')
+    except UnicodeDecodeError as e:
+        raise ValueError(
+                f'[Error] "{file_name}" is not valid {e.encoding} text!')
+    except OSError as e:
+        raise OSError(
+                f'[Error] Could not read "{file_name}": {e.strerror}!')
+
+    if stats is not None:
+        stats = stats + (digest.hexdigest(),)
 
-        # Stem the word if necessary
-        if self._config.use_stemming():
-            word = EnglishStemmer().stem(word)
+    # Remove the stopwords and stem the words, as set in the config
+    if positions:
+        term_positions = analyzer.analyze_positions(words, metrics)
+        terms = Counter({term: len(found)
+                         for term, found in term_positions.items()})
+        metrics.count('index.terms', len(terms))
+        return terms, stats, term_positions
+    terms = analyzer.analyze_frequencies(words, metrics)
+    metrics.count('index.terms', len(terms))
+    return terms, stats
 
-        # Change it to 1 when the word appears in a file
-        for item in self._index[word.lower()]:
-            word_list[item - 1] = 1
-        return IndexList(word_list)
+
+def _unique_words_metered(file, digest, metrics, positions=False):
+    """Same as unique_words, but records the time spent reading and
+    tokenizing the file, and the bytes and words read, to metrics.
+
+    """
+    reader = MeteredReader(file)
+    counts = {'tokens': 0}
+    start = time.perf_counter()
+    words = unique_words(reader, digest=digest, counts=counts,
+                         frequencies=not positions, positions=positions)
+    elapsed = time.perf_counter() - start
+    metrics.add_time('index.read', reader.seconds)
+    metrics.add_time('index.tokenize', elapsed - reader.seconds)
+    metrics.count('index.bytes_read', reader.bytes)
+    metrics.count('index.tokens', counts['tokens'])
+    metrics.count('index.words', len(words))
+    return words
+
+
+def _subquery_size(value):
+    """Return the size in bytes of a cached subquery result."""
+    files, _ = value
+    return sys.getsizeof(files)
+
+
+def _digest_or_none(file_name):
+    """Return the digest of a file, or None if it can't be read."""
+    try:
+        return file_digest(file_name)
+    except OSError:
+        return None
+
+
+def _read_file_stats(index_file):
+    """Read the stats of the files saved by Index.save from an IndexFile, in
+    the form DocumentTable.set_stats_source takes them.
+
+    """
+    return (index_file.array('sizes', 'q'), index_file.array('mtimes', 'q'),
+            bytearray(index_file.section('digests')))
+
+
+def _file_stats(file_name):
+    """Return the (size, mtime) of a file, or None if it can't be stat'ed."""
+    try:
+        stat = os.stat(file_name)
+    except OSError:
+        return None
+    return stat.st_size, stat.st_mtime_ns
+
+
+def _init_worker(analyzer):
+    """Set the Analyzer of a worker process of Index._executor."""
+    global _worker_analyzer
+    _worker_analyzer = analyzer
+
+
+def _scan_file_or_error(file_name, analyzer=None, instrument=False,
+                        positions=False, skip_binary=False):
+    """Same as _scan_file, but returns a (scanned, error, metrics) tuple,
+    where scanned is what _scan_file returns, instead of raising, so one bad
+    file (missing, unreadable or not valid text) doesn't stop
+    Index.add_files.
+
+    Without an analyzer, the one of the worker process is used (see
+    _init_worker).
+
+    If instrument is True, the scan is recorded to a new Metrics, which is
+    returned so it can be merged into the Metrics of the index (the scan may
+    run in a worker process). Otherwise metrics is NULL_METRICS.
+
+    """
+    metrics = Metrics() if instrument else NULL_METRICS
+    if analyzer is None:
+        analyzer = _worker_analyzer
+    try:
+        return (_scan_file(file_name, analyzer, metrics, positions,
+                           skip_binary), None, metrics)
+    except (OSError, ValueError) as e:
+        return None, e, metrics
+
+
+def _smallest_array(values, value=None):
+    """Return an array of the smallest unsigned integers that fit the
+    values, with value appended if given.
+
+    """
+    values = list(values) if value is None else list(values) + [value]
+    top = max(values, default=0)
+    for typecode, limit in _TYPECODES:
+        if top < limit:
+            return array(typecode, values)
+    raise OverflowError('[Error] The values are too big for an array!')
+
+
+def _scan_files_or_errors(file_names, **kwargs):
+    """Same as _scan_file_or_error, for a batch of files, so a worker
+    process gets many files at once.
+
+    """
+    return [_scan_file_or_error(file_name, **kwargs)
+            for file_name in file_names]
+
+
+def _batches(items, size):
+    """Yield the items in lists of (at most) size items, as they come."""
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _bounded_map(executor, function, items, window):
+    """Like executor.map, but only takes the next items from the iterable
+    when fewer than window of them are being processed, so a long (or
+    endless) iterable is never read ahead all at once.
+
+    Yields:
+        An (item, result) tuple for every item, in order.
+
+    """
+    pending = deque()
+    for item in items:
+        pending.append((item, executor.submit(function, item)))
+        if len(pending) >= window:
+            item, future = pending.popleft()
+            yield item, future.result()
+    while pending:
+        item, future = pending.popleft()
+        yield item, future.result()
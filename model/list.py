@@ -1,13 +1,20 @@
+from model.bitmap import Bitmap
+
+
 class IndexList():
     """This class is a modified list. It holds lists of 1's and 0's.
 
-    It holds a regular list object that contains only 1's and 0's (representing
+    It represents a list object that contains only 1's and 0's (representing
     whether a word appears in a file or not), but adds functionality through
     the overriden operators &, | and ~, which mean:
     & - AND between 2 lists
     | - OR between 2 lists
     ~ - INVERT a list's objects
 
+    Internally, only the positions of the 1's are kept, in a compressed
+    Bitmap (see 'bitmap.py'), so the operators work on the compressed form
+    instead of walking the whole list.
+
     """
 
     def __init__(self, lst):
@@ -19,6 +26,10 @@ class IndexList():
             'from': [1, 0, 0, 1]
             The word 'from' appears in files 1 and 4.
 
+        _bitmap: A Bitmap holding the positions of the 1's in the list.
+
+        _size: The length of the list.
+
         Args:
             lst: The list object with the meaning detailed above.
 
@@ -30,7 +41,43 @@ class IndexList():
         # check that indeed the list passed as parameter contains only 1's and 0's
         if not all(item in [1, 0] for item in lst):
             raise ValueError("[Error] IndexList contains values different from 1 and 0.")
-        self._lst = lst
+        self._bitmap = Bitmap(index for index, item in enumerate(lst)
+                              if item == 1)
+        self._size = len(lst)
+
+    @classmethod
+    def from_bitmap(cls, bitmap, size):
+        """Create an IndexList directly from a Bitmap, without validation.
+
+        Args:
+            bitmap: A Bitmap with the positions of the 1's.
+            size: The length of the list.
+
+        Returns:
+            A new IndexList.
+
+        """
+        index_list = cls.__new__(cls)
+        index_list._bitmap = bitmap
+        index_list._size = size
+        return index_list
+
+    @classmethod
+    def from_postings(cls, postings, size):
+        """Create an IndexList from a posting list of the index.
+
+        Example:
+            The postings [1, 2, 5] with size 5 give [1, 1, 0, 0, 1].
+
+        Args:
+            postings: The files a word appears in, numbered from 1.
+            size: The number of files in the index.
+
+        Returns:
+            A new IndexList.
+
+        """
+        return cls.from_bitmap(Bitmap.from_sorted(postings, offset=1), size)
 
     @property
     def lst(self):
@@ -39,7 +86,30 @@ class IndexList():
         Returns:
             The list containing 1's and 0's.
         """
-        return self._lst
+        lst = [0] * self._size
+        for position in self._bitmap:
+            lst[position] = 1
+        return lst
+
+    @property
+    def bitmap(self):
+        """Simple getter for the compressed form of the list.
+
+        Returns:
+            The Bitmap holding the positions of the 1's.
+        """
+        return self._bitmap
+
+    def cardinality(self):
+        """Return the number of 1's in the list."""
+        return len(self._bitmap)
+
+    def positions(self):
+        """Return an iterator over the positions of the 1's, in order."""
+        return iter(self._bitmap)
+
+    def __len__(self):
+        return self._size
 
     def __and__(self, other):
         """AND between 2 IndexList objects. What it does is take 2 IndexList
@@ -59,10 +129,8 @@ class IndexList():
             An IndexList, so chaining multiple operations is possible.
 
         """
-        lst = [1 if i == 1 and j == 1
-               else 0
-               for i, j in zip(self._lst, other.lst)]
-        return IndexList(lst)
+        size = min(self._size, other._size)
+        return IndexList.from_bitmap(self._bitmap & other._bitmap, size)
 
     def __or__(self, other):
         """OR between 2 IndexList objects. What it does is take 2 IndexList
@@ -82,10 +150,30 @@ class IndexList():
             An IndexList, so chaining multiple operations is possible.
 
         """
-        lst = [1 if i == 1 or j == 1
-               else 0
-               for i, j in zip(self._lst, other.lst)]
-        return IndexList(lst)
+        size = min(self._size, other._size)
+        bitmap = self._bitmap | other._bitmap
+        if self._size != other._size:
+            bitmap = bitmap & Bitmap.range(0, size)
+        return IndexList.from_bitmap(bitmap, size)
+
+    def __sub__(self, other):
+        """ANDNOT between 2 IndexList objects, the same as lst1 & ~lst2 but
+        without building the complement of lst2.
+
+        Example:
+            lst1: [1, 0, 1, 1]
+            lst2: [0, 1, 1, 0]
+            lst1 - lst2 = [1, 0, 0, 1]
+
+        Returns:
+            An IndexList, so chaining multiple operations is possible.
+
+        """
+        size = min(self._size, other._size)
+        bitmap = self._bitmap - other._bitmap
+        if self._size > other._size:
+            bitmap = bitmap & Bitmap.range(0, size)
+        return IndexList.from_bitmap(bitmap, size)
 
     def __invert__(self):
         """INVERT an IndexList object. What it does is take an IndexList object
@@ -99,8 +187,7 @@ class IndexList():
             An IndexList, so chaining multiple operations is possible.
 
         """
-        lst = [0 if i == 1 else 1 for i in self._lst]
-        return IndexList(lst)
+        return IndexList.from_bitmap(self._bitmap.flip(self._size), self._size)
 
     def __iter__(self):
         """Return an iterable object.
@@ -109,7 +196,7 @@ class IndexList():
             An iterable from the list object.
 
         """
-        return iter(self._lst)
+        return iter(self.lst)
 
     def __str__(self):
         """String representation of an IndexList object.
@@ -118,4 +205,4 @@ class IndexList():
             The string representation of the class.
 
         """
-        return f'IndexList({str(self._lst)})'
+        return f'IndexList({str(self.lst)})'
@@ -0,0 +1,235 @@
+from time import perf_counter
+
+
+class _Timer():
+    """Context manager that adds the time spent in its block to a timer of
+    a Metrics.
+
+    """
+
+    __slots__ = ('_metrics', '_name', '_start')
+
+    def __init__(self, metrics, name):
+        self._metrics = metrics
+        self._name = name
+
+    def __enter__(self):
+        self._start = perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._metrics.add_time(self._name, perf_counter() - self._start)
+
+
+class _NullTimer():
+    """Context manager that does nothing, used when metrics are disabled."""
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+
+_NULL_TIMER = _NullTimer()
+
+
+class Metrics():
+    """This class records where the time goes when indexing and querying.
+
+    It keeps 2 kinds of values:
+      1. timers: For every name, how many times it was measured, and the
+      total, minimum and maximum time in seconds.
+      2. counters: For every name, a number that only goes up (e.g. the
+      bytes read from files).
+
+    Every measurement is also passed to the hooks, so the values can be
+    exported to another metrics system as they come.
+
+    The names used by Index are:
+      index.add_file, index.read, index.tokenize, index.analyze.<Stage>,
+      index.postings: The time spent adding a file, and in every step of it.
+      index.files, index.bytes_read, index.tokens, index.words,
+      index.terms, index.postings: How many files were added, how many
+      bytes were read from them, how many words were found in them (all of
+      them, and the distinct ones), how many terms were left after the
+      analysis, and how many postings were appended to the index.
+      query.total, query.parse, query.lookup, query.build, query.evaluate,
+      query.rank: The time spent answering a query, and in every step of it.
+      query.count, query.cache_hits: How many queries were answered, and
+      how many of them came from the result cache.
+
+    """
+
+    enabled = True
+
+    def __init__(self):
+        """Initialization of the metrics.
+
+        _timers: A dictionary of names to [count, total, min, max] lists.
+
+        _counters: A dictionary of names to numbers.
+
+        _hooks: The callables the measurements are passed to.
+
+        """
+        self._timers = {}
+        self._counters = {}
+        self._hooks = []
+
+    def add_hook(self, hook):
+        """Add a hook, that is called for every measurement.
+
+        Args:
+            hook: A callable taking (kind, name, value), where kind is
+            'time' (and value is in seconds) or 'count'.
+
+        """
+        self._hooks.append(hook)
+
+    def remove_hook(self, hook):
+        self._hooks.remove(hook)
+
+    def timer(self, name):
+        """Return a context manager that measures the time spent in its
+        block.
+
+        Example:
+            with metrics.timer('query.parse'):
+                ...
+
+        """
+        return _Timer(self, name)
+
+    def add_time(self, name, seconds):
+        """Add a time measurement to a timer."""
+        timer = self._timers.get(name)
+        if timer is None:
+            self._timers[name] = [1, seconds, seconds, seconds]
+        else:
+            timer[0] += 1
+            timer[1] += seconds
+            timer[2] = min(timer[2], seconds)
+            timer[3] = max(timer[3], seconds)
+        for hook in self._hooks:
+            hook('time', name, seconds)
+
+    def count(self, name, value=1):
+        """Increase a counter."""
+        self._counters[name] = self._counters.get(name, 0) + value
+        for hook in self._hooks:
+            hook('count', name, value)
+
+    def merge(self, other):
+        """Add the values of other Metrics, e.g. measured in a worker
+        process, to these ones.
+
+        The hooks are called once for every timer (with its total time) and
+        every counter of other.
+
+        """
+        for name, (count, total, low, high) in other._timers.items():
+            timer = self._timers.get(name)
+            if timer is None:
+                self._timers[name] = [count, total, low, high]
+            else:
+                timer[0] += count
+                timer[1] += total
+                timer[2] = min(timer[2], low)
+                timer[3] = max(timer[3], high)
+            for hook in self._hooks:
+                hook('time', name, total)
+        for name, value in other._counters.items():
+            self._counters[name] = self._counters.get(name, 0) + value
+            for hook in self._hooks:
+                hook('count', name, value)
+
+    def timers(self):
+        """Return a dictionary of the timers, each one a dictionary with
+        its 'count', and 'total', 'mean', 'min' and 'max' time in seconds.
+
+        """
+        return {name: {'count': count, 'total': total,
+                       'mean': total / count, 'min': low, 'max': high}
+                for name, (count, total, low, high) in self._timers.items()}
+
+    def counters(self):
+        """Return a dictionary of the counters."""
+        return dict(self._counters)
+
+    def snapshot(self):
+        """Return the 'timers' and the 'counters' in a dictionary."""
+        return {'timers': self.timers(), 'counters': self.counters()}
+
+    def reset(self):
+        """Forget all the values, but keep the hooks."""
+        self._timers.clear()
+        self._counters.clear()
+
+
+class NullMetrics():
+    """Metrics that record nothing, used when instrumentation is disabled.
+    Every method does as little as possible, so leaving the instrumentation
+    in the code costs almost nothing.
+
+    """
+
+    enabled = False
+
+    def add_hook(self, hook):
+        raise ValueError('[Error] Metrics are disabled, hooks would never be '
+                         'called!')
+
+    def timer(self, name):
+        return _NULL_TIMER
+
+    def add_time(self, name, seconds):
+        pass
+
+    def count(self, name, value=1):
+        pass
+
+    def merge(self, other):
+        pass
+
+    def timers(self):
+        return {}
+
+    def counters(self):
+        return {}
+
+    def snapshot(self):
+        return {'timers': {}, 'counters': {}}
+
+    def reset(self):
+        pass
+
+
+NULL_METRICS = NullMetrics()
+
+
+class MeteredReader():
+    """Wraps a file, and measures the time spent reading it and the bytes
+    read.
+
+    """
+
+    def __init__(self, file):
+        """Initialization of the reader.
+
+        Args:
+            file: The file object to read from.
+
+        """
+        self._file = file
+        self.seconds = 0.0
+        self.bytes = 0
+
+    def read(self, size=-1):
+        start = perf_counter()
+        data = self._file.read(size)
+        self.seconds += perf_counter() - start
+        self.bytes += len(data)
+        return data
@@ -0,0 +1,159 @@
+from model.postings import gallop, intersect_all
+from model.storage import decode_postings
+
+from bisect import bisect_left
+
+
+class PositionCursor():
+    """Walks through the posting list of a term, and decodes the positions
+    of the term in a file only when they are asked for.
+
+    """
+
+    __slots__ = ('_postings', '_positions', '_position')
+
+    def __init__(self, postings, positions):
+        """Initialization of the cursor.
+
+        Args:
+            postings: The sorted numbers of the files the term appears in.
+            positions: The encoded positions of the term (see
+            encode_postings in model/storage.py) in each one of them, or None
+            if they are not known.
+
+        """
+        self._postings = postings
+        self._positions = positions
+        self._position = 0
+
+    def positions(self, number):
+        """Return the sorted positions of the term in a file, or None if the
+        term is not in the file (or its positions are not known).
+
+        The files must be asked for in increasing order.
+
+        """
+        if self._positions is None:
+            return None
+        self._position = gallop(self._postings, number, self._position)
+        if (self._position < len(self._postings)
+                and self._postings[self._position] == number):
+            return decode_postings(self._positions[self._position])
+        return None
+
+
+class Pattern():
+    """The terms of a word or a phrase of a query, with their offsets in it.
+
+    Words that are left out of the index (e.g. stop words) have no term,
+    but still take their place, so "state of the art" matches 'state' and
+    'art' 3 words apart.
+
+    """
+
+    __slots__ = ('terms', 'length')
+
+    def __init__(self, terms, length):
+        """Initialization of the pattern.
+
+        Args:
+            terms: A list of (offset, term) tuples, for the words that have
+            a term.
+            length: The number of words in the pattern.
+
+        """
+        self.terms = terms
+        self.length = length
+
+    def starts(self, cursors, number):
+        """Return the sorted positions where the pattern starts in a file.
+
+        Args:
+            cursors: A dictionary of the terms to their PositionCursors.
+            number: The number of the file.
+
+        """
+        (first_offset, first_term), *others = self.terms
+        first = cursors[first_term].positions(number)
+        if first is None:
+            return []
+        starts = [position - first_offset for position in first]
+        for offset, term in others:
+            positions = cursors[term].positions(number)
+            if positions is None:
+                return []
+            positions = set(positions)
+            starts = [start for start in starts
+                      if start + offset in positions]
+            if not starts:
+                break
+        return starts
+
+
+def _near(left, left_length, right, right_length, distance):
+    """Whether 2 patterns, starting at the given sorted positions, appear at
+    most distance words apart, in any order.
+
+    The distance is counted from the last word of the first pattern to the
+    first word of the second one, so words next to each other are 1 word
+    apart. The 2 patterns must not overlap, so a word is never near itself.
+
+    """
+    for start in left:
+        end = start + left_length - 1
+        # After the left pattern: the right one starts in
+        # [end + 1, end + distance]
+        position = bisect_left(right, end + 1)
+        if position < len(right) and right[position] <= end + distance:
+            return True
+        # Before it: the right one ends in [start - distance, start - 1]
+        position = bisect_left(right, start - distance - right_length + 1)
+        if position < len(right) and right[position] <= start - right_length:
+            return True
+    return False
+
+
+def match(patterns, postings, positions, distance=None):
+    """Return the files in which a phrase, or 2 patterns NEAR each other,
+    appear.
+
+    The posting lists of all the terms are intersected first, as for an
+    AND of the words, and the positions are only decoded for the files that
+    have all of them.
+
+    Args:
+        patterns: A list with the Pattern of a phrase, or the 2 Patterns of
+        a NEAR.
+        postings: A dictionary of the terms of the patterns to their posting
+        lists.
+        positions: A dictionary of the terms of the patterns to their
+        encoded positions, aligned with their posting lists, or None if not
+        known.
+        distance: The distance of a NEAR.
+
+    Returns:
+        The sorted numbers of the files that match.
+
+    """
+    if any(not pattern.terms for pattern in patterns):
+        return []
+    terms = {term for pattern in patterns for _, term in pattern.terms}
+    candidates = intersect_all([postings[term] for term in terms])
+    cursors = {term: PositionCursor(postings[term], positions[term])
+               for term in terms}
+
+    files = []
+    for number in candidates:
+        if distance is None:
+            if patterns[0].starts(cursors, number):
+                files.append(number)
+            continue
+        left, right = patterns
+        left_starts = left.starts(cursors, number)
+        if not left_starts:
+            continue
+        right_starts = right.starts(cursors, number)
+        if right_starts and _near(left_starts, left.length, right_starts,
+                                  right.length, distance):
+            files.append(number)
+    return files
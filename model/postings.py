@@ -0,0 +1,153 @@
+from bisect import bisect_left
+
+
+def gallop(postings, target, low=0):
+    """Find the first position at or after low holding a value >= target.
+
+    The search first probes low + 1, low + 2, low + 4, ... (exponential
+    search) until it passes the target, then does a binary search in the last
+    interval. Advancing through a long list in small steps is O(log distance)
+    instead of O(log length), and each probe skips over the values in between
+    just like a skip pointer would.
+
+    Args:
+        postings: A sorted list of integers.
+        target: The value to search for.
+        low: The position to start the search from.
+
+    Returns:
+        The position of the first value >= target, or len(postings) if there
+        is no such value.
+
+    """
+    size = len(postings)
+    if low >= size or postings[low] >= target:
+        return low
+    step = 1
+    high = low + 1
+    while high < size and postings[high] < target:
+        low = high
+        step *= 2
+        high = low + step
+    return bisect_left(postings, target, low + 1, min(high, size))
+
+
+def intersect(first, second):
+    """AND between 2 sorted posting lists.
+
+    The shorter list drives the intersection, and every one of its values is
+    searched for in the longer list by galloping, so two rare terms cost
+    microseconds no matter how long the other lists are.
+
+    Example:
+        intersect([1, 4, 7], [2, 4, 5, 6, 7, 9]) = [4, 7]
+
+    Args:
+        first: A sorted list of integers.
+        second: A sorted list of integers.
+
+    Returns:
+        A new sorted list with the values in both lists.
+
+    """
+    if len(first) > len(second):
+        first, second = second, first
+    result = []
+    position = 0
+    for value in first:
+        position = gallop(second, value, position)
+        if position == len(second):
+            break
+        if second[position] == value:
+            result.append(value)
+            position += 1
+    return result
+
+
+def intersect_all(lists):
+    """AND between any number of sorted posting lists.
+
+    The lists are intersected from the shortest to the longest, and the
+    intersection stops as soon as the result is empty.
+
+    Args:
+        lists: A non-empty iterable of sorted lists of integers.
+
+    Returns:
+        A new sorted list with the values in every list.
+
+    """
+    lists = sorted(lists, key=len)
+    result = lists[0]
+    for postings in lists[1:]:
+        if not result:
+            break
+        result = intersect(result, postings)
+    return list(result)
+
+
+def union(lists):
+    """OR between any number of sorted posting lists.
+
+    The values are gathered in a set and sorted once: with many lists (e.g.
+    the terms a wildcard expands to), this is several times faster than a
+    k-way heap merge, whose every step runs in Python.
+
+    Example:
+        union([[1, 4], [2, 4, 9], [3]]) = [1, 2, 3, 4, 9]
+
+    Args:
+        lists: An iterable of sorted lists of integers.
+
+    Returns:
+        A new sorted list with the values in any of the lists.
+
+    """
+    lists = [postings for postings in lists if postings]
+    if len(lists) == 1:
+        return list(lists[0])
+    return sorted(set().union(*lists))
+
+
+def difference(first, second):
+    """ANDNOT between 2 sorted posting lists: the values in first that are not
+    in second. The values of first are searched in second by galloping.
+
+    Example:
+        difference([1, 4, 7], [2, 4, 5]) = [1, 7]
+
+    Args:
+        first: A sorted list of integers.
+        second: A sorted list of integers.
+
+    Returns:
+        A new sorted list.
+
+    """
+    result = []
+    position = 0
+    for value in first:
+        position = gallop(second, value, position)
+        if position == len(second) or second[position] != value:
+            result.append(value)
+    return result
+
+
+def complement(postings, size):
+    """NOT of a sorted posting list, in the universe of files 1 to size.
+
+    Args:
+        postings: A sorted list of integers between 1 and size.
+        size: The number of files in the universe.
+
+    Returns:
+        A new sorted list with the files that are not in postings.
+
+    """
+    result = []
+    previous = 0
+    for value in postings:
+        result.extend(range(previous + 1, value))
+        previous = value
+    result.extend(range(previous + 1, size + 1))
+    return result
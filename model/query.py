@@ -0,0 +1,959 @@
+from model.list import IndexList
+from model.metrics import NULL_METRICS
+from model.postings import (intersect_all, union, difference, complement)
+from model.vector import BitVector, HAVE_NUMPY
+
+import math
+import re
+import warnings
+
+
+# The ways a query can be evaluated:
+#   dense: every word becomes an IndexList, see 'list.py'.
+#   sparse: every word stays a sorted posting list, see 'postings.py'.
+#   vector: every word becomes a BitVector of NumPy words, see 'vector.py'.
+#   Without NumPy, it falls back to dense.
+#   auto: sparse, unless the dense evaluation is estimated to be cheaper.
+MODES = ('auto', 'sparse', 'dense', 'vector')
+
+# In auto mode, the query is evaluated densely when the postings it touches
+# hold more than this many entries per file in the index. Below that, building
+# the bitmaps costs more than merging the posting lists directly.
+DENSE_RATIO = 2
+
+
+class QuerySyntaxError(ValueError):
+    """Raised when a query can't be parsed. It is a ValueError, so it can be
+    handled like any other wrong query.
+
+    """
+
+    def __init__(self, message, position):
+        """Initialization of the error.
+
+        Args:
+            message: What is wrong with the query.
+            position: The position in the query string where the error was
+            found.
+
+        """
+        super().__init__(f'[Error] Query is wrong at position {position}: '
+                         f'{message}!')
+        self.position = position
+
+
+class Term():
+    """A word in the query."""
+
+    __slots__ = ('word',)
+
+    def __init__(self, word):
+        self.word = word
+
+    def __eq__(self, other):
+        return isinstance(other, Term) and self.word == other.word
+
+    def __hash__(self):
+        return hash((Term, self.word))
+
+    def __repr__(self):
+        return f'Term({self.word!r})'
+
+
+class Phrase():
+    """Words that must appear next to each other, in order ("...")."""
+
+    __slots__ = ('words',)
+
+    def __init__(self, words):
+        self.words = tuple(words)
+
+    def __eq__(self, other):
+        return isinstance(other, Phrase) and self.words == other.words
+
+    def __hash__(self):
+        return hash((Phrase, self.words))
+
+    def __repr__(self):
+        return f'Phrase({list(self.words)!r})'
+
+
+class Near():
+    """2 words or phrases at most distance words apart, in any order
+    (NEAR/distance).
+
+    """
+
+    __slots__ = ('operands', 'distance')
+
+    def __init__(self, operands, distance):
+        self.operands = tuple(operands)
+        self.distance = distance
+
+    def __eq__(self, other):
+        return (isinstance(other, Near) and self.operands == other.operands
+                and self.distance == other.distance)
+
+    def __hash__(self):
+        return hash((Near, self.operands, self.distance))
+
+    def __repr__(self):
+        return f'Near({list(self.operands)!r}, {self.distance})'
+
+
+class Wildcard():
+    """A word with wildcards, which matches every term of the index that
+    fits the pattern: '*' stands for any number of letters and '?' for
+    exactly one (e.g. kern*, *nel, k?rn*l).
+
+    """
+
+    __slots__ = ('pattern',)
+
+    def __init__(self, pattern):
+        self.pattern = pattern
+
+    def __eq__(self, other):
+        return isinstance(other, Wildcard) and self.pattern == other.pattern
+
+    def __hash__(self):
+        return hash((Wildcard, self.pattern))
+
+    def __repr__(self):
+        return f'Wildcard({self.pattern!r})'
+
+
+# The nodes that need the positions of the words in the files
+POSITIONAL = (Phrase, Near)
+
+# The leaves that are looked up as a whole, and keyed by the node itself
+_NODE_LEAVES = POSITIONAL + (Wildcard,)
+
+
+class Not():
+    """The negation (!) of a subquery."""
+
+    __slots__ = ('operand',)
+
+    def __init__(self, operand):
+        self.operand = operand
+
+    def __eq__(self, other):
+        return isinstance(other, Not) and self.operand == other.operand
+
+    def __hash__(self):
+        return hash((Not, self.operand))
+
+    def __repr__(self):
+        return f'Not({self.operand!r})'
+
+
+class _Operator():
+    """Base class for the operators that take 2 or more subqueries."""
+
+    __slots__ = ('operands',)
+
+    def __init__(self, operands):
+        self.operands = tuple(operands)
+
+    def __eq__(self, other):
+        return type(other) is type(self) and self.operands == other.operands
+
+    def __hash__(self):
+        return hash((type(self), self.operands))
+
+    def __repr__(self):
+        return f'{type(self).__name__}({list(self.operands)!r})'
+
+
+class And(_Operator):
+    """The conjunction (&&) of 2 or more subqueries."""
+
+    __slots__ = ()
+
+
+class Or(_Operator):
+    """The disjunction (||) of 2 or more subqueries."""
+
+    __slots__ = ()
+
+
+class Constant():
+    """A subquery the planner found to match no file (Constant(False)), or
+    every file (Constant(True)), see plan.
+
+    """
+
+    __slots__ = ('value',)
+
+    def __init__(self, value):
+        self.value = value
+
+    def __eq__(self, other):
+        return isinstance(other, Constant) and self.value == other.value
+
+    def __hash__(self):
+        return hash((Constant, self.value))
+
+    def __repr__(self):
+        return f'Constant({self.value!r})'
+
+
+# Every token is either a word (that may have wildcards), a quoted phrase
+# (the second group is empty if the closing quote is missing) or one of these
+# operators
+_TOKEN_REGEX = re.compile(
+        r'\s*(?:(NEAR/\d+)|([\w*?]+)|"([^"]*)("?)|(&&|\|\||!|\(|\)))')
+_WORD_REGEX = re.compile(r'\w+')
+_WILDCARDS = '*?'
+
+
+def tokenize(query):
+    """Split a query into tokens.
+
+    Args:
+        query: The query string.
+
+    Returns:
+        A list of (kind, value, position) tuples, where kind is 'word',
+        'phrase' (and value the words of the phrase, in a tuple) or
+        'operator', ending with an ('end', '', len(query)) token.
+
+    Raises:
+        QuerySyntaxError: If the query contains an unknown character.
+
+    """
+    tokens = []
+    position = 0
+    while position < len(query):
+        match = _TOKEN_REGEX.match(query, position)
+        if match is None:
+            rest = query[position:]
+            if not rest.strip():
+                break
+            position += len(rest) - len(rest.lstrip())
+            raise QuerySyntaxError(
+                    f'unexpected character "{query[position]}"', position)
+        near, word, phrase, closed, operator = match.groups()
+        if near is not None:
+            tokens.append(('operator', near, match.start(1)))
+        elif word is not None:
+            tokens.append(('word', word, match.start(2)))
+        elif phrase is not None:
+            start = match.start(3) - 1
+            if not closed:
+                raise QuerySyntaxError('missing closing quote', start)
+            if any(wildcard in phrase for wildcard in _WILDCARDS):
+                raise QuerySyntaxError('phrases can\'t have wildcards', start)
+            words = tuple(_WORD_REGEX.findall(phrase))
+            if not words:
+                raise QuerySyntaxError('empty phrase', start)
+            tokens.append(('phrase', words, start))
+        else:
+            tokens.append(('operator', operator, match.start(5)))
+        position = match.end()
+    tokens.append(('end', '', len(query)))
+    return tokens
+
+
+class _Parser():
+    """A recursive descent parser for the query grammar:
+
+        or_query  := and_query ('||' and_query)*
+        and_query := unary ('&&' unary)*
+        unary     := '!' unary | '(' or_query ')' | near
+        near      := wildcard | phrase ('NEAR/' distance phrase)?
+        phrase    := word | '"' word+ '"'
+        wildcard  := a word with '*' or '?' in it
+        distance  := an integer, at least 1
+
+    So NEAR binds tighter than !, which binds tighter than &&, which binds
+    tighter than ||.
+
+    """
+
+    def __init__(self, query):
+        self._tokens = tokenize(query)
+        self._position = 0
+
+    def parse(self):
+        node = self._or_query()
+        kind, value, position = self._peek()
+        if kind != 'end':
+            raise QuerySyntaxError(f'unexpected "{value}"', position)
+        return node
+
+    def _peek(self):
+        return self._tokens[self._position]
+
+    def _accept(self, operator):
+        kind, value, _ = self._peek()
+        if kind == 'operator' and value == operator:
+            self._position += 1
+            return True
+        return False
+
+    def _or_query(self):
+        operands = [self._and_query()]
+        while self._accept('||'):
+            operands.append(self._and_query())
+        return operands[0] if len(operands) == 1 else Or(operands)
+
+    def _and_query(self):
+        operands = [self._unary()]
+        while self._accept('&&'):
+            operands.append(self._unary())
+        return operands[0] if len(operands) == 1 else And(operands)
+
+    def _unary(self):
+        kind, value, position = self._peek()
+        if self._accept('!'):
+            return Not(self._unary())
+        if self._accept('('):
+            node = self._or_query()
+            if not self._accept(')'):
+                _, value, position = self._peek()
+                raise QuerySyntaxError(
+                        f'expected ")" but found "{value}"', position)
+            return node
+        return self._near()
+
+    def _near(self):
+        kind, value, position = self._peek()
+        if kind == 'word' and any(wildcard in value
+                                  for wildcard in _WILDCARDS):
+            self._position += 1
+            if not value.strip(_WILDCARDS):
+                raise QuerySyntaxError('a wildcard needs at least one '
+                                       'letter', position)
+            node = Wildcard(value)
+        else:
+            node = self._phrase()
+        kind, value, position = self._peek()
+        if kind == 'operator' and value.startswith('NEAR/'):
+            if isinstance(node, Wildcard):
+                raise QuerySyntaxError('NEAR can\'t join wildcards',
+                                       position)
+            distance = int(value[len('NEAR/'):])
+            if distance < 1:
+                raise QuerySyntaxError('NEAR needs a distance of at least 1',
+                                       position)
+            self._position += 1
+            node = Near([node, self._phrase()], distance)
+            kind, value, position = self._peek()
+            if kind == 'operator' and value.startswith('NEAR/'):
+                raise QuerySyntaxError('NEAR can only join 2 words or '
+                                       'phrases', position)
+        return node
+
+    def _phrase(self):
+        kind, value, position = self._peek()
+        if kind == 'word' and any(wildcard in value
+                                  for wildcard in _WILDCARDS):
+            raise QuerySyntaxError('NEAR can\'t join wildcards', position)
+        if kind == 'word':
+            self._position += 1
+            return Term(value)
+        if kind == 'phrase':
+            self._position += 1
+            return Term(value[0]) if len(value) == 1 else Phrase(value)
+        if kind == 'end':
+            raise QuerySyntaxError('unexpected end of query', position)
+        raise QuerySyntaxError(f'expected a word but found "{value}"',
+                               position)
+
+
+def parse(query):
+    """Parse a query into its syntax tree.
+
+    Args:
+        query: The query string.
+
+    Returns:
+        The root node of the tree (a Term, Phrase, Near, Wildcard, Not, And
+        or Or).
+
+    Raises:
+        QuerySyntaxError: If the query is wrong.
+
+    """
+    return _Parser(query).parse()
+
+
+def iter_terms(node):
+    """Yield every Term in a syntax tree, from left to right. The words of
+    phrases are yielded as Terms too, but not the Wildcards.
+
+    """
+    if isinstance(node, Term):
+        yield node
+    elif isinstance(node, Phrase):
+        yield from map(Term, node.words)
+    elif isinstance(node, Wildcard):
+        return
+    elif isinstance(node, Not):
+        yield from iter_terms(node.operand)
+    else:
+        for operand in node.operands:
+            yield from iter_terms(operand)
+
+
+def iter_leaves(node):
+    """Yield every Term, Phrase, Near and Wildcard node in a syntax tree,
+    from left to right. These are the nodes that are looked up in the index.
+
+    """
+    if isinstance(node, (Term,) + _NODE_LEAVES):
+        yield node
+    elif isinstance(node, Not):
+        yield from iter_leaves(node.operand)
+    else:
+        for operand in node.operands:
+            yield from iter_leaves(operand)
+
+
+def canonical(node):
+    """Return the canonical form of a syntax tree, so that queries that only
+    differ in the way they are written have the same tree.
+
+    The words are lowercased, nested operators of the same kind are
+    flattened, the operands of && and || are deduplicated and sorted (they
+    commute), and double negations are removed:
+        canonical(parse('B && (a && b)')) == And([Term('a'), Term('b')])
+
+    Args:
+        node: The root node of a syntax tree.
+
+    Returns:
+        The root node of the canonical tree. Nodes are hashable, so it can be
+        used as a dictionary key.
+
+    """
+    if isinstance(node, Term):
+        return Term(node.word.lower())
+    if isinstance(node, Phrase):
+        return Phrase(word.lower() for word in node.words)
+    if isinstance(node, Wildcard):
+        return Wildcard(node.pattern.lower())
+    if isinstance(node, Near):
+        # NEAR doesn't care about the order of its operands
+        return Near(sorted(map(canonical, node.operands), key=repr),
+                    node.distance)
+    if isinstance(node, Not):
+        operand = canonical(node.operand)
+        return operand.operand if isinstance(operand, Not) else Not(operand)
+
+    operands = set()
+    for operand in node.operands:
+        operand = canonical(operand)
+        if type(operand) is type(node):
+            operands.update(operand.operands)
+        else:
+            operands.add(operand)
+    if len(operands) == 1:
+        return operands.pop()
+    return type(node)(sorted(operands, key=repr))
+
+
+def _leaf_key(node):
+    """Return the key of a leaf in the dictionaries of posting lists: the
+    word for a Term, the node itself for the others.
+
+    """
+    return node.word if isinstance(node, Term) else node
+
+
+def plan(node, postings, size):
+    """Rewrite a syntax tree into the tree that is cheapest to evaluate on
+    posting lists, given the number of files every leaf matches:
+      - negations are pushed down to the leaves (De Morgan), so every ! is
+      on a leaf, and a && !b is evaluated as a difference (ANDNOT), never as
+      a complement;
+      - nested operators of the same kind are flattened and their operands
+      deduplicated;
+      - the leaves that match no file or every file become Constants, which
+      are folded away (a && <nothing> is nothing, a || <nothing> is a), as
+      are a && !a and a || !a;
+      - the operands of && are sorted from the one estimated to match the
+      fewest files, so the evaluation can stop at the first empty result.
+
+    Args:
+        node: The root node of a syntax tree.
+        postings: A dictionary of the leaves of the tree (the words for the
+        Terms) to their sorted posting lists.
+        size: The number of files in the index.
+
+    Returns:
+        The root node of the planned tree. It has the same result as node.
+
+    """
+    return _plan(node, False, postings, size)
+
+
+def _plan(node, negated, postings, size):
+    if isinstance(node, Not):
+        return _plan(node.operand, not negated, postings, size)
+    if isinstance(node, Constant):
+        return Constant(node.value != negated)
+    if not isinstance(node, _Operator):
+        frequency = len(postings[_leaf_key(node)])
+        if frequency == 0 or frequency == size:
+            return Constant((frequency == size) != negated)
+        return Not(node) if negated else node
+
+    # !(a && b) == !a || !b, and !(a || b) == !a && !b
+    kind = type(node)
+    if negated:
+        kind = Or if kind is And else And
+    # The constant that decides the result on its own (nothing for &&,
+    # everything for ||), and the one that changes nothing
+    absorbing = Constant(kind is Or)
+    identity = Constant(kind is And)
+
+    operands = {}
+    for operand in node.operands:
+        planned = _plan(operand, negated, postings, size)
+        for part in (planned.operands if type(planned) is kind
+                     else (planned,)):
+            if part == absorbing:
+                return absorbing
+            if part != identity:
+                operands[part] = None
+    for operand in operands:
+        # a && !a matches no file, a || !a every file
+        if isinstance(operand, Not) and operand.operand in operands:
+            return absorbing
+    if not operands:
+        return identity
+    if len(operands) == 1:
+        return next(iter(operands))
+    operands = list(operands)
+    if kind is And:
+        operands.sort(key=lambda operand: estimate(operand, postings,
+                                                   size)[0])
+    return kind(operands)
+
+
+def _gallop_cost(short, long):
+    """The estimated number of steps to intersect 2 posting lists by
+    galloping through the longer one (see intersect in postings.py).
+
+    """
+    if short < 1:
+        return 0
+    return short * (1 + math.log2(1 + long / short))
+
+
+def estimate(node, postings, size):
+    """Estimate how many files a planned tree matches, and how much it costs
+    to evaluate it on posting lists, assuming the words appear in the files
+    independently of each other.
+
+    Args:
+        node: The root node of a tree returned by plan.
+        postings: The posting lists of the leaves, as for plan.
+        size: The number of files in the index.
+
+    Returns:
+        A (files, cost) tuple, where cost is roughly the number of postings
+        the evaluation goes through.
+
+    """
+    if isinstance(node, Constant):
+        return (size if node.value else 0), 0
+    if isinstance(node, Not):
+        files, cost = estimate(node.operand, postings, size)
+        return size - files, cost
+    if not isinstance(node, _Operator):
+        return len(postings[_leaf_key(node)]), 0
+
+    estimates = [estimate(operand, postings, size)
+                 for operand in node.operands]
+    cost = sum(cost for _, cost in estimates)
+    # The files of the operands, with the ones of the negated operands
+    # (that are evaluated as a list of the files they don't match)
+    files = [files for files, _ in estimates]
+    negative = [size - files
+                for operand, (files, _) in zip(node.operands, estimates)
+                if isinstance(operand, Not)]
+    positive = [files for operand, (files, _) in zip(node.operands, estimates)
+                if not isinstance(operand, Not)]
+    if isinstance(node, Or):
+        unmatched = size * math.prod(1 - part / size for part in files)
+        return size - unmatched, cost + sum(positive) + sum(negative)
+
+    if positive:
+        result = positive[0]
+        for part in positive[1:]:
+            cost += _gallop_cost(min(result, part), max(result, part))
+            result = result * part / size
+    else:
+        result = size
+    if negative:
+        # a && !b && !c == a - (b || c)
+        cost += sum(negative) + (result if positive else 0)
+        result = result * math.prod(1 - part / size for part in negative)
+    return result, cost
+
+
+def _is_negated(node):
+    """Whether evaluating a planned tree on posting lists gives the files it
+    does NOT match, which must then be complemented.
+
+    """
+    if isinstance(node, Not):
+        return True
+    if isinstance(node, And):
+        return all(isinstance(operand, Not) for operand in node.operands)
+    if isinstance(node, Or):
+        return any(isinstance(operand, Not) for operand in node.operands)
+    return isinstance(node, Constant) and node.value
+
+
+def _explain(node, postings, size, depth, lines):
+    """Add the lines of explain for a node and its operands to lines."""
+    files, cost = estimate(node, postings, size)
+    if isinstance(node, And) and any(isinstance(operand, Not)
+                                     for operand in node.operands):
+        name = 'ANDNOT'
+    elif isinstance(node, _Operator):
+        name = type(node).__name__.upper()
+    elif isinstance(node, Not):
+        name = 'NOT'
+    else:
+        name = repr(node)
+    lines.append(f'{"  " * depth}{name}: ~{round(files)} files, '
+                 f'cost {round(cost)}')
+    if isinstance(node, Not):
+        _explain(node.operand, postings, size, depth + 1, lines)
+    elif isinstance(node, _Operator):
+        for operand in node.operands:
+            _explain(operand, postings, size, depth + 1, lines)
+
+
+def _get_node_postings(index, node):
+    """Return the sorted numbers of the files a Phrase, Near or Wildcard
+    node matches in an index.
+
+    """
+    if isinstance(node, Wildcard):
+        return index._get_wildcard_postings(node.pattern)
+    return index._get_positional_postings(node)
+
+
+class CompiledQuery():
+    """A query parsed once into a syntax tree, which can then be executed any
+    number of times against an Index.
+
+    """
+
+    def __init__(self, query):
+        """Initialization of the compiled query.
+
+        _query: The original query string.
+
+        _ast: The syntax tree of the query.
+
+        _canonical: The canonical form of the tree, computed the first time
+        it is needed.
+
+        Args:
+            query: The query string.
+
+        Raises:
+            QuerySyntaxError: If the query is wrong.
+
+        """
+        self._query = query
+        self._ast = parse(query)
+        self._canonical = None
+
+    @property
+    def query(self):
+        return self._query
+
+    @property
+    def ast(self):
+        return self._ast
+
+    @property
+    def canonical(self):
+        """The canonical syntax tree of the query, see canonical."""
+        if self._canonical is None:
+            self._canonical = canonical(self._ast)
+        return self._canonical
+
+    @property
+    def terms(self):
+        """The distinct words in the query, in order of appearance."""
+        return list(dict.fromkeys(term.word for term in iter_terms(self._ast)))
+
+    def execute(self, index):
+        """Evaluate the query against an index.
+
+        Every distinct word is looked up only once.
+
+        Args:
+            index: The Index to evaluate the query against.
+
+        Returns:
+            An IndexList with 1's for the files that match the query.
+
+        """
+        lists = {}
+        for leaf in dict.fromkeys(iter_leaves(self._ast)):
+            if isinstance(leaf, Term):
+                lists[leaf.word] = index._get_index_list_for_word(leaf.word)
+            else:
+                lists[leaf] = IndexList.from_postings(
+                        _get_node_postings(index, leaf), len(index._files))
+        return self._evaluate(self._ast, lists)
+
+    def documents(self, index, mode='auto', cache=None,
+                  metrics=NULL_METRICS, vectors=None):
+        """Evaluate the query against an index and return the matching files.
+
+        In sparse mode the posting lists are never expanded to the size of the
+        index: AND is done by galloping through the longer lists, OR by a
+        heap merge, and a NOT is kept as a flag on its operand (a lazy
+        difference from all the files) until an AND turns it into a
+        difference, or until the very end when the complement is needed.
+
+        In vector mode every word becomes a packed array of bits, and every
+        operator a single NumPy operation over the whole array. If vectors
+        is given, the bit arrays of the words, and of every && and || of the
+        canonical tree, are kept in it, so a batch of queries builds each of
+        them only once.
+
+        If a cache is given, the canonical tree of the query is evaluated,
+        and in sparse mode the result of every && and || in it is looked up
+        in the cache first, so a clause shared by many queries is only
+        evaluated once. The cache must be cleared when the index changes.
+
+        Args:
+            index: The Index to evaluate the query against.
+            mode: One of 'auto', 'sparse', 'dense' or 'vector', see MODES.
+            cache: An LRUCache for the results of subqueries, keyed by their
+            canonical tree.
+            metrics: A Metrics to record the time spent looking up the words
+            ('query.lookup'), building IndexLists ('query.build') and
+            evaluating the query ('query.evaluate') to.
+            vectors: A dictionary to keep the BitVectors of vector mode in,
+            for the next queries. It must be cleared when the index changes.
+
+        Returns:
+            The sorted numbers (starting from 1) of the files that match.
+
+        Raises:
+            ValueError: If the mode is unknown.
+
+        """
+        if mode not in MODES:
+            raise ValueError(f'[Error] Unknown query mode "{mode}"!')
+        if mode == 'vector' and not HAVE_NUMPY:
+            warnings.warn('[Warning] NumPy is not installed, the query is '
+                          'evaluated in dense mode instead!', RuntimeWarning)
+            mode = 'dense'
+
+        size = len(index._files)
+        ast = self._ast if cache is None else self.canonical
+        with metrics.timer('query.lookup'):
+            postings = self._lookup(index, ast)
+
+        if mode == 'auto':
+            total = sum(len(postings[word]) for word in postings)
+            mode = 'dense' if total > size * DENSE_RATIO else 'sparse'
+
+        if mode == 'dense':
+            with metrics.timer('query.build'):
+                lists = {word: IndexList.from_postings(postings[word], size)
+                         for word in postings}
+            with metrics.timer('query.evaluate'):
+                result = self._evaluate(ast, lists)
+                return [position + 1 for position in result.positions()]
+
+        if mode == 'vector':
+            if vectors is None:
+                vectors = {}
+            with metrics.timer('query.build'):
+                for word in postings:
+                    if word not in vectors:
+                        vectors[word] = BitVector.from_postings(
+                                postings[word], size)
+            with metrics.timer('query.evaluate'):
+                result = self._evaluate_vectors(ast, vectors,
+                                                cache is not None)
+                # Counting the files set is cheaper than looking for them
+                if not result.cardinality():
+                    return []
+                return [position + 1 for position in result.positions()]
+
+        with metrics.timer('query.plan'):
+            ast = plan(ast, postings, size)
+        with metrics.timer('query.evaluate'):
+            result, negated = self._evaluate_sparse(ast, postings, cache)
+            if negated:
+                result = complement(result, size)
+            return result
+
+    def _lookup(self, index, ast):
+        """Return a dictionary of the leaves of a tree (the words for the
+        Terms) to their posting lists in an index. Every distinct leaf is
+        looked up only once.
+
+        """
+        postings = {}
+        for leaf in dict.fromkeys(iter_leaves(ast)):
+            if isinstance(leaf, Term):
+                postings[leaf.word] = index._get_postings(leaf.word)
+            else:
+                postings[leaf] = _get_node_postings(index, leaf)
+        return postings
+
+    def explain(self, index):
+        """Describe how the query would be evaluated on posting lists
+        against an index: the tree chosen by plan, with the number of files
+        every node is estimated to match and the cost of evaluating it.
+
+        Example:
+            For 'b && !(a || c)' in an index of 10 files, where a appears in
+            6 files, b in 3 and c in none:
+                ANDNOT: ~1 files, cost 9
+                  Term('b'): ~3 files, cost 0
+                  NOT: ~4 files, cost 0
+                    Term('a'): ~6 files, cost 0
+
+        Args:
+            index: The Index the query would be evaluated against.
+
+        Returns:
+            The plan, as a string with one line per node.
+
+        """
+        size = len(index._files)
+        postings = self._lookup(index, self._ast)
+        planned = plan(self._ast, postings, size)
+        lines = []
+        _explain(planned, postings, size, 0, lines)
+        if _is_negated(planned):
+            lines.append(f'COMPLEMENT: cost {size}')
+        return '\n'.join(lines)
+
+    def _evaluate(self, node, lists):
+        if isinstance(node, Term):
+            return lists[node.word]
+        if isinstance(node, _NODE_LEAVES):
+            return lists[node]
+        if isinstance(node, Not):
+            return ~self._evaluate(node.operand, lists)
+        result = self._evaluate(node.operands[0], lists)
+        for operand in node.operands[1:]:
+            if isinstance(node, Or):
+                result = result | self._evaluate(operand, lists)
+            else:
+                result = result & self._evaluate(operand, lists)
+        return result
+
+    def _evaluate_vectors(self, node, vectors, shared):
+        """Evaluate a node on BitVectors.
+
+        Args:
+            node: The node.
+            vectors: The BitVectors of the words, by word (or by node for the
+            other leaves).
+            shared: Whether the tree is canonical, so the result of every &&
+            and || can be kept in vectors for the next queries.
+
+        """
+        if isinstance(node, Term):
+            return vectors[node.word]
+        if isinstance(node, _NODE_LEAVES):
+            return vectors[node]
+        if isinstance(node, Not):
+            return ~self._evaluate_vectors(node.operand, vectors, shared)
+        if shared and node in vectors:
+            return vectors[node]
+        operands = [self._evaluate_vectors(operand, vectors, shared)
+                    for operand in node.operands]
+        result = operands[0]
+        for operand in operands[1:]:
+            result = (result | operand if isinstance(node, Or)
+                      else result & operand)
+        if shared:
+            vectors[node] = result
+        return result
+
+    def _evaluate_sparse(self, node, postings, cache=None):
+        """Evaluate a node on posting lists.
+
+        Returns:
+            A (files, negated) tuple. If negated is True, the node matches
+            every file that is NOT in files.
+
+        """
+        if isinstance(node, Term):
+            return postings[node.word], False
+        if isinstance(node, _NODE_LEAVES):
+            return postings[node], False
+        if isinstance(node, Constant):
+            # Everything is the complement of nothing
+            return [], node.value
+        if isinstance(node, Not):
+            result, negated = self._evaluate_sparse(node.operand, postings,
+                                                    cache)
+            return result, not negated
+
+        if cache is not None:
+            cached = cache.get(node)
+            if cached is None:
+                cached = self._evaluate_operator(node, postings, cache)
+                cache.put(node, cached)
+            return cached
+        return self._evaluate_operator(node, postings, cache)
+
+    def _evaluate_operator(self, node, postings, cache):
+        if isinstance(node, And):
+            return self._evaluate_and(node, postings, cache)
+        positive = []
+        negative = []
+        for operand in node.operands:
+            result, negated = self._evaluate_sparse(operand, postings, cache)
+            (negative if negated else positive).append(result)
+
+        if not negative:
+            return union(positive), False
+        # !a || !b == !(a && b), and !a || b == !(a - b)
+        result = intersect_all(negative)
+        if positive and result:
+            result = difference(result, union(positive))
+        return result, True
+
+    def _evaluate_and(self, node, postings, cache):
+        """Evaluate the operands of a && in order, intersecting them as they
+        come, and stop as soon as the result is empty. The operands that
+        are negated are only evaluated once the others are intersected.
+
+        """
+        result = None
+        negative = []
+        for operand in sorted(node.operands,
+                              key=lambda operand: isinstance(operand, Not)):
+            files, negated = self._evaluate_sparse(operand, postings, cache)
+            if negated:
+                negative.append(files)
+                continue
+            result = files if result is None else intersect_all([result,
+                                                                 files])
+            if not result:
+                return [], False
+
+        if result is None:
+            # !a && !b == !(a || b)
+            return union(negative), True
+        if negative:
+            # a && !b == a - b
+            result = difference(result, union(negative))
+        return list(result), False
+
+    def __repr__(self):
+        return f'CompiledQuery({self._query!r})'
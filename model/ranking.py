@@ -0,0 +1,287 @@
+from model.postings import gallop
+from model.query import Term, Phrase, Wildcard, Not, Or
+
+import heapq
+import math
+
+
+# The BM25 parameters: K1 limits how much a term that is repeated in a file
+# adds to its score, and B how much the length of the file is taken into
+# account (0 not at all, 1 fully)
+K1 = 1.2
+B = 0.75
+
+
+class BM25():
+    """The BM25 scoring function, for the files of an index.
+
+    The score of a file for a query is the sum, over the words of the query
+    that appear in the file, of:
+        idf * tf * (K1 + 1) / (tf + K1 * (1 - B + B * length / avgdl))
+    where tf is the number of times the word appears in the file, length is
+    the number of words in the file, avgdl the average length of the files,
+    and idf = ln(1 + (N - df + 0.5) / (df + 0.5)), with N the number of files
+    and df the number of files the word appears in.
+
+    """
+
+    def __init__(self, lengths, k1=K1, b=B):
+        """Initialization of the scoring function.
+
+        _lengths: The number of words in every file, in the order of the
+        files. A length of 0 means the length is not known (e.g. for an index
+        built without term frequencies), and the average length is used
+        instead.
+
+        _average_length, _min_length: The average and the minimum of the
+        known lengths.
+
+        Args:
+            lengths: The lengths of the files, in order.
+            k1: The K1 parameter.
+            b: The B parameter.
+
+        """
+        self._lengths = lengths
+        self._k1 = k1
+        self._b = b
+        known = [length for length in lengths if length]
+        self._average_length = sum(known) / len(known) if known else 1.0
+        self._min_length = min(known) if known else self._average_length
+
+    @property
+    def documents(self):
+        """The number of files."""
+        return len(self._lengths)
+
+    def idf(self, document_frequency):
+        """Return the inverse document frequency of a word that appears in
+        document_frequency files.
+
+        """
+        return math.log(1 + (self.documents - document_frequency + 0.5)
+                        / (document_frequency + 0.5))
+
+    def length(self, number):
+        """Return the length of a file, given its number (starting from 1)."""
+        length = self._lengths[number - 1] if number <= len(self._lengths) \
+            else 0
+        return length or self._average_length
+
+    def score(self, idf, frequency, length):
+        """Return the score of a word for a file.
+
+        Args:
+            idf: The inverse document frequency of the word.
+            frequency: How many times the word appears in the file.
+            length: The length of the file.
+
+        """
+        norm = self._k1 * (1 - self._b + self._b * length
+                           / self._average_length)
+        return idf * frequency * (self._k1 + 1) / (frequency + norm)
+
+    def upper_bound(self, idf, max_frequency):
+        """Return the highest score a word can have for any file, given the
+        highest number of times it appears in a file.
+
+        The score grows with the frequency and shrinks with the length of the
+        file, so the bound is the score of the highest frequency in the
+        shortest file. It is raised a little, so rounding errors never make
+        it lower than a real score.
+
+        """
+        return self.score(idf, max_frequency, self._min_length) * (1 + 1e-9)
+
+
+class TermCursor():
+    """Walks through the posting list of a word of a ranked query, and scores
+    the files it appears in.
+
+    """
+
+    __slots__ = ('postings', 'frequencies', 'idf', 'upper_bound', 'position')
+
+    def __init__(self, postings, frequencies, idf, upper_bound):
+        """Initialization of the cursor.
+
+        Args:
+            postings: The sorted numbers of the files the word appears in.
+            frequencies: How many times the word appears in each one of them,
+            or None if not known (every frequency is then 1).
+            idf: The inverse document frequency of the word.
+            upper_bound: The highest score the word can have.
+
+        """
+        self.postings = postings
+        self.frequencies = frequencies
+        self.idf = idf
+        self.upper_bound = upper_bound
+        self.position = 0
+
+    @property
+    def number(self):
+        """The file the cursor is on, or None if it is past the end."""
+        if self.position < len(self.postings):
+            return self.postings[self.position]
+        return None
+
+    def advance(self, target):
+        """Move to the first file >= target."""
+        self.position = gallop(self.postings, target, self.position)
+
+    def score(self, bm25):
+        """Return the score of the word for the file the cursor is on."""
+        frequency = (self.frequencies[self.position]
+                     if self.frequencies is not None else 1)
+        return bm25.score(self.idf, frequency,
+                          bm25.length(self.postings[self.position]))
+
+
+def scoring_words(node):
+    """Return the distinct words that add to the score of a file for a
+    query, that is the words (and the words of the phrases) that are not
+    negated, in order of appearance. Wildcards are returned as Wildcard
+    nodes, to be expanded into the terms they match.
+
+    """
+    words = {}
+
+    def visit(node):
+        if isinstance(node, Term):
+            words[node.word] = None
+        elif isinstance(node, Wildcard):
+            words[node] = None
+        elif isinstance(node, Phrase):
+            words.update(dict.fromkeys(node.words))
+        elif not isinstance(node, Not):
+            for operand in node.operands:
+                visit(operand)
+
+    visit(node)
+    return list(words)
+
+
+def is_disjunction(node):
+    """Whether a query is a single word, or words joined by ||. The files
+    that match such a query are exactly the files that get a score. A
+    wildcard counts as the || of the terms it matches.
+
+    """
+    if isinstance(node, (Term, Wildcard)):
+        return True
+    return isinstance(node, Or) and all(isinstance(operand, (Term, Wildcard))
+                                        for operand in node.operands)
+
+
+def _offer(heap, k, number, score):
+    """Add a scored file to the top-k heap, if it gets in. The heap holds
+    (score, -number) tuples, so among equal scores the later file is evicted
+    first.
+
+    """
+    if len(heap) < k:
+        heapq.heappush(heap, (score, -number))
+    elif score > heap[0][0]:
+        heapq.heapreplace(heap, (score, -number))
+
+
+def _sorted_results(heap):
+    """Return the (number, score) pairs of a top-k heap, best first."""
+    return [(-negated, score) for score, negated in sorted(
+            heap, key=lambda entry: (-entry[0], -entry[1]))]
+
+
+def top_k_wand(cursors, k, bm25):
+    """Return the k best files for a disjunction of words, with WAND.
+
+    The cursors are kept sorted by the file they are on. Going through them
+    in that order, the pivot is the first cursor at which the upper bounds
+    add up to more than the lowest score in the top k: no file before the
+    pivot file can get in, so the cursors before the pivot jump straight to
+    it, skipping the files in between without scoring them.
+
+    Args:
+        cursors: A TermCursor for every word of the query.
+        k: How many files to return.
+        bm25: The BM25 to score the files with.
+
+    Returns:
+        A list of (number, score) pairs of the best files, best first. Among
+        files with the same score, the earlier files come first.
+
+    """
+    heap = []
+    cursors = [cursor for cursor in cursors if cursor.postings]
+    while cursors:
+        cursors.sort(key=lambda cursor: cursor.number)
+        if len(heap) < k:
+            pivot = 0
+        else:
+            threshold = heap[0][0]
+            bound = 0.0
+            for pivot, cursor in enumerate(cursors):
+                bound += cursor.upper_bound
+                if bound > threshold:
+                    break
+            else:
+                # Not even all the words together can beat the top k
+                break
+
+        pivot_number = cursors[pivot].number
+        if cursors[0].number == pivot_number:
+            score = 0.0
+            for cursor in cursors:
+                if cursor.number == pivot_number:
+                    score += cursor.score(bm25)
+                    cursor.position += 1
+            _offer(heap, k, pivot_number, score)
+        else:
+            for cursor in cursors[:pivot]:
+                cursor.advance(pivot_number)
+        cursors = [cursor for cursor in cursors if cursor.number is not None]
+    return _sorted_results(heap)
+
+
+def top_k_max_score(cursors, candidates, k, bm25):
+    """Return the k best files among the files that match a query, with
+    MaxScore.
+
+    The words are tried from the highest upper bound to the lowest. As soon
+    as the score of a file plus the upper bounds of the words not tried yet
+    can't beat the lowest score in the top k, the file is skipped, and the
+    cursors of the remaining words are not moved at all. When the upper
+    bounds of all the words can't beat it, the search stops.
+
+    Args:
+        cursors: A TermCursor for every word that adds to the score.
+        candidates: The sorted numbers of the files that match the query.
+        k: How many files to return.
+        bm25: The BM25 to score the files with.
+
+    Returns:
+        A list of (number, score) pairs, as in top_k_wand.
+
+    """
+    cursors = sorted(cursors, key=lambda cursor: -cursor.upper_bound)
+    # remaining[i] is the sum of the upper bounds of cursors[i:]
+    remaining = [0.0] * (len(cursors) + 1)
+    for position in range(len(cursors) - 1, -1, -1):
+        remaining[position] = (remaining[position + 1]
+                               + cursors[position].upper_bound)
+
+    heap = []
+    for number in candidates:
+        full = len(heap) == k
+        if full and remaining[0] <= heap[0][0]:
+            break
+        score = 0.0
+        for position, cursor in enumerate(cursors):
+            if full and score + remaining[position] <= heap[0][0]:
+                break
+            cursor.advance(number)
+            if cursor.number == number:
+                score += cursor.score(bm25)
+        else:
+            _offer(heap, k, number, score)
+    return _sorted_results(heap)
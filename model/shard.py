@@ -0,0 +1,307 @@
+from model.documents import DocumentTable
+from model.index import Index
+from model.query import CompiledQuery, MODES
+
+from array import array
+from heapq import merge
+import multiprocessing
+import os
+import threading
+import zlib
+
+
+def _serve_shard(connection, kwargs):
+    """Run a shard: build an Index in this process, and answer the requests
+    of the ShardedIndex on the connection until it is closed.
+
+    Every request is an (operation, args) tuple, answered with (True,
+    result), or with (False, exception) if the operation raised.
+
+    """
+    index = Index(**kwargs)
+    operations = {
+        'add_file': index.add_file,
+        # The shards are already running in parallel
+        'add_files': lambda file_names: index.add_files(file_names,
+                                                        workers=1),
+        'numbers': index._get_numbers_for_query,
+        'top': index._get_top_numbers,
+        'freeze': index.freeze,
+    }
+    while True:
+        try:
+            operation, args = connection.recv()
+        except EOFError:
+            break
+        if operation == 'close':
+            break
+        try:
+            response = (True, operations[operation](*args))
+        except Exception as e:
+            response = (False, e)
+        try:
+            connection.send(response)
+        except Exception as e:
+            # The exception could not be pickled
+            connection.send((False, ValueError(f'[Error] {e!r}')))
+    connection.close()
+
+
+class ShardedIndex():
+    """An index split in shards, each one an Index living in its own worker
+    process, so indexing and querying use many CPUs.
+
+    Every file goes to one shard, picked from the CRC-32 of its name, so the
+    same file always goes to the same shard. A query is sent to all the
+    shards at once, which evaluate it in parallel, and their results are
+    merged in this process, in the order the files were added.
+
+    Ranked queries (top_k) take the k best files of every shard and keep
+    the k best of them. The BM25 scores are computed by every shard from its
+    own files, so with few files per shard they may differ a little from the
+    ones of a single Index.
+
+    """
+
+    def __init__(self, shards=None, **kwargs):
+        """Initialization of the index.
+
+        _documents: A DocumentTable with the names of all the files, in the
+        order they were added.
+
+        _numbers: For every shard, an array of the numbers (in _documents)
+        of its files, in the order of the files in the shard.
+
+        _connections, _processes: The connections to the worker processes
+        running the shards, and the processes.
+
+        _lock: Makes sure only one request at a time is sent to the shards.
+
+        Args:
+            shards: The number of shards. Defaults to the number of CPUs.
+            kwargs: The arguments of the Index of every shard (e.g.
+            positions=True).
+
+        """
+        if shards is None:
+            shards = os.cpu_count() or 1
+        if shards < 1:
+            raise ValueError('[Error] The number of shards must be a '
+                             'positive integer!')
+
+        self._documents = DocumentTable()
+        self._numbers = [array('Q') for _ in range(shards)]
+        self._connections = []
+        self._processes = []
+        self._lock = threading.Lock()
+        for _ in range(shards):
+            connection, child = multiprocessing.Pipe()
+            process = multiprocessing.Process(target=_serve_shard,
+                                              args=(child, kwargs),
+                                              daemon=True)
+            process.start()
+            child.close()
+            self._connections.append(connection)
+            self._processes.append(process)
+
+    @property
+    def shards(self):
+        """The number of files in every shard."""
+        return [len(numbers) for numbers in self._numbers]
+
+    def __len__(self):
+        """The number of files in the index."""
+        return len(self._documents)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _shard(self, file_name):
+        """Return the shard a file goes to."""
+        data = file_name.encode('utf-8', 'surrogatepass')
+        return zlib.crc32(data) % len(self._connections)
+
+    def _request(self, requests):
+        """Send requests to the shards, all of them before waiting for any
+        response, so the shards work in parallel.
+
+        Args:
+            requests: A dictionary of the shards to their (operation, args)
+            requests.
+
+        Returns:
+            A dictionary of the shards to their results.
+
+        Raises:
+            The exception raised by the first shard that failed.
+
+        """
+        if not self._connections:
+            raise ValueError('[Error] The index is closed!')
+        with self._lock:
+            for shard, request in requests.items():
+                self._connections[shard].send(request)
+            responses = {shard: self._connections[shard].recv()
+                         for shard in requests}
+        for ok, result in responses.values():
+            if not ok:
+                raise result
+        return {shard: result for shard, (_, result) in responses.items()}
+
+    def _check_file_name(self, file_name, files=None):
+        """Check that a file name can be added to the index, see
+        Index._check_file_name.
+
+        """
+        if not isinstance(file_name, str):
+            raise ValueError("[Error] That is not a file name!")
+        if file_name in self._documents or (files is not None
+                                            and file_name in files):
+            raise IndexError(f'[Error] "{file_name}" is already in the index!')
+
+    def _added(self, shard, file_name):
+        self._documents.append(file_name)
+        self._numbers[shard].append(len(self._documents))
+
+    def add_file(self, file_name):
+        """Scan a file, in its shard, and add the words to the index. See
+        Index.add_file for the arguments and the errors.
+
+        """
+        self._check_file_name(file_name)
+        shard = self._shard(file_name)
+        result = self._request({shard: ('add_file', (file_name,))})[shard]
+        self._added(shard, file_name)
+        return result
+
+    def add_files(self, file_names):
+        """Scan many files and add their words to the index. Every shard
+        scans its files, all the shards in parallel.
+
+        Args:
+            file_names: The files to be scanned.
+
+        Returns:
+            A list with a result for every file name, in order, as in
+            Index.add_files.
+
+        """
+        file_names = list(file_names)
+        results = [None] * len(file_names)
+        positions = {}
+        seen = set()
+        for position, file_name in enumerate(file_names):
+            try:
+                self._check_file_name(file_name, seen)
+            except (ValueError, IndexError) as e:
+                results[position] = e
+            else:
+                seen.add(file_name)
+                positions.setdefault(self._shard(file_name), []).append(
+                        position)
+        if not positions:
+            return results
+
+        responses = self._request({
+                shard: ('add_files', ([file_names[position] for position
+                                       in shard_positions],))
+                for shard, shard_positions in positions.items()})
+        for shard, shard_positions in positions.items():
+            for position, result in zip(shard_positions, responses[shard]):
+                results[position] = result
+
+        # The files are numbered in the order of file_names, which is also
+        # their order in every shard
+        shards = {position: shard
+                  for shard, shard_positions in positions.items()
+                  for position in shard_positions}
+        for position, result in enumerate(results):
+            if isinstance(result, str) and position in shards:
+                self._added(shards[position], file_names[position])
+        return results
+
+    def freeze(self):
+        """Compact every shard in memory, see Index.freeze."""
+        self._request({shard: ('freeze', ())
+                       for shard in range(len(self._numbers))})
+
+    def get_result_for_query(self, query, mode='auto', top_k=None):
+        """This function returns a result for a query, evaluated by all the
+        shards in parallel. See Index.get_result_for_query for the
+        arguments.
+
+        Returns:
+            A list containing the files that matched the query, in the order
+            they were added.
+
+        Raises:
+            ValueError: If the query is wrong!
+
+        """
+        # If the query is empty, there is nothing to match
+        if not query:
+            return None
+
+        if top_k is not None:
+            return [file_name for file_name, _ in
+                    self.get_top_results(query, top_k)]
+
+        # The query is checked here, so a wrong query is not sent at all
+        if not isinstance(query, CompiledQuery):
+            query = CompiledQuery(query)
+        if mode not in MODES:
+            raise ValueError(f'[Error] Unknown query mode "{mode}"!')
+
+        responses = self._request({shard: ('numbers', (query.query, mode))
+                                   for shard in range(len(self._numbers))})
+        # The numbers of every shard are sorted, so once turned into the
+        # numbers of the whole index they are still sorted
+        numbers = merge(*([self._numbers[shard][number - 1]
+                           for number in responses[shard]]
+                          for shard in responses))
+        return self._documents.names(numbers)
+
+    def get_top_results(self, query, k=10):
+        """This function returns the files that match a query best. Every
+        shard returns its k best files, and the k best of them are kept.
+        See Index.get_top_results for the arguments.
+
+        Returns:
+            A list of (file, score) tuples, from the best score to the worst.
+            Files with the same score are in the order they were added.
+
+        Raises:
+            ValueError: If the query is wrong, or if k is not a positive
+                integer.
+
+        """
+        if not query:
+            return None
+        if not isinstance(query, CompiledQuery):
+            query = CompiledQuery(query)
+
+        responses = self._request({shard: ('top', (query.query, k))
+                                   for shard in range(len(self._numbers))})
+        ranked = sorted(((self._numbers[shard][number - 1], score)
+                         for shard in responses
+                         for number, score in responses[shard]),
+                        key=lambda pair: (-pair[1], pair[0]))[:k]
+        return [(self._documents[number - 1], score)
+                for number, score in ranked]
+
+    def close(self):
+        """Stop the worker processes. The index can't be used afterwards."""
+        with self._lock:
+            for connection in self._connections:
+                try:
+                    connection.send(('close', ()))
+                except OSError:
+                    pass
+                connection.close()
+            for process in self._processes:
+                process.join()
+            self._connections = []
+            self._processes = []
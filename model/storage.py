@@ -0,0 +1,601 @@
+from model.documents import DocumentTable
+
+from array import array
+from collections.abc import MutableMapping
+import json
+import mmap
+import os
+import struct
+import sys
+
+
+# The file starts with this magic string, followed by the header
+MAGIC = b'CDLIDX04'
+
+# The magic strings of the older versions of the format, which can still be
+# read: the first one without term frequencies, the second one without
+# positions, the third one without named sections
+MAGIC_V1 = b'CDLIDX01'
+MAGIC_V2 = b'CDLIDX02'
+MAGIC_V3 = b'CDLIDX03'
+
+# Header: number of files, number of terms, then the offsets of the file
+# names, term table, term strings, postings, frequencies, positions and
+# metadata sections, the length of the metadata section, and the offset and
+# number of entries of the section table
+_HEADER = struct.Struct('<IIQQQQQQQQQI')
+_HEADER_V3 = struct.Struct('<IIQQQQQQQQ')
+_HEADER_V2 = struct.Struct('<IIQQQQQQQ')
+_HEADER_V1 = struct.Struct('<IIQQQQQQ')
+
+# Term table entry: offset and length of the term in the term strings
+# section, offset and length of its postings in the postings section, its
+# document frequency (the number of files it appears in), offset and length
+# of its term frequencies in the frequencies section, and offset and length
+# of its positions in the positions section
+_ENTRY = struct.Struct('<QIQIIQIQI')
+_ENTRY_V2 = struct.Struct('<QIQIIQI')
+_ENTRY_V1 = struct.Struct('<QIQII')
+
+# Section table entry: the name of the section (padded with NUL bytes), and
+# its offset and length. The named sections hold binary data of any kind
+# (e.g. arrays of integers, see encode_array), so new ones can be added
+# without changing the format.
+_SECTION = struct.Struct('<8sQQ')
+
+# The header and term table entry of every version, by magic string
+_FORMATS = {
+    MAGIC: (_HEADER, _ENTRY),
+    MAGIC_V3: (_HEADER_V3, _ENTRY),
+    MAGIC_V2: (_HEADER_V2, _ENTRY_V2),
+    MAGIC_V1: (_HEADER_V1, _ENTRY_V1),
+}
+
+
+def encode_postings(postings):
+    """Encode a sorted posting list as deltas between consecutive files,
+    each written as a varint (7 bits per byte, with the high bit set on
+    every byte but the last one).
+
+    Example:
+        [1, 5, 300] -> deltas [1, 4, 295] -> b'\\x01\\x04\\xa7\\x02'
+
+    Args:
+        postings: A sorted list of positive integers.
+
+    Returns:
+        The encoded bytes.
+
+    """
+    data = bytearray()
+    previous = 0
+    for value in postings:
+        delta = value - previous
+        previous = value
+        while delta >= 0x80:
+            data.append(delta & 0x7f | 0x80)
+            delta >>= 7
+        data.append(delta)
+    return bytes(data)
+
+
+def encode_frequencies(frequencies):
+    """Encode a list of term frequencies, each written as a varint (see
+    encode_postings).
+
+    Args:
+        frequencies: A list of non-negative integers.
+
+    Returns:
+        The encoded bytes.
+
+    """
+    data = bytearray()
+    for value in frequencies:
+        while value >= 0x80:
+            data.append(value & 0x7f | 0x80)
+            value >>= 7
+        data.append(value)
+    return bytes(data)
+
+
+def decode_frequencies(data):
+    """Decode a list of term frequencies encoded by encode_frequencies."""
+    frequencies = []
+    value = 0
+    shift = 0
+    for byte in data:
+        value |= (byte & 0x7f) << shift
+        if byte & 0x80:
+            shift += 7
+        else:
+            frequencies.append(value)
+            value = 0
+            shift = 0
+    return frequencies
+
+
+def encode_positions(positions):
+    """Encode the positions of a term in a file, for each file of its
+    posting list.
+
+    The positions in a file are encoded like a posting list (see
+    encode_postings), and written after their length in bytes, as a varint.
+
+    Args:
+        positions: A list of encoded positions (see encode_postings), one
+        for every file of the posting list.
+
+    Returns:
+        The encoded bytes.
+
+    """
+    data = bytearray()
+    for encoded in positions:
+        data += encode_frequencies([len(encoded)])
+        data += encoded
+    return bytes(data)
+
+
+def decode_positions(data):
+    """Split the bytes written by encode_positions into the encoded
+    positions of the term in every file. The positions themselves are
+    decoded with decode_postings, only when they are needed.
+
+    """
+    positions = []
+    start = 0
+    while start < len(data):
+        length = 0
+        shift = 0
+        while True:
+            byte = data[start]
+            start += 1
+            length |= (byte & 0x7f) << shift
+            if not byte & 0x80:
+                break
+            shift += 7
+        positions.append(data[start:start + length])
+        start += length
+    return positions
+
+
+def decode_postings(data):
+    """Decode a posting list encoded by encode_postings.
+
+    Args:
+        data: The encoded bytes.
+
+    Returns:
+        The sorted posting list.
+
+    """
+    postings = []
+    previous = 0
+    delta = 0
+    shift = 0
+    for byte in data:
+        delta |= (byte & 0x7f) << shift
+        if byte & 0x80:
+            shift += 7
+        else:
+            previous += delta
+            postings.append(previous)
+            delta = 0
+            shift = 0
+    return postings
+
+
+def encode_array(values, typecode):
+    """Encode integers as an array of fixed size little-endian integers.
+
+    Args:
+        values: An iterable of integers (or an array with this typecode).
+        typecode: The typecode of the array, e.g. 'I' or 'q'.
+
+    Returns:
+        The encoded bytes.
+
+    """
+    values = array(typecode, values)
+    if sys.byteorder == 'big':
+        values.byteswap()
+    return values.tobytes()
+
+
+def decode_array(data, typecode):
+    """Decode the bytes written by encode_array into an array."""
+    values = array(typecode)
+    values.frombytes(data)
+    if sys.byteorder == 'big':
+        values.byteswap()
+    return values
+
+
+def write_index(file_name, files, index, metadata=None, frequencies=None,
+                positions=None,
+                sections=None):
+    """Write an index to a file.
+
+    The file is written next to its final place and then renamed, so a
+    reader never sees a half written index.
+
+    Args:
+        file_name: The file to write the index to.
+        files: The list of file names in the index. If sections has a
+        'names' section (the blocks of a DocumentTable, with their offsets
+        in a 'blocks' section), only their number is written.
+        index: The dictionary of words to posting lists.
+        metadata: A dictionary, that can be turned into JSON, to save with
+        the index.
+        frequencies: A dictionary of words to the lists of how many times
+        they appear in every file of their posting lists.
+        positions: A dictionary of words to the lists of their encoded
+        positions (see encode_postings) in every file of their posting
+        lists.
+        sections: A dictionary of the names (at most 8 ASCII characters) of
+        other sections to their bytes, see IndexFile.section.
+
+    Raises:
+        ValueError: If a file name contains a NUL character.
+
+    """
+    sections = sections or {}
+    if 'names' in sections:
+        # The names are in a section of their own, see IndexFile.documents
+        names = b''
+    else:
+        if any('\0' in name for name in files):
+            raise ValueError(
+                    '[Error] File names can not contain NUL characters!')
+        names = '\0'.join(files).encode('utf-8', 'surrogateescape')
+    terms = sorted(term for term in index if index[term])
+
+    frequencies = frequencies or {}
+    positions = positions or {}
+
+    table = bytearray()
+    strings = bytearray()
+    postings = bytearray()
+    term_frequencies = bytearray()
+    term_positions = bytearray()
+    for term in terms:
+        encoded_term = term.encode('utf-8', 'surrogateescape')
+        encoded_postings = encode_postings(index[term])
+        encoded_frequencies = encode_frequencies(frequencies.get(term, []))
+        encoded_positions = encode_positions(positions.get(term, []))
+        table += _ENTRY.pack(len(strings), len(encoded_term),
+                             len(postings), len(encoded_postings),
+                             len(index[term]), len(term_frequencies),
+                             len(encoded_frequencies), len(term_positions),
+                             len(encoded_positions))
+        strings += encoded_term
+        postings += encoded_postings
+        term_frequencies += encoded_frequencies
+        term_positions += encoded_positions
+    meta = json.dumps(metadata or {}).encode()
+
+    names_offset = len(MAGIC) + _HEADER.size
+    table_offset = names_offset + len(names)
+    strings_offset = table_offset + len(table)
+    postings_offset = strings_offset + len(strings)
+    frequencies_offset = postings_offset + len(postings)
+    positions_offset = frequencies_offset + len(term_frequencies)
+    meta_offset = positions_offset + len(term_positions)
+
+    section_table = bytearray()
+    section_offset = meta_offset + len(meta)
+    for name, data in sections.items():
+        section_table += _SECTION.pack(name.encode('ascii'), section_offset,
+                                       len(data))
+        section_offset += len(data)
+
+    temporary_name = f'{file_name}.tmp'
+    with open(temporary_name, 'wb') as file:
+        file.write(MAGIC)
+        file.write(_HEADER.pack(len(files), len(terms), names_offset,
+                                table_offset, strings_offset,
+                                postings_offset, frequencies_offset,
+                                positions_offset, meta_offset, len(meta),
+                                section_offset, len(sections)))
+        for section in (names, table, strings, postings, term_frequencies,
+                        term_positions, meta, *sections.values(),
+                        section_table):
+            file.write(section)
+    os.replace(temporary_name, file_name)
+
+
+class IndexFile():
+    """A read-only view over an index file written by write_index.
+
+    The file is memory mapped, so opening it only reads the header: the
+    term table is binary searched in place, and the postings of a term are
+    decoded only when they are asked for.
+
+    Files in the older versions of the format (without term frequencies or
+    positions) can be read too.
+
+    """
+
+    def __init__(self, file_name):
+        """Open an index file.
+
+        Args:
+            file_name: The file the index was written to.
+
+        Raises:
+            FileNotFoundError: If the file does not exist.
+            ValueError: If the file is not an index file.
+
+        """
+        with open(file_name, 'rb') as file:
+            if os.fstat(file.fileno()).st_size < len(MAGIC) + _HEADER.size:
+                raise ValueError(
+                        f'[Error] "{file_name}" is not an index file!')
+            self._mmap = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic = self._mmap[:len(MAGIC)]
+        if magic not in _FORMATS:
+            self._mmap.close()
+            raise ValueError(f'[Error] "{file_name}" is not an index file!')
+
+        header, self._entry_struct = _FORMATS[magic]
+        # The names of the sections to their (offset, length)
+        self._sections = {}
+        try:
+            fields = header.unpack_from(self._mmap, len(MAGIC))
+            if magic == MAGIC:
+                *fields, table_offset, count = fields
+                fields = tuple(fields)
+                for position in range(count):
+                    name, offset, length = _SECTION.unpack_from(
+                            self._mmap,
+                            table_offset + position * _SECTION.size)
+                    if offset + length > len(self._mmap):
+                        raise ValueError
+                    self._sections[name.rstrip(b'\0').decode('ascii')] = (
+                            offset, length)
+        except (struct.error, ValueError):
+            # The file is truncated or corrupt (UnicodeDecodeError is a
+            # ValueError too)
+            self._mmap.close()
+            raise ValueError(
+                    f'[Error] "{file_name}" is not an index file!') from None
+        (self._file_count, self._term_count, self._names_offset,
+         self._table_offset, self._strings_offset,
+         self._postings_offset) = fields[:6]
+        self._meta_offset, self._meta_length = fields[-2:]
+        # The offsets of the sections older versions don't have are None
+        optional = fields[6:-2] + (None, None)
+        self._frequencies_offset, self._positions_offset = optional[:2]
+
+    def documents(self, read_stats=None):
+        """Return the DocumentTable of the files in the index. If the names
+        were saved as the blocks of a DocumentTable, the blocks are read as
+        they are, and not decoded.
+
+        Args:
+            read_stats: A function returning the stats of the files, see
+            DocumentTable.set_stats_source.
+
+        """
+        if self.has_section('names'):
+            return DocumentTable.from_blocks(self.section('names'),
+                                             self.array('blocks', 'Q'),
+                                             self._file_count, read_stats)
+        documents = DocumentTable(self.files())
+        if read_stats is not None:
+            documents.set_stats_source(read_stats)
+        return documents
+
+    def files(self):
+        """Return the list of file names in the index."""
+        if self.has_section('names'):
+            return list(self.documents())
+        if not self._file_count:
+            return []
+        names = self._mmap[self._names_offset:self._table_offset]
+        return names.decode('utf-8', 'surrogateescape').split('\0')
+
+    def metadata(self):
+        """Return the metadata dictionary saved with the index."""
+        start = self._meta_offset
+        return json.loads(self._mmap[start:start + self._meta_length])
+
+    def section(self, name):
+        """Return the bytes of a named section (see write_index), or None
+        if the file doesn't have it. Only that section is read.
+
+        """
+        if name not in self._sections:
+            return None
+        offset, length = self._sections[name]
+        return self._mmap[offset:offset + length]
+
+    def has_section(self, name):
+        """Whether the file has a named section."""
+        return name in self._sections
+
+    def array(self, name, typecode):
+        """Return a section written with encode_array as an array, or None
+        if the file doesn't have it.
+
+        """
+        data = self.section(name)
+        return None if data is None else decode_array(data, typecode)
+
+    def __len__(self):
+        return self._term_count
+
+    def _entry(self, position):
+        entry = self._entry_struct
+        return entry.unpack_from(self._mmap,
+                                 self._table_offset + position * entry.size)
+
+    def term(self, position):
+        """Return the term at a position in the (sorted) term table."""
+        offset, length = self._entry(position)[:2]
+        start = self._strings_offset + offset
+        return self._mmap[start:start + length].decode('utf-8',
+                                                       'surrogateescape')
+
+    def find(self, term):
+        """Binary search a term in the term table.
+
+        Returns:
+            The position of the term, or None if it is not in the index.
+
+        """
+        low, high = 0, self._term_count
+        while low < high:
+            middle = (low + high) // 2
+            if self.term(middle) < term:
+                low = middle + 1
+            else:
+                high = middle
+        if low < self._term_count and self.term(low) == term:
+            return low
+        return None
+
+    def postings(self, position):
+        """Decode the posting list of the term at a position."""
+        offset, length = self._entry(position)[2:4]
+        start = self._postings_offset + offset
+        return decode_postings(self._mmap[start:start + length])
+
+    def frequencies(self, position):
+        """Decode the term frequencies of the term at a position, in the
+        order of its posting list.
+
+        Returns:
+            The list of frequencies, or None if they were not saved.
+
+        """
+        if self._frequencies_offset is None:
+            return None
+        offset, length = self._entry(position)[5:7]
+        if not length:
+            return None
+        start = self._frequencies_offset + offset
+        return decode_frequencies(self._mmap[start:start + length])
+
+    def positions(self, position):
+        """Return the encoded positions (see encode_postings) of the term
+        at a position, in every file of its posting list.
+
+        Returns:
+            The list of encoded positions, or None if they were not saved.
+
+        """
+        if self._positions_offset is None:
+            return None
+        offset, length = self._entry(position)[7:9]
+        if not length:
+            return None
+        start = self._positions_offset + offset
+        return decode_positions(self._mmap[start:start + length])
+
+    def document_frequency(self, position):
+        """Return the number of files the term at a position appears in."""
+        return self._entry(position)[4]
+
+    def terms(self):
+        """Yield every term, in sorted order."""
+        for position in range(self._term_count):
+            yield self.term(position)
+
+    def close(self):
+        self._mmap.close()
+
+
+class LazyPostings(MutableMapping):
+    """The dictionary of words to posting lists of an index loaded from a
+    file.
+
+    The posting list of a word is decoded from the IndexFile the first time
+    it is asked for, and kept afterwards. Words can be added, changed and
+    deleted as in a regular dictionary, without touching the file.
+
+    The same mapping is used for the term frequencies and the positions of
+    the words, by reading them with IndexFile.frequencies or
+    IndexFile.positions instead.
+
+    """
+
+    def __init__(self, index_file, read=None):
+        """Initialization of the mapping.
+
+        _file: The IndexFile the postings are read from.
+
+        _read: The method of the IndexFile that reads the list of a word,
+        given its position. It can return None when there is no list.
+
+        _decoded: The posting lists that were decoded or changed so far.
+
+        _deleted: The words of the file that were deleted.
+
+        _convert: The function the lists are converted with when they are
+        decoded, set by compact.
+
+        """
+        self._file = index_file
+        self._read = read or index_file.postings
+        self._decoded = {}
+        self._deleted = set()
+        self._convert = None
+
+    def compact(self, function):
+        """Convert the lists decoded so far with a function, and the lists
+        decoded from now on as well, e.g. to turn them into arrays.
+
+        Args:
+            function: A function taking a list and returning the list to
+            keep instead.
+
+        """
+        self._convert = function
+        self._decoded = {sys.intern(word): function(values)
+                         for word, values in self._decoded.items()}
+
+    def __getitem__(self, word):
+        try:
+            return self._decoded[word]
+        except KeyError:
+            pass
+        if word not in self._deleted:
+            position = self._file.find(word)
+            if position is not None:
+                postings = self._read(position)
+                if postings is not None:
+                    if self._convert is not None:
+                        postings = self._convert(postings)
+                    self._decoded[word] = postings
+                    return postings
+        raise KeyError(word)
+
+    def __setitem__(self, word, postings):
+        self._decoded[word] = postings
+        self._deleted.discard(word)
+
+    def __delitem__(self, word):
+        if word not in self:
+            raise KeyError(word)
+        self._decoded.pop(word, None)
+        self._deleted.add(word)
+
+    def __contains__(self, word):
+        if word in self._decoded:
+            return True
+        return word not in self._deleted and \
+            self._file.find(word) is not None
+
+    def __iter__(self):
+        for word in self._file.terms():
+            if word not in self._deleted:
+                yield word
+        for word in list(self._decoded):
+            if word not in self._deleted and self._file.find(word) is None:
+                yield word
+
+    def __len__(self):
+        return sum(1 for _ in self)
@@ -0,0 +1,117 @@
+from bisect import bisect_left, bisect_right
+import re
+
+
+# Sorts after any character a term can have, so prefix + _LAST is after every
+# term that starts with prefix
+_LAST = '\U0010ffff'
+
+# The characters with a special meaning in a wildcard pattern
+WILDCARDS = '*?'
+
+
+def _prefix_range(terms, prefix):
+    """Return the (start, end) positions of the terms that start with prefix,
+    in a sorted list of terms.
+
+    """
+    return (bisect_left(terms, prefix),
+            bisect_right(terms, prefix + _LAST))
+
+
+class TermDictionary():
+    """The terms of an index, kept sorted, so the terms that match a prefix,
+    a suffix or a wildcard pattern are found by binary search instead of a
+    scan of every term.
+
+    Next to the sorted terms, the dictionary keeps the sorted reversed terms,
+    so the terms that end with a suffix are the reversed terms that start
+    with the reversed suffix.
+
+    """
+
+    def __init__(self, terms=()):
+        """Initialization of the dictionary.
+
+        _terms: The sorted terms.
+
+        _reversed: The sorted reversed terms.
+
+        _pending: The terms added since the lists were last sorted. They are
+        merged into the lists on the next lookup, so adding many terms in a
+        row costs a single sort.
+
+        Args:
+            terms: The terms to start with.
+
+        """
+        self._terms = sorted(terms)
+        self._reversed = sorted(term[::-1] for term in self._terms)
+        self._pending = []
+
+    def add(self, term):
+        """Add a term, which must not be in the dictionary yet."""
+        self._pending.append(term)
+
+    def _merge_pending(self):
+        if self._pending:
+            # Both parts are sorted, which sorting finds and merges in
+            # linear time
+            self._pending.sort()
+            self._terms = sorted(self._terms + self._pending)
+            self._reversed = sorted(
+                    self._reversed
+                    + sorted(term[::-1] for term in self._pending))
+            self._pending = []
+
+    def __len__(self):
+        return len(self._terms) + len(self._pending)
+
+    def prefix(self, prefix):
+        """Return the sorted terms that start with prefix."""
+        self._merge_pending()
+        start, end = _prefix_range(self._terms, prefix)
+        return self._terms[start:end]
+
+    def suffix(self, suffix):
+        """Return the sorted terms that end with suffix."""
+        self._merge_pending()
+        start, end = _prefix_range(self._reversed, suffix[::-1])
+        return sorted(term[::-1] for term in self._reversed[start:end])
+
+    def wildcard(self, pattern):
+        """Return the sorted terms that match a wildcard pattern, where '*'
+        matches any number of characters and '?' exactly one.
+
+        Only the terms that start with the letters before the first
+        wildcard, or that end with the letters after the last one
+        (whichever are more), are matched against the whole pattern.
+
+        """
+        first = min(pattern.find(wildcard) % (len(pattern) + 1)
+                    for wildcard in WILDCARDS)
+        if first == len(pattern):
+            self._merge_pending()
+            position = bisect_left(self._terms, pattern)
+            if (position < len(self._terms)
+                    and self._terms[position] == pattern):
+                return [pattern]
+            return []
+        last = max(pattern.rfind(wildcard) for wildcard in WILDCARDS)
+        prefix = pattern[:first]
+        suffix = pattern[last + 1:]
+
+        if pattern == prefix + '*':
+            return self.prefix(prefix)
+        if pattern == '*' + suffix:
+            return self.suffix(suffix)
+
+        if len(prefix) >= len(suffix):
+            candidates = self.prefix(prefix)
+        else:
+            candidates = self.suffix(suffix)
+        regex = re.compile(''.join(
+                '.*' if character == '*' else
+                '.' if character == '?' else re.escape(character)
+                for character in pattern), re.DOTALL)
+        return [term for term in candidates if regex.fullmatch(term)]
@@ -0,0 +1,170 @@
+from collections import Counter
+import codecs
+import hashlib
+import locale
+import re
+
+
+# The size of the chunks files are read in. Memory used while scanning a file
+# is bounded by this (plus the distinct words), whatever the size of the file.
+CHUNK_SIZE = 1 << 20
+
+# Words, and a single word character.
+_WORD_REGEX = re.compile(r'\w+')
+_WORD_CHAR_REGEX = re.compile(r'\w')
+
+# Words and word characters in ASCII bytes: in bytes patterns \w is
+# [a-zA-Z0-9_], which is exactly what \w matches in the ASCII part of a
+# string.
+_WORD_BYTES_REGEX = re.compile(rb'\w+')
+_WORD_BYTES = bytes(byte for byte in range(128)
+                    if _WORD_BYTES_REGEX.match(bytes([byte])))
+
+
+def _split_tail(data):
+    """Split a chunk before the (possibly empty) partial word at its end,
+    which may continue in the next chunk.
+
+    """
+    if isinstance(data, bytes):
+        split = len(data.rstrip(_WORD_BYTES))
+    else:
+        split = len(data)
+        while split and _WORD_CHAR_REGEX.match(data, split - 1):
+            split -= 1
+    return data[:split], data[split:]
+
+
+def unique_words(file, chunk_size=CHUNK_SIZE, encoding=None, digest=None,
+                 counts=None, frequencies=False, positions=False):
+    """Return the set of distinct lowercase words in a file, reading it in
+    chunks.
+
+    The file is read chunk_size at a time, and the words of every chunk are
+    added to the set right away, so the file is never held in memory as a
+    whole. A word split between 2 chunks is carried over to the next chunk.
+
+    Files opened in binary mode get a fast path: chunks that are pure ASCII
+    are lowercased and split into words as bytes, without decoding them.
+    Other chunks are decoded incrementally, so a character split between 2
+    chunks is decoded correctly.
+
+    Args:
+        file: A file object opened in binary ('rb') or text mode.
+        chunk_size: How much to read at a time.
+        encoding: The encoding of a binary file. Defaults to the same
+        encoding open() uses for text files.
+        digest: A hashlib object to update with the content of the file,
+        so the file doesn't have to be read again to hash it.
+        counts: A dictionary, whose 'tokens' entry is increased by the
+        number of words in the file (repeated ones included).
+        frequencies: Whether to count how many times every word appears.
+        positions: Whether to keep the positions of every word, that is the
+        number of words before it in the file.
+
+    Returns:
+        A set with the words in the file. With frequencies, a Counter of the
+        words to the number of times they appear, and with positions, a
+        dictionary of the words to the sorted lists of their positions.
+
+    Raises:
+        UnicodeDecodeError: If a binary file is not in the given encoding.
+
+    """
+    if positions:
+        words = {}
+        ascii_words = {}
+        # The position of the first word of the next chunk
+        start = 0
+
+        def add(collection, found):
+            nonlocal start
+            for position, word in enumerate(found, start):
+                collection.setdefault(word, []).append(position)
+            start += len(found)
+    else:
+        words = Counter() if frequencies else set()
+        ascii_words = Counter() if frequencies else set()
+
+        def add(collection, found):
+            collection.update(found)
+
+    decoder = None
+    # The partial word at the end of the previous chunk
+    tail = ''
+
+    while chunk := file.read(chunk_size):
+        if digest is not None:
+            digest.update(chunk.encode() if isinstance(chunk, str) else chunk)
+
+        if isinstance(chunk, str):
+            data, tail = _split_tail(tail + chunk.lower())
+            found = _WORD_REGEX.findall(data)
+            add(words, found)
+            if counts is not None:
+                counts['tokens'] += len(found)
+            continue
+
+        if decoder is None:
+            decoder = codecs.getincrementaldecoder(
+                    encoding or locale.getpreferredencoding(False))()
+
+        # The fast path can only be taken between characters
+        pending, _ = decoder.getstate()
+        if not pending and tail.isascii() and chunk.isascii():
+            data, rest = _split_tail(tail.encode() + chunk.lower())
+            found = _WORD_BYTES_REGEX.findall(data)
+            add(ascii_words, found)
+            tail = rest.decode()
+        else:
+            data, tail = _split_tail(tail + decoder.decode(chunk).lower())
+            found = _WORD_REGEX.findall(data)
+            add(words, found)
+        if counts is not None:
+            counts['tokens'] += len(found)
+
+    if decoder is not None:
+        tail += decoder.decode(b'', final=True).lower()
+    found = _WORD_REGEX.findall(tail)
+    add(words, found)
+    if counts is not None:
+        counts['tokens'] += len(found)
+    if positions:
+        for word, found in ascii_words.items():
+            word = word.decode()
+            # The word may also be in chunks that are not pure ASCII
+            words[word] = sorted(words[word] + found) if word in words \
+                else found
+        return words
+    if frequencies:
+        decoded = Counter({word.decode(): count
+                           for word, count in ascii_words.items()})
+        decoded.update(words)
+        return decoded
+    else:
+        words.update(word.decode() for word in ascii_words)
+    return words
+
+
+def file_digest(file_name, chunk_size=CHUNK_SIZE):
+    """Hash the content of a file, reading it in chunks.
+
+    Args:
+        file_name: The file to hash.
+        chunk_size: How much to read at a time.
+
+    Returns:
+        The hexadecimal digest of the file, the same unique_words computes
+        with new_digest().
+
+    """
+    digest = new_digest()
+    with open(file_name, 'rb') as file:
+        while chunk := file.read(chunk_size):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def new_digest():
+    """Return the hashlib object used to hash the content of files."""
+    return hashlib.blake2b(digest_size=16)
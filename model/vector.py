@@ -0,0 +1,98 @@
+try:
+    import numpy
+except ImportError:  # NumPy is optional, see HAVE_NUMPY
+    numpy = None
+
+
+# Whether the 'vector' query mode can be used. Without NumPy, it falls back
+# to the 'dense' mode.
+HAVE_NUMPY = numpy is not None
+
+
+class BitVector():
+    """The files a word (or a subquery) matches, as a packed array of bits:
+    bit i of the array of uint64 words is set if file i + 1 matches.
+
+    It has the same operators as an IndexList (&, |, - and ~), but every one
+    of them is a single NumPy operation over 64 files per word, so on dense
+    words over many files it is much faster than the IndexList.
+
+    """
+
+    __slots__ = ('_words', '_size')
+
+    def __init__(self, words, size):
+        """Initialization of the vector.
+
+        Args:
+            words: A NumPy array of uint64, with the bits of the files. The
+            bits after size must be 0.
+            size: The number of files.
+
+        """
+        self._words = words
+        self._size = size
+
+    @classmethod
+    def from_postings(cls, postings, size):
+        """Create a BitVector from a posting list of the index.
+
+        Args:
+            postings: The files a word appears in, numbered from 1.
+            size: The number of files in the index.
+
+        Returns:
+            A new BitVector.
+
+        """
+        bits = numpy.zeros((size + 63) // 64 * 64, dtype=numpy.bool_)
+        if len(postings):
+            bits[numpy.asarray(postings, dtype=numpy.int64) - 1] = True
+        words = numpy.packbits(bits, bitorder='little').view(numpy.uint64)
+        return cls(words, size)
+
+    def _tail_mask(self):
+        """Return the mask of the bits of the last word that are files."""
+        used = self._size % 64
+        return numpy.uint64((1 << used) - 1 if used else (1 << 64) - 1)
+
+    def cardinality(self):
+        """Return the number of files set, counted with popcount."""
+        if hasattr(numpy, 'bitwise_count'):
+            return int(numpy.bitwise_count(self._words).sum())
+        return int(numpy.unpackbits(self._words.view(numpy.uint8)).sum())
+
+    def positions(self):
+        """Return the sorted positions (starting from 0) of the files set,
+        as a list.
+
+        """
+        bits = numpy.unpackbits(self._words.view(numpy.uint8),
+                                bitorder='little')
+        return numpy.flatnonzero(bits).tolist()
+
+    def __len__(self):
+        return self._size
+
+    def __and__(self, other):
+        return BitVector(numpy.bitwise_and(self._words, other._words),
+                         self._size)
+
+    def __or__(self, other):
+        return BitVector(numpy.bitwise_or(self._words, other._words),
+                         self._size)
+
+    def __sub__(self, other):
+        return BitVector(numpy.bitwise_and(self._words,
+                                           numpy.invert(other._words)),
+                         self._size)
+
+    def __invert__(self):
+        words = numpy.invert(self._words)
+        if len(words):
+            # The bits after the last file must stay 0
+            words[-1] &= self._tail_mask()
+        return BitVector(words, self._size)
+
+    def __repr__(self):
+        return f'BitVector({self.positions()!r}, {self._size})'
@@ -0,0 +1 @@
+from server.server import QueryServer
@@ -0,0 +1,253 @@
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import asyncio
+import json
+import multiprocessing
+import warnings
+
+
+# The index of a worker process, set by _init_worker when the process starts.
+_worker_index = None
+
+
+def _init_worker(index):
+    """Set the index of a worker process. The processes are forked, so they
+    get it without pickling it.
+
+    """
+    global _worker_index
+    _worker_index = index
+
+
+def _run_query(query, mode, top_k=None):
+    """Run a query on the index of a worker process."""
+    return _worker_index.get_result_for_query(query, mode, top_k)
+
+
+class QueryServer():
+    """This class serves queries on an index, that is kept in memory, to many
+    clients at once.
+
+    The protocol is line based: a client sends a request as a line of JSON,
+    and gets a response as a line of JSON. A request is either:
+      - {"query": "word1 && word2", "mode": "auto", "top_k": 10, "id": 1},
+      where mode, top_k (to only get the best files, ranked, see
+      Index.get_top_results) and id are optional, answered with
+      {"id": 1, "files": [...]} or {"id": 1, "error": "..."};
+      - {"op": "stats"}, answered with {"stats": {...}}, the counters of the
+      server.
+
+    Requests can be pipelined: a client can send many requests without
+    waiting for the responses. They are evaluated concurrently, but the
+    responses are sent in the same order as the requests.
+
+    Queries are evaluated outside of the event loop, so the server keeps
+    accepting and reading requests while a query is evaluated: by a single
+    thread (the index is not shared between threads), or by a pool of
+    worker processes, each one with its own copy of the index.
+
+    """
+
+    def __init__(self, index, workers=0, max_concurrency=64, max_pending=128,
+                 timeout=10.0):
+        """Initialization of the server.
+
+        Args:
+            index: The Index to answer the queries with. It must not change
+            while the server runs.
+            workers: The number of worker processes that evaluate queries.
+            With 0, the queries are evaluated by a thread of this process.
+            max_concurrency: How many queries, from all the clients, can be
+            handed to the workers at the same time. The others wait for their
+            turn. A query keeps its slot until its evaluation ends, even if
+            it timed out. With workers=0, the queries are still evaluated
+            one at a time, and this bounds how many wait for the thread.
+            max_pending: How many requests of a client can wait for their
+            response. The server stops reading the requests of a client
+            that has this many.
+            timeout: How long a query can take, in seconds, before an error
+            is sent back instead of its result. The evaluation itself can't
+            be stopped, so it still keeps its worker busy until it ends.
+
+        _clients: A dictionary of the tasks serving the connected clients to
+        their StreamReaders.
+
+        stats: The counters of the server.
+
+        """
+        self._index = index
+        self._workers = workers
+        self._max_concurrency = max_concurrency
+        self._max_pending = max_pending
+        self._timeout = timeout
+        self._executor = None
+        self._semaphore = None
+        self._servers = []
+        self._clients = {}
+        self.stats = {'connections': 0, 'requests': 0, 'errors': 0,
+                      'timeouts': 0}
+
+    def _make_executor(self):
+        if self._workers > 0:
+            if 'fork' in multiprocessing.get_all_start_methods():
+                return ProcessPoolExecutor(
+                        self._workers,
+                        mp_context=multiprocessing.get_context('fork'),
+                        initializer=_init_worker, initargs=(self._index,))
+            warnings.warn('[Warning] Worker processes need the fork start '
+                          'method, evaluating queries in a thread instead.')
+        return ThreadPoolExecutor(1)
+
+    async def start(self, host='127.0.0.1', port=0, path=None):
+        """Start listening for clients.
+
+        Args:
+            host: The address to listen on.
+            port: The TCP port to listen on. With 0, a free port is picked.
+            path: If given, listen on this Unix socket instead of TCP.
+
+        Returns:
+            The address the server listens on: a (host, port) tuple, or the
+            path of the Unix socket.
+
+        """
+        if self._executor is None:
+            self._executor = self._make_executor()
+            self._semaphore = asyncio.Semaphore(self._max_concurrency)
+
+        if path is not None:
+            server = await asyncio.start_unix_server(self._handle_client,
+                                                     path)
+            address = path
+        else:
+            server = await asyncio.start_server(self._handle_client, host,
+                                                port)
+            address = server.sockets[0].getsockname()[:2]
+        self._servers.append(server)
+        return address
+
+    async def serve_forever(self):
+        """Serve the clients until the server is closed."""
+        await asyncio.gather(*(server.serve_forever()
+                               for server in self._servers))
+
+    async def close(self):
+        """Stop listening, disconnect the clients (after sending the
+        responses to the requests they already sent), and shut the workers
+        down.
+
+        """
+        for server in self._servers:
+            server.close()
+        for reader in self._clients.values():
+            # The requests that were not received yet are dropped
+            reader.feed_eof()
+        await asyncio.gather(*self._clients, return_exceptions=True)
+        for server in self._servers:
+            await server.wait_closed()
+        self._servers = []
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+    async def _handle_client(self, reader, writer):
+        self.stats['connections'] += 1
+        task = asyncio.current_task()
+        self._clients[task] = reader
+        # The responses, in the order of the requests
+        pending = asyncio.Queue(self._max_pending)
+        sender = asyncio.ensure_future(self._send_responses(pending, writer))
+        try:
+            while line := await reader.readline():
+                if not line.strip():
+                    continue
+                self.stats['requests'] += 1
+                await pending.put(asyncio.ensure_future(
+                        self._handle_request(line)))
+            await pending.put(None)
+            await sender
+        except ConnectionError:
+            sender.cancel()
+        except asyncio.CancelledError:
+            # The event loop is closing
+            sender.cancel()
+        finally:
+            del self._clients[task]
+            writer.close()
+
+    async def _send_responses(self, pending, writer):
+        while (response := await pending.get()) is not None:
+            response = await response
+            try:
+                writer.write(json.dumps(response).encode() + b'\n')
+                await writer.drain()
+            except ConnectionError:
+                # The client is gone, but the requests still have to finish
+                pass
+
+    async def _handle_request(self, line):
+        """Answer a request.
+
+        Returns:
+            The response, as a dictionary.
+
+        """
+        try:
+            request = json.loads(line)
+            if not isinstance(request, dict):
+                raise ValueError
+        except ValueError:
+            self.stats['errors'] += 1
+            return {'error': '[Error] The request is not a JSON object!'}
+
+        if request.get('op') == 'stats':
+            return {'stats': dict(self.stats)}
+
+        response = {'id': request.get('id')}
+        query = request.get('query')
+        if not isinstance(query, str):
+            self.stats['errors'] += 1
+            response['error'] = '[Error] The request has no query!'
+            return response
+
+        loop = asyncio.get_running_loop()
+        function = _run_query
+        if isinstance(self._executor, ThreadPoolExecutor):
+            function = self._index.get_result_for_query
+        await self._semaphore.acquire()
+        try:
+            future = loop.run_in_executor(self._executor, function, query,
+                                          request.get('mode', 'auto'),
+                                          request.get('top_k'))
+        except BaseException:
+            self._semaphore.release()
+            raise
+        # The slot is given back when the evaluation ends, not when the
+        # response is sent, so queries that timed out still hold theirs
+        future.add_done_callback(self._release_slot)
+        try:
+            # Shielded, so a timeout doesn't mark the evaluation as done
+            files = await asyncio.wait_for(asyncio.shield(future),
+                                           self._timeout)
+        except asyncio.TimeoutError:
+            self.stats['timeouts'] += 1
+            response['error'] = '[Error] The query took too long!'
+            return response
+        except ValueError as e:
+            self.stats['errors'] += 1
+            response['error'] = str(e)
+            return response
+        except Exception as e:
+            # e.g. a worker process died, the server keeps going
+            self.stats['errors'] += 1
+            response['error'] = f'[Error] The query failed: {e!r}'
+            return response
+
+        response['files'] = files or []
+        return response
+
+    def _release_slot(self, future):
+        if not future.cancelled():
+            # Retrieve the error of a query that timed out, so it is not
+            # logged as never retrieved
+            future.exception()
+        self._semaphore.release()
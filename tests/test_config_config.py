@@ -1,5 +1,7 @@
-from config import Config
+from config import Config, ConfigSnapshot, ConfigWatcher
 
+import os
+import tempfile
 import unittest
 import unittest.mock as mock
 
@@ -44,23 +46,23 @@ class ConfigTestCase(unittest.TestCase):
     def test_language_in_config_is_true(self):
         data = '{"stop_words_language": true}'
         with mock.patch('builtins.open', mock.mock_open(read_data=data)):
-            config = Config()
             with self.assertWarns(UserWarning):
-                assert config.language() == 'english'
+                config = Config()
+            assert config.language() == 'english'
 
     def test_language_in_config_is_false(self):
         data = '{"stop_words_language": false}'
         with mock.patch('builtins.open', mock.mock_open(read_data=data)):
-            config = Config()
             with self.assertWarns(UserWarning):
-                assert config.language() == 'english'
+                config = Config()
+            assert config.language() == 'english'
 
     def test_language_in_config_does_not_have_language_supported(self):
         data = '{"stop_words_language": "some other language"}'
         with mock.patch('builtins.open', mock.mock_open(read_data=data)):
-            config = Config()
             with self.assertWarns(UserWarning):
-                assert config.language() == 'english'
+                config = Config()
+            assert config.language() == 'english'
 
     def test_stemming_does_not_exist_in_config(self):
         data = '{}'
@@ -114,3 +116,91 @@ class ConfigTestCase(unittest.TestCase):
             assert config.language() == 'english'
             assert config.use_stemming() == False
         m.assert_called_once_with('config.json')
+
+    def test_stem_cache_size_does_not_exist_in_config(self):
+        data = '{}'
+        with mock.patch('builtins.open', mock.mock_open(read_data=data)):
+            config = Config()
+            assert config.stem_cache_size() == 50000
+
+    def test_stem_cache_size_in_config(self):
+        data = '{"stem_cache_size": 100}'
+        with mock.patch('builtins.open', mock.mock_open(read_data=data)):
+            config = Config()
+            assert config.stem_cache_size() == 100
+
+    def test_stem_cache_size_wrong_attribute_in_config(self):
+        for value in ['"whatever"', 'true', '-1', '1.5']:
+            data = f'{{"stem_cache_size": {value}}}'
+            with mock.patch('builtins.open', mock.mock_open(read_data=data)):
+                config = Config()
+                assert config.stem_cache_size() == 50000
+
+    def test_snapshot_is_resolved_once(self):
+        data = '{"remove_stop_words": true, "use_stemming": true}'
+        with mock.patch('builtins.open', mock.mock_open(read_data=data)):
+            with mock.patch('os.listdir', return_value=['english']) as m:
+                config = Config()
+                for _ in range(3):
+                    config.language()
+                    config.use_stemming()
+        m.assert_called_once_with('stopwords')
+        assert config.snapshot == ConfigSnapshot(True, 'english', True, 50000)
+        with self.assertRaises(AttributeError):
+            config.snapshot.language = 'romanian'
+
+    def test_reload_swaps_the_snapshot_and_flags_reindex(self):
+        with tempfile.TemporaryDirectory() as directory:
+            file_name = os.path.join(directory, 'config.json')
+            with open(file_name, 'w') as file:
+                file.write('{"stem_cache_size": 10}')
+            config = Config(file_name)
+            assert config.reload() is False
+
+            with open(file_name, 'w') as file:
+                file.write('{"stem_cache_size": 20}')
+            assert config.reload() is True
+            assert config.stem_cache_size() == 20
+            assert not config.reindex_required
+
+            with open(file_name, 'w') as file:
+                file.write('{"use_stemming": true, "stem_cache_size": 20}')
+            assert config.reload() is True
+            assert config.use_stemming() is True
+            assert config.reindex_required
+
+            with open(file_name, 'w') as file:
+                file.write('{"use_stemming": tru')
+            with self.assertRaises(ValueError):
+                config.reload()
+            assert config.use_stemming() is True
+
+    def test_watcher_reloads_changed_file(self):
+        with tempfile.TemporaryDirectory() as directory:
+            file_name = os.path.join(directory, 'config.json')
+            with open(file_name, 'w') as file:
+                file.write('{}')
+            config = Config(file_name)
+            changes = []
+            watcher = ConfigWatcher(config, on_change=changes.append)
+            assert watcher.check() is False
+
+            with open(file_name, 'w') as file:
+                file.write('{"remove_stop_words": true}')
+            os.utime(file_name, ns=(0, 0))
+            assert watcher.check() is True
+            assert changes == [config]
+            assert config.remove_stopwords() is True
+
+            with open(file_name, 'w') as file:
+                file.write('{"remove_stop_words": ')
+            with self.assertWarns(UserWarning):
+                assert watcher.check() is False
+            assert config.remove_stopwords() is True
+
+    def test_watcher_thread_can_be_stopped(self):
+        with mock.patch('builtins.open', mock.mock_open(read_data='{}')):
+            config = Config()
+        watcher = ConfigWatcher(config, interval=0.01)
+        watcher.start()
+        watcher.stop()
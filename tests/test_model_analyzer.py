@@ -0,0 +1,103 @@
+from model.analyzer import Analyzer, StopwordFilter, MinLengthFilter, Stemmer
+from model.metrics import Metrics
+
+import unittest
+import unittest.mock as mock
+
+
+class AnalyzerTestCase(unittest.TestCase):
+
+    def make_config(self, remove_stopwords, use_stemming, language='english'):
+        config = mock.Mock()
+        config.remove_stopwords.return_value = remove_stopwords
+        config.language.return_value = language
+        config.use_stemming.return_value = use_stemming
+        config.stem_cache_size.return_value = 1000
+        return config
+
+    def test_no_stages(self):
+        analyzer = Analyzer(self.make_config(False, False))
+        assert analyzer.stages == []
+        assert analyzer.analyze(['at', 'cycling']) == {'at', 'cycling'}
+        assert analyzer.normalize('Cycling') == 'cycling'
+
+    def test_stopwords_are_read_once(self):
+        with mock.patch('builtins.open', mock.mock_open(read_data='the\nsome\n')) as m:
+            analyzer = Analyzer(self.make_config(True, False))
+            for _ in range(3):
+                assert analyzer.analyze(['the', 'some', 'at', 'data']) == {'data'}
+        m.assert_called_once_with('stopwords/english')
+
+    def test_stages_from_config(self):
+        analyzer = Analyzer(self.make_config(True, True))
+        stages = analyzer.stages
+        assert isinstance(stages[0], StopwordFilter)
+        assert isinstance(stages[1], MinLengthFilter)
+        assert isinstance(stages[2], Stemmer)
+        assert 'the' in stages[0].stop_words
+
+    def test_stemming_merges_words(self):
+        analyzer = Analyzer(self.make_config(False, True))
+        assert analyzer.analyze(['cycling', 'cycles', 'continue']) == {'cycl', 'continu'}
+
+    def test_query_words_are_stemmed_but_not_filtered(self):
+        analyzer = Analyzer(self.make_config(True, True))
+        assert analyzer.normalize('Cycling') == 'cycl'
+        assert analyzer.normalize('the') == 'the'
+
+    def test_custom_stage(self):
+        analyzer = Analyzer(self.make_config(False, False))
+        analyzer.add_stage(lambda word: None if word.isdigit() else word)
+        analyzer.add_stage(lambda word: word.replace('_', ''), on_query=True)
+        assert analyzer.analyze(['42', 'snake_case']) == {'snakecase'}
+        assert analyzer.normalize('Snake_Case') == 'snakecase'
+        assert analyzer.normalize('42') == '42'
+
+    def test_query_stage_can_leave_words_out(self):
+        analyzer = Analyzer(self.make_config(False, False))
+        analyzer.add_stage(lambda word: None if word.isdigit() else word,
+                           on_query=True)
+        # The Stemmer would fail on None
+        analyzer.add_stage(Stemmer(1000), on_query=True)
+        assert analyzer.normalize('42') is None
+        assert analyzer.normalize('Cycling') == 'cycl'
+
+    def test_stems_are_cached(self):
+        analyzer = Analyzer(self.make_config(False, True))
+        analyzer.analyze(['cycling', 'cycles'])
+        analyzer.analyze(['cycling', 'continue'])
+        assert analyzer.normalize('cycles') == 'cycl'
+        stats = analyzer.stem_cache.stats()
+        assert stats['hits'] == 2
+        assert stats['misses'] == 3
+        assert stats['size'] == 3
+
+    def test_no_stem_cache_without_stemming(self):
+        assert Analyzer(self.make_config(False, False)).stem_cache is None
+
+    def test_analyze_with_metrics_times_every_stage(self):
+        with mock.patch('builtins.open', mock.mock_open(read_data='the\n')):
+            analyzer = Analyzer(self.make_config(True, True))
+        words = ['the', 'at', 'cycling', 'cycled', 'data']
+        metrics = Metrics()
+        assert analyzer.analyze(words, metrics) == analyzer.analyze(words)
+        assert set(metrics.timers()) == {'index.analyze.StopwordFilter',
+                                         'index.analyze.MinLengthFilter',
+                                         'index.analyze.Stemmer'}
+
+    def test_analyze_frequencies_adds_up_merged_words(self):
+        with mock.patch('builtins.open', mock.mock_open(read_data='the\n')):
+            analyzer = Analyzer(self.make_config(True, True))
+        frequencies = {'the': 4, 'cycling': 2, 'cycled': 1, 'data': 3}
+        expected = {'cycl': 3, 'data': 3}
+        assert analyzer.analyze_frequencies(frequencies) == expected
+        assert analyzer.analyze_frequencies(frequencies, Metrics()) == expected
+
+    def test_analyze_positions_merges_words_and_keeps_gaps(self):
+        with mock.patch('builtins.open', mock.mock_open(read_data='the\n')):
+            analyzer = Analyzer(self.make_config(True, True))
+        positions = {'the': [0, 4], 'cycling': [1, 5], 'cycled': [3],
+                     'data': [2]}
+        expected = {'cycl': [1, 3, 5], 'data': [2]}
+        assert analyzer.analyze_positions(positions) == expected
+        assert analyzer.analyze_positions(positions, Metrics()) == expected
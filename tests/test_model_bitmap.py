@@ -0,0 +1,75 @@
+from model.bitmap import Bitmap, ArrayContainer, BitsetContainer, RunContainer
+
+import random
+import unittest
+
+
+class BitmapTestCase(unittest.TestCase):
+
+    def setUp(self):
+        rng = random.Random(42)
+        self.sparse = set(rng.sample(range(300000), 2000))
+        self.dense = set(rng.sample(range(140000), 100000))
+        self.runs = set(range(1000, 90000)) | set(range(200000, 200100))
+
+    def test_values_are_iterated_in_order(self):
+        bitmap = Bitmap([70000, 5, 3, 65536, 3])
+        assert list(bitmap) == [3, 5, 65536, 70000]
+        assert len(bitmap) == 4
+
+    def test_container_choice(self):
+        assert isinstance(Bitmap(self.sparse)._containers[0], ArrayContainer)
+        assert isinstance(Bitmap(self.dense)._containers[0], BitsetContainer)
+        assert isinstance(Bitmap(self.runs)._containers[0], RunContainer)
+
+    def test_contains(self):
+        bitmap = Bitmap(self.runs)
+        assert 1000 in bitmap
+        assert 89999 in bitmap
+        assert 90000 not in bitmap
+        assert 999 not in bitmap
+        assert 200050 in bitmap
+
+    def test_and(self):
+        for first in (self.sparse, self.dense, self.runs):
+            for second in (self.sparse, self.dense, self.runs):
+                result = Bitmap(first) & Bitmap(second)
+                assert list(result) == sorted(first & second)
+
+    def test_or(self):
+        for first in (self.sparse, self.dense, self.runs):
+            for second in (self.sparse, self.dense, self.runs):
+                result = Bitmap(first) | Bitmap(second)
+                assert list(result) == sorted(first | second)
+
+    def test_andnot(self):
+        for first in (self.sparse, self.dense, self.runs):
+            for second in (self.sparse, self.dense, self.runs):
+                result = Bitmap(first) - Bitmap(second)
+                assert list(result) == sorted(first - second)
+
+    def test_flip(self):
+        values = {0, 2, 65535, 65536, 131071}
+        result = Bitmap(values).flip(140000)
+        assert list(result) == [value for value in range(140000)
+                                if value not in values]
+
+    def test_range(self):
+        assert list(Bitmap.range(65530, 65540)) == list(range(65530, 65540))
+        assert len(Bitmap.range(0, 300000)) == 300000
+        assert not Bitmap.range(5, 5)
+
+    def test_add(self):
+        bitmap = Bitmap([10])
+        bitmap.add(70000)
+        bitmap.add(5)
+        assert list(bitmap) == [5, 10, 70000]
+
+    def test_equality(self):
+        assert Bitmap(self.dense) == Bitmap(sorted(self.dense))
+        assert Bitmap([1, 2]) != Bitmap([1, 3])
+
+    def test_from_sorted(self):
+        for values in (self.sparse, self.dense, self.runs):
+            assert Bitmap.from_sorted(sorted(values)) == Bitmap(values)
+        assert list(Bitmap.from_sorted([1, 2, 65537], offset=1)) == [0, 1, 65536]
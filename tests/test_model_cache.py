@@ -0,0 +1,83 @@
+from model.cache import LRUCache
+
+import os
+import tempfile
+import unittest
+
+
+class LRUCacheTestCase(unittest.TestCase):
+
+    def test_get_and_put(self):
+        cache = LRUCache(2)
+        cache.put('a', 1)
+        assert cache.get('a') == 1
+        assert cache.get('b') is None
+        assert cache.get('b', 5) == 5
+        assert cache.hits == 1
+        assert cache.misses == 2
+
+    def test_least_recently_used_is_evicted(self):
+        cache = LRUCache(2)
+        cache.put('a', 1)
+        cache.put('b', 2)
+        cache.get('a')
+        cache.put('c', 3)
+        assert 'a' in cache
+        assert 'b' not in cache
+        assert 'c' in cache
+        assert cache.evictions == 1
+        assert len(cache) == 2
+
+    def test_zero_size_caches_nothing(self):
+        cache = LRUCache(0)
+        cache.put('a', 1)
+        assert len(cache) == 0
+        assert cache.get('a') is None
+
+    def test_stats(self):
+        cache = LRUCache(10)
+        cache.put('a', 1)
+        cache.get('a')
+        cache.get('a')
+        cache.get('b')
+        stats = cache.stats()
+        assert stats == {'size': 1, 'maxsize': 10, 'bytes': 0,
+                         'maxbytes': None, 'hits': 2, 'misses': 1,
+                         'evictions': 0, 'hit_rate': 2 / 3}
+
+    def test_byte_bound_evicts_least_recently_used(self):
+        cache = LRUCache(10, maxbytes=10, sizeof=len)
+        cache.put('a', 'xxxx')
+        cache.put('b', 'xxxx')
+        cache.get('a')
+        cache.put('c', 'xxxx')
+        assert 'b' not in cache
+        assert cache.bytes == 8
+        assert cache.evictions == 1
+        # Replacing a value updates the size
+        cache.put('a', 'x')
+        assert cache.bytes == 5
+        # Values bigger than the whole cache are not cached
+        cache.put('d', 'x' * 11)
+        assert 'd' not in cache
+        cache.clear()
+        assert cache.bytes == 0
+
+    def test_items_from_most_recently_used(self):
+        cache = LRUCache(3)
+        for key in 'abc':
+            cache.put(key, key.upper())
+        cache.get('a')
+        assert cache.items() == [('a', 'A'), ('c', 'C'), ('b', 'B')]
+
+    def test_save_and_load_keep_the_hot_entries(self):
+        cache = LRUCache(3)
+        for key in 'abc':
+            cache.put(key, key.upper())
+        cache.get('a')
+        with tempfile.TemporaryDirectory() as directory:
+            file_name = os.path.join(directory, 'cache.json')
+            cache.save(file_name, limit=2)
+            loaded = LRUCache(3)
+            loaded.load(file_name)
+        assert loaded.items() == [('a', 'A'), ('c', 'C')]
@@ -0,0 +1,64 @@
+from model.directory import walk_files, is_binary
+
+import io
+import os
+import tempfile
+import unittest
+
+
+class DirectoryTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.root = self.directory.name
+        for path, data in (('b.txt', b'text'), ('a.md', b'text'),
+                           ('docs/c.txt', b'text'), ('docs/d.bin', b'\0'),
+                           ('build/e.txt', b'text')):
+            path = os.path.join(self.root, path)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'wb') as file:
+                file.write(data)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def relative(self, paths):
+        return [os.path.relpath(path, self.root) for path in paths]
+
+    def test_walk_files(self):
+        assert self.relative(walk_files(self.root)) == [
+                'a.md', 'b.txt', 'build/e.txt', 'docs/c.txt', 'docs/d.bin']
+
+    def test_include_and_exclude(self):
+        assert self.relative(walk_files(self.root, include='*.txt',
+                                        exclude=['build'])) == [
+                'b.txt', 'docs/c.txt']
+        assert self.relative(walk_files(self.root,
+                                        include=['docs/*', 'a.*'])) == [
+                'a.md', 'docs/c.txt', 'docs/d.bin']
+
+    @unittest.skipUnless(hasattr(os, 'symlink'), 'needs symbolic links')
+    def test_symlinks(self):
+        os.symlink(self.root, os.path.join(self.root, 'docs', 'loop'))
+        os.symlink(os.path.join(self.root, 'b.txt'),
+                   os.path.join(self.root, 'link.txt'))
+        assert self.relative(walk_files(self.root)) == [
+                'a.md', 'b.txt', 'build/e.txt', 'docs/c.txt', 'docs/d.bin']
+        # The loop back to the root is only walked once
+        assert self.relative(walk_files(self.root, follow_symlinks=True)) == [
+                'a.md', 'b.txt', 'link.txt', 'build/e.txt', 'docs/c.txt',
+                'docs/d.bin']
+
+    def test_unreadable_directory_is_reported(self):
+        errors = []
+        missing = os.path.join(self.root, 'missing')
+        assert list(walk_files(missing, onerror=errors.append)) == []
+        assert isinstance(errors[0], FileNotFoundError)
+
+    def test_is_binary(self):
+        file = io.BytesIO(b'some text\0more')
+        file.read(2)
+        assert is_binary(file)
+        assert file.tell() == 2
+        assert not is_binary(io.BytesIO(b'some text'))
+        assert not is_binary(io.BytesIO(b'some text' * 10 + b'\0'), size=20)
@@ -0,0 +1,88 @@
+from model.documents import DocumentTable, BLOCK_SIZE, DIGEST_SIZE
+
+import pickle
+import unittest
+
+
+class DocumentTableTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.names = [f'/home/user/corpus/dir{number // 7}/file{number}.txt'
+                      for number in range(BLOCK_SIZE * 3 + 5)]
+        self.names.append('other/café \udcff.txt')
+        self.table = DocumentTable(self.names)
+
+    def test_sequence_of_names(self):
+        assert len(self.table) == len(self.names)
+        assert list(self.table) == self.names
+        assert self.table == self.names
+        assert self.table[0] == self.names[0]
+        assert self.table[-1] == self.names[-1]
+        assert self.table[BLOCK_SIZE - 1:BLOCK_SIZE + 2] == \
+            self.names[BLOCK_SIZE - 1:BLOCK_SIZE + 2]
+        with self.assertRaises(IndexError):
+            self.table[len(self.names)]
+
+    def test_numbers(self):
+        for number, name in enumerate(self.names, 1):
+            assert self.table.number(name) == number
+            assert name in self.table
+        assert self.table.number('/home/user/corpus/missing') is None
+        assert 'file1.txt' not in self.table
+        assert self.table.names([3, BLOCK_SIZE * 2, 1]) == \
+            [self.names[2], self.names[BLOCK_SIZE * 2 - 1], self.names[0]]
+
+    def test_hash_collisions(self):
+        table = DocumentTable(['a', 'b'])
+        # The dictionary of the names is only built when it is needed
+        assert table._numbers is None
+        assert 'a' in table
+        # As if 'a', 'b' and 'c' had the same hash
+        table._numbers[hash('a')] = table._numbers[hash('b')] = [1, 2]
+        table._numbers[hash('c')] = 1
+        assert table.number('a') == 1
+        assert table.number('b') == 2
+        assert table.number('c') is None
+
+    def test_stats(self):
+        table = DocumentTable()
+        table.append('doc1', (10, 123, 'ab' * 16))
+        table.append('doc2')
+        table.append('doc3', (20, 456))
+        assert table.stats(1) == (10, 123, 'ab' * 16)
+        assert table.stats(2) is None
+        assert table.stats(3) == (20, 456)
+        assert dict(table.file_stats) == {'doc1': (10, 123, 'ab' * 16),
+                                          'doc3': (20, 456)}
+        table.file_stats['doc2'] = (5, 6, 'cd' * 16)
+        del table.file_stats['doc1']
+        assert table.file_stats == {'doc2': (5, 6, 'cd' * 16),
+                                    'doc3': (20, 456)}
+        assert len(table._digests) == 3 * DIGEST_SIZE
+        with self.assertRaises(KeyError):
+            table.file_stats['missing'] = (1, 2)
+        with self.assertRaises(ValueError):
+            table.set_stats(1, (1, 2, 'cd'))
+
+    def test_blocks(self):
+        for names in (self.names, self.names[:BLOCK_SIZE * 2], []):
+            table = DocumentTable(names)
+            if names:
+                table.set_stats(1, (10, 123, 'ab' * 16))
+            data, offsets = table.blocks()
+            loaded = DocumentTable.from_blocks(data, offsets, len(names),
+                                               table.stats_arrays)
+            assert loaded == names
+            assert loaded.number(names[-1] if names else 'x') == (
+                    len(names) or None)
+            if names:
+                assert loaded.stats(1) == (10, 123, 'ab' * 16)
+            loaded.append('new')
+            assert loaded[-1] == 'new'
+            assert DocumentTable.from_blocks(data, offsets, len(names)) == \
+                names
+
+    def test_pickle(self):
+        table = pickle.loads(pickle.dumps(self.table))
+        assert table == self.names
+        assert table.number(self.names[-2]) == len(self.names) - 1
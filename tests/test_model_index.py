@@ -1,9 +1,14 @@
 from model import Index
+from config import ConfigSnapshot
+from model.metrics import Metrics
 
 import json
+import os
+import tempfile
 import unittest
 import unittest.mock as mock
 from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 
 
 class IndexTestCase(unittest.TestCase):
@@ -62,7 +67,7 @@ class IndexTestCase(unittest.TestCase):
             with mock.patch('builtins.open', mock.mock_open()) as m:
                 index = Index()
                 index.add_file('document')
-            m.assert_called_once_with('document')
+            m.assert_called_once_with('document', 'rb')
 
     def test_add_file_correct_index_structure_with_more_files(self):
         data1 = 'some data'
@@ -87,6 +92,7 @@ class IndexTestCase(unittest.TestCase):
             mock_config.return_value.remove_stopwords.return_value = False
             mock_config.return_value.language.return_value = 'english'
             mock_config.return_value.use_stemming.return_value = True
+            mock_config.return_value.stem_cache_size.return_value = 1000
             with mock.patch('builtins.open', mock.mock_open(read_data=data)):
                 index = Index()
                 index.add_file('doc1')
@@ -162,6 +168,7 @@ class IndexTestCase(unittest.TestCase):
             mock_config.return_value.remove_stopwords.return_value = True
             mock_config.return_value.language.return_value = 'english'
             mock_config.return_value.use_stemming.return_value = True
+            mock_config.return_value.stem_cache_size.return_value = 1000
             with mock.patch('builtins.open', mock.mock_open(read_data=data)) as m:
                 index = Index()
                 index.add_file('doc1')
@@ -232,7 +239,647 @@ class IndexTestCase(unittest.TestCase):
             mock_config.return_value.remove_stopwords.return_value = False
             mock_config.return_value.language.return_value = 'english'
             mock_config.return_value.use_stemming.return_value = True
+            mock_config.return_value.stem_cache_size.return_value = 1000
             idx = Index()
             idx._index = index
             idx._files = files
             assert idx.get_result_for_query(query) == expected
+
+    def test_compiled_query_can_be_executed_again(self):
+        index = defaultdict(list, {'data': [1, 3], 'some':[1, 2], 'hello': [1], 'world': [3]})
+        files = ['doc1', 'doc2', 'doc3', 'doc4']
+        with mock.patch('model.index.Config', autospec=True, spec_set=True) as mock_config:
+            mock_config.return_value.remove_stopwords.return_value = False
+            mock_config.return_value.language.return_value = 'english'
+            mock_config.return_value.use_stemming.return_value = False
+            idx = Index()
+            idx._index = index
+            idx._files = files
+            query = idx.compile_query('data || !some')
+            assert idx.get_result_for_query(query) == ['doc1', 'doc3', 'doc4']
+            idx._add_words('doc5', {'data'})
+            assert idx.get_result_for_query(query) == ['doc1', 'doc3', 'doc4', 'doc5']
+
+    def test_query_results_are_cached_until_the_index_changes(self):
+        index = defaultdict(list, {'data': [1, 3], 'some': [1, 2]})
+        files = ['doc1', 'doc2', 'doc3']
+        with mock.patch('model.index.Config', autospec=True, spec_set=True) as mock_config:
+            mock_config.return_value.remove_stopwords.return_value = False
+            mock_config.return_value.language.return_value = 'english'
+            mock_config.return_value.use_stemming.return_value = False
+            idx = Index()
+            idx._index = index
+            idx._files = files
+            assert idx.get_result_for_query('data && some') == ['doc1']
+            assert idx.get_result_for_query('Some && data') == ['doc1']
+            stats = idx.query_cache_stats()
+            assert stats['results']['hits'] == 1
+            assert stats['results']['misses'] == 1
+            assert stats['results']['bytes'] > 0
+
+            idx._add_words('doc4', {'data', 'some'})
+            assert idx.get_result_for_query('some && data') == ['doc1', 'doc4']
+            stats = idx.query_cache_stats()
+            assert stats['generation'] == 1
+            assert stats['invalidations'] == 1
+            assert stats['results']['size'] == 1
+
+            idx._remove_files(['doc1'])
+            assert idx.get_result_for_query('data && some') == ['doc4']
+
+    def test_query_cache_can_be_disabled(self):
+        with mock.patch('model.index.Config', autospec=True, spec_set=True) as mock_config:
+            mock_config.return_value.remove_stopwords.return_value = False
+            mock_config.return_value.language.return_value = 'english'
+            mock_config.return_value.use_stemming.return_value = False
+            idx = Index(query_cache_size=0)
+            idx._add_words('doc1', {'data'})
+            assert idx.get_result_for_query('data') == ['doc1']
+            assert idx.get_result_for_query('data') == ['doc1']
+            assert idx.query_cache_stats()['results']['size'] == 0
+            with self.assertRaises(ValueError):
+                idx.get_result_for_query('data', mode='fast')
+
+    def test_metrics_record_indexing_and_querying(self):
+        data = {'doc1': 'Some data, some more', 'doc2': 'data here'}
+
+        def open_file(name, *args):
+            return mock.mock_open(read_data=data[name].encode())()
+
+        with mock.patch('model.index.Config', autospec=True, spec_set=True) as mock_config:
+            mock_config.return_value.remove_stopwords.return_value = False
+            mock_config.return_value.language.return_value = 'english'
+            mock_config.return_value.use_stemming.return_value = False
+            idx = Index(metrics=Metrics())
+            received = []
+            idx.metrics.add_hook(lambda *args: received.append(args))
+            with mock.patch('builtins.open', side_effect=open_file):
+                idx.add_file('doc1')
+                idx.add_files(['doc2'], workers=1)
+            assert idx.get_result_for_query('data && !here') == ['doc1']
+            assert idx.get_result_for_query('!here && data') == ['doc1']
+
+            counters = idx.metrics.counters()
+            assert counters['index.files'] == 2
+            assert counters['index.tokens'] == 6
+            assert counters['index.words'] == 5
+            assert counters['index.postings'] == 5
+            assert counters['index.bytes_read'] == 29
+            assert counters['query.count'] == 2
+            assert counters['query.cache_hits'] == 1
+            timers = idx.metrics.timers()
+            for name in ['index.add_file', 'index.read', 'index.tokenize',
+                         'index.postings', 'query.parse', 'query.lookup',
+                         'query.evaluate']:
+                assert name in timers, name
+            assert timers['query.total']['count'] == 2
+            assert ('count', 'query.count', 1) in received
+
+            idx.metrics = None
+            assert not idx.metrics.enabled
+
+    def test_needs_reindex_when_analysis_settings_change(self):
+        with mock.patch('model.index.Config', autospec=True, spec_set=True) as mock_config:
+            mock_config.return_value.remove_stopwords.return_value = False
+            mock_config.return_value.language.return_value = 'english'
+            mock_config.return_value.use_stemming.return_value = False
+            mock_config.return_value.snapshot = ConfigSnapshot(False, 'english', False, 1000)
+            idx = Index()
+            assert not idx.needs_reindex()
+            mock_config.return_value.snapshot = ConfigSnapshot(False, 'english', True, 1000)
+            assert idx.needs_reindex()
+
+    def test_top_results_are_ranked_by_bm25(self):
+        with mock.patch('model.index.Config', autospec=True, spec_set=True) as mock_config:
+            mock_config.return_value.remove_stopwords.return_value = False
+            mock_config.return_value.language.return_value = 'english'
+            mock_config.return_value.use_stemming.return_value = False
+            idx = Index()
+            idx._add_words('doc1', {'data': 1, 'some': 1, 'other': 8})
+            idx._add_words('doc2', {'data': 3, 'here': 1})
+            idx._add_words('doc3', {'kernel': 1})
+            idx._add_words('doc4', {'data': 1, 'kernel': 2})
+            results = idx.get_top_results('data || kernel', 3)
+            assert [name for name, _ in results] == ['doc4', 'doc3', 'doc2']
+            assert results[0][1] > results[1][1] > results[2][1]
+            assert idx.get_result_for_query('data || kernel', top_k=2) == ['doc4', 'doc3']
+            assert idx.get_result_for_query('data && !kernel', top_k=5) == ['doc2', 'doc1']
+            assert idx.get_top_results('missing', 3) == []
+            assert idx.get_top_results('', 3) is None
+            with self.assertRaises(ValueError):
+                idx.get_top_results('data', 0)
+
+            idx._remove_files(['doc4'])
+            assert idx._frequencies['data'] == [1, 3]
+            assert idx._lengths == [10, 4, 1]
+            assert idx.get_result_for_query('data || kernel', top_k=3) == ['doc3', 'doc2', 'doc1']
+
+    def test_top_results_without_frequencies(self):
+        index = defaultdict(list, {'data': [1, 3], 'some': [1, 2]})
+        with mock.patch('model.index.Config', autospec=True, spec_set=True) as mock_config:
+            mock_config.return_value.remove_stopwords.return_value = False
+            mock_config.return_value.language.return_value = 'english'
+            mock_config.return_value.use_stemming.return_value = False
+            idx = Index()
+            idx._index = index
+            idx._files = ['doc1', 'doc2', 'doc3']
+            assert idx.get_result_for_query('data || some', top_k=3) == ['doc1', 'doc2', 'doc3']
+            # The frequencies of 'data' are not known, every file counts it once
+            idx._add_words('doc4', {'data': 2})
+            assert idx.get_result_for_query('data', top_k=3) == ['doc1', 'doc3', 'doc4']
+
+    def test_frequencies_survive_save_and_load(self):
+        with mock.patch('model.index.Config', autospec=True, spec_set=True) as mock_config:
+            mock_config.return_value.remove_stopwords.return_value = False
+            mock_config.return_value.language.return_value = 'english'
+            mock_config.return_value.use_stemming.return_value = False
+            with tempfile.TemporaryDirectory() as directory:
+                file_name = os.path.join(directory, 'index')
+                idx = Index()
+                with mock.patch('builtins.open', mock.mock_open(read_data='data data kernel')):
+                    idx.add_file('doc1')
+                with mock.patch('builtins.open', mock.mock_open(read_data='data here here')):
+                    idx.add_file('doc2')
+                assert idx._frequencies == {'data': [2, 1], 'kernel': [1], 'here': [2]}
+                idx.save(file_name)
+                loaded = Index.load(file_name)
+                assert list(loaded._lengths) == [3, 3]
+                assert loaded._frequencies['data'] == [2, 1]
+                assert loaded.get_top_results('data || here', 2) == idx.get_top_results('data || here', 2)
+
+    def test_phrase_and_near_queries(self):
+        with mock.patch('model.index.Config', autospec=True, spec_set=True) as mock_config:
+            mock_config.return_value.remove_stopwords.return_value = True
+            mock_config.return_value.language.return_value = 'english'
+            mock_config.return_value.use_stemming.return_value = False
+            idx = Index(positions=True)
+            data = {'doc1': 'The kernel panic happened at boot',
+                    'doc2': 'panic in the kernel, not a kernel panic',
+                    'doc3': 'state of the art kernel',
+                    'doc4': 'kernel one two three panic'}
+            for name, text in data.items():
+                with mock.patch('builtins.open', mock.mock_open(read_data=text.encode())):
+                    idx.add_file(name)
+            assert idx.get_result_for_query('"kernel panic"') == ['doc1', 'doc2']
+            assert idx.get_result_for_query('"Panic kernel"') == []
+            assert idx.get_result_for_query('"state of the art"') == ['doc3']
+            assert idx.get_result_for_query('kernel NEAR/1 panic') == ['doc1', 'doc2']
+            assert idx.get_result_for_query('kernel NEAR/4 panic', mode='dense') == ['doc1', 'doc2', 'doc4']
+            assert idx.get_result_for_query('"kernel panic" && !boot') == ['doc2']
+            assert idx.get_results_for_queries(['"kernel panic"', '"kernel panic" || art']) == [['doc1', 'doc2'], ['doc1', 'doc2', 'doc3']]
+
+            idx._remove_files(['doc1'])
+            assert idx.get_result_for_query('"kernel panic"') == ['doc2']
+            assert len(idx._positions['kernel']) == len(idx._index['kernel'])
+
+    def test_query_words_left_out_by_a_stage_match_no_file(self):
+        with mock.patch('model.index.Config', autospec=True, spec_set=True) as mock_config:
+            mock_config.return_value.remove_stopwords.return_value = False
+            mock_config.return_value.language.return_value = 'english'
+            mock_config.return_value.use_stemming.return_value = True
+            mock_config.return_value.stem_cache_size.return_value = 1000
+            idx = Index()
+        idx._analyzer.add_stage(lambda word: None if word.isdigit() else word, on_query=True)
+        idx._add_words('doc1', {'42', 'kernel'})
+        idx._add_words('doc2', {'panic'})
+        assert idx.get_result_for_query('42') == []
+        assert idx.get_result_for_query('42 || panic') == ['doc2']
+        assert idx.get_result_for_query('!42') == ['doc1', 'doc2']
+        assert idx.get_result_for_query('42 || kernel', top_k=2) == ['doc1']
+
+    def test_phrase_queries_need_positions(self):
+        with mock.patch('model.index.Config', autospec=True, spec_set=True) as mock_config:
+            mock_config.return_value.remove_stopwords.return_value = False
+            mock_config.return_value.language.return_value = 'english'
+            mock_config.return_value.use_stemming.return_value = False
+            idx = Index()
+            idx._add_words('doc1', {'kernel': 1, 'panic': 1})
+            with self.assertRaises(ValueError):
+                idx.get_result_for_query('"kernel panic"')
+
+    def test_positions_survive_save_and_load(self):
+        with mock.patch('model.index.Config', autospec=True, spec_set=True) as mock_config:
+            mock_config.return_value.remove_stopwords.return_value = False
+            mock_config.return_value.language.return_value = 'english'
+            mock_config.return_value.use_stemming.return_value = False
+            with tempfile.TemporaryDirectory() as directory:
+                file_name = os.path.join(directory, 'index')
+                idx = Index(positions=True)
+                with mock.patch('builtins.open', mock.mock_open(read_data=b'kernel panic')):
+                    idx.add_file('doc1')
+                with mock.patch('builtins.open', mock.mock_open(read_data=b'panic kernel')):
+                    idx.add_file('doc2')
+                idx.save(file_name)
+                loaded = Index.load(file_name)
+                assert loaded.get_result_for_query('"kernel panic"') == ['doc1']
+                with mock.patch('builtins.open', mock.mock_open(read_data=b'a kernel panic')):
+                    loaded.add_file('doc3')
+                assert loaded.get_result_for_query('"kernel panic"') == ['doc1', 'doc3']
+
+    def test_wildcard_queries(self):
+        with mock.patch('model.index.Config', autospec=True, spec_set=True) as mock_config:
+            mock_config.return_value.remove_stopwords.return_value = False
+            mock_config.return_value.language.return_value = 'english'
+            mock_config.return_value.use_stemming.return_value = False
+            idx = Index(max_expansions=3)
+            idx._add_words('doc1', {'kernel': 1, 'panic': 1})
+            idx._add_words('doc2', {'kernels': 2, 'colonel': 1})
+            idx._add_words('doc3', {'karen': 1, 'kern': 1})
+            assert idx.get_result_for_query('Kern*') == ['doc1', 'doc2', 'doc3']
+            assert idx.get_result_for_query('*nel') == ['doc1', 'doc2']
+            assert idx.get_result_for_query('kern* && !*nel', mode='dense') == ['doc3']
+            assert idx.get_results_for_queries(['k?rn*', '*nel || panic']) == [['doc1', 'doc2', 'doc3'], ['doc1', 'doc2']]
+            assert [name for name, _ in idx.get_top_results('kern*', k=1)] == ['doc2']
+            with self.assertRaises(ValueError):
+                idx.get_result_for_query('k*')
+
+            # The term dictionary follows the changes of the index
+            idx._add_words('doc4', {'kennel': 1})
+            assert idx.get_result_for_query('*nel') == ['doc1', 'doc2', 'doc4']
+            idx._remove_files(['doc2'])
+            assert idx.get_result_for_query('*nel') == ['doc1', 'doc4']
+            assert idx.get_result_for_query('kernel?') == []
+
+    def test_batch_queries_share_term_lookups(self):
+        index = defaultdict(list, {'data': [1, 3], 'some': [1, 2], 'hello': [1], 'world': [3]})
+        files = ['doc1', 'doc2', 'doc3', 'doc4']
+        queries = ['data && some', 'Some && DATA || world', '', 'data &&',
+                   '!(some && data) && hello', 'world || !hello']
+        with mock.patch('model.index.Config', autospec=True, spec_set=True) as mock_config:
+            mock_config.return_value.remove_stopwords.return_value = False
+            mock_config.return_value.language.return_value = 'english'
+            mock_config.return_value.use_stemming.return_value = False
+            idx = Index(query_cache_size=0)
+            idx._index = index
+            idx._files = files
+            with mock.patch.object(idx, '_get_postings', wraps=idx._get_postings) as m:
+                results = idx.get_results_for_queries(queries)
+            assert m.call_count == 4
+            assert results[0] == ['doc1']
+            assert results[1] == ['doc1', 'doc3']
+            assert results[2] is None
+            assert isinstance(results[3], ValueError)
+            assert results[4] == []
+            assert results[5] == ['doc2', 'doc3', 'doc4']
+            for query, result in zip(queries, results):
+                if not isinstance(result, ValueError):
+                    assert idx.get_result_for_query(query) == result
+
+    def test_batch_queries_see_changes_of_the_index(self):
+        with mock.patch('model.index.Config', autospec=True, spec_set=True) as mock_config:
+            mock_config.return_value.remove_stopwords.return_value = False
+            mock_config.return_value.language.return_value = 'english'
+            mock_config.return_value.use_stemming.return_value = False
+            idx = Index()
+            idx._add_words('doc1', {'data'})
+            results = idx.iter_results_for_queries(['data', 'data'])
+            assert next(results) == ('data', ['doc1'])
+            idx._add_words('doc2', {'data'})
+            assert next(results) == ('data', ['doc1', 'doc2'])
+            with self.assertRaises(ValueError):
+                idx.get_results_for_queries(['data'], mode='fast')
+
+    def test_wrong_query_reports_position(self):
+        with mock.patch('model.index.Config', autospec=True, spec_set=True) as mock_config:
+            mock_config.return_value.use_stemming.return_value = False
+            idx = Index()
+            with self.assertRaises(ValueError) as context:
+                idx.get_result_for_query('data && (some ||')
+            assert 'position 16' in str(context.exception)
+
+    def test_add_files_reports_results_in_order(self):
+        with mock.patch('model.index.Config', autospec=True, spec_set=True) as mock_config:
+            mock_config.return_value.remove_stopwords.return_value = False
+            mock_config.return_value.language.return_value = 'english'
+            mock_config.return_value.use_stemming.return_value = False
+            index = Index()
+            data = {'doc1': 'some data', 'doc2': 'data here'}
+
+            def open_file(name, *args):
+                if name not in data:
+                    raise FileNotFoundError
+                return mock.mock_open(read_data=data[name])()
+
+            with mock.patch('builtins.open', side_effect=open_file):
+                results = index.add_files(['doc1', 'missing', None, 'doc2', 'doc1'], workers=1)
+            assert results[0] == '[Success] The file "doc1" was added to index!'
+            assert isinstance(results[1], FileNotFoundError)
+            assert str(results[1]) == '[Error] The file "missing" does not exist!'
+            assert isinstance(results[2], ValueError)
+            assert results[3] == '[Success] The file "doc2" was added to index!'
+            assert isinstance(results[4], IndexError)
+            assert index._files == ['doc1', 'doc2']
+            assert index._index == {'some': [1], 'data': [1, 2], 'here': [2]}
+
+    def test_queries_do_not_grow_the_index(self):
+        with mock.patch('model.index.Config', autospec=True, spec_set=True) as mock_config:
+            mock_config.return_value.remove_stopwords.return_value = False
+            mock_config.return_value.language.return_value = 'english'
+            mock_config.return_value.use_stemming.return_value = False
+            idx = Index()
+            idx._add_words('doc1', {'kernel': 1, 'panic': 1})
+            for query in ('typo', 'kernel && !typo2', 'typo3 || typo4', 'typo5*'):
+                for mode in ('sparse', 'dense'):
+                    idx.get_result_for_query(query, mode)
+                idx.get_top_results(query)
+            idx._get_index_list_for_word('typo6')
+            assert idx._index == {'kernel': [1], 'panic': [1]}
+            assert idx._frequencies == {'kernel': [1], 'panic': [1]}
+
+    def test_freeze(self):
+        with mock.patch('model.index.Config', autospec=True, spec_set=True) as mock_config:
+            mock_config.return_value.remove_stopwords.return_value = False
+            mock_config.return_value.language.return_value = 'english'
+            mock_config.return_value.use_stemming.return_value = False
+            idx = Index()
+            for number in range(1, 21):
+                idx._add_words(f'doc{number}', {'common': number, f'word{number % 3}': 1})
+            queries = ['common && !word1', 'word0 || word2', 'word*']
+            expected = [idx.get_result_for_query(query) for query in queries]
+            top = idx.get_top_results('common', k=3)
+
+            idx.freeze()
+            assert idx._index['common'].typecode == 'B'
+            assert list(idx._index['common']) == list(range(1, 21))
+            assert isinstance(idx._index['word0'], list)
+            assert [idx.get_result_for_query(query, mode='dense') for query in queries] == expected
+            assert [idx.get_result_for_query(query, mode='sparse') for query in queries] == expected
+            assert idx.get_top_results('common', k=3) == top
+
+            # The arrays are widened when a value doesn't fit anymore
+            idx._add_words('doc21', {'common': 1000})
+            assert idx._frequencies['common'].typecode == 'H'
+            assert list(idx._frequencies['common'])[-2:] == [20, 1000]
+            idx._remove_files(['doc1'])
+            assert list(idx._index['common']) == list(range(1, 21))
+            assert idx.get_result_for_query('common && word1') == [f'doc{number}' for number in range(4, 21, 3)]
+
+            # The lists of a loaded index are compacted when they are decoded
+            with tempfile.TemporaryDirectory() as directory:
+                file_name = os.path.join(directory, 'index')
+                idx.save(file_name)
+                loaded = Index.load(file_name)
+                assert isinstance(loaded._index['word0'], list)
+                loaded.freeze()
+                assert loaded._index['common'].typecode == 'B'
+                assert loaded._frequencies['common'].typecode == 'H'
+                assert loaded.get_result_for_query('common && word1') == \
+                    idx.get_result_for_query('common && word1')
+
+    def test_add_directory(self):
+        with mock.patch('model.index.Config', autospec=True, spec_set=True) as mock_config:
+            mock_config.return_value.remove_stopwords.return_value = False
+            mock_config.return_value.language.return_value = 'english'
+            mock_config.return_value.use_stemming.return_value = False
+            with tempfile.TemporaryDirectory() as directory:
+                os.makedirs(os.path.join(directory, 'sub', 'skip'))
+                for name, data in (('doc1', b'kernel panic'), ('sub/doc2', b'kernel'),
+                                   ('sub/image', b'GIF\0kernel'), ('sub/skip/doc3', b'kernel')):
+                    with open(os.path.join(directory, name), 'wb') as file:
+                        file.write(data)
+                for workers in (1, 2):
+                    index = Index()
+                    reports = []
+                    report = index.add_directory(directory, exclude='skip', workers=workers,
+                                                 progress=lambda report: reports.append(report['added']))
+                    assert index.get_result_for_query('kernel') == [os.path.join(directory, 'doc1'),
+                                                                    os.path.join(directory, 'sub', 'doc2')]
+                    assert (report['added'], report['skipped'], report['binary']) == (2, 1, 1)
+                    assert report['bytes'] == 18
+                    assert report['errors'] == []
+                    assert reports[-1] == 2
+
+                    # The files already in the index are skipped
+                    report = index.add_directory(directory, workers=workers)
+                    assert (report['added'], report['skipped']) == (1, 3)
+
+                # A file that can't be decoded is reported, not raised
+                with open(os.path.join(directory, 'sub', 'latin'), 'wb') as file:
+                    file.write('caf\xe9'.encode('latin-1'))
+                for workers in (1, 2):
+                    index = Index()
+                    report = index.add_directory(directory, exclude='skip', workers=workers)
+                    assert report['added'] == 2
+                    assert [str(error) for error in report['errors']] == [
+                            f'[Error] "{os.path.join(directory, "sub", "latin")}" is not valid utf-8 text!']
+                with self.assertRaises(NotADirectoryError):
+                    index.add_directory(os.path.join(directory, 'doc1'))
+                with self.assertRaises(FileNotFoundError):
+                    index.add_directory(os.path.join(directory, 'missing'))
+
+    def test_add_files_with_worker_processes(self):
+        with mock.patch('model.index.Config', autospec=True, spec_set=True) as mock_config:
+            mock_config.return_value.remove_stopwords.return_value = False
+            mock_config.return_value.language.return_value = 'english'
+            mock_config.return_value.use_stemming.return_value = True
+            mock_config.return_value.stem_cache_size.return_value = 1000
+            with tempfile.TemporaryDirectory() as directory:
+                names = []
+                for number in range(6):
+                    name = os.path.join(directory, f'doc{number}')
+                    with open(name, 'w') as file:
+                        file.write(f'cycling word{number} common')
+                    names.append(name)
+                names.insert(2, os.path.join(directory, 'missing'))
+                index = Index()
+                results = index.add_files(names, workers=3)
+            assert isinstance(results[2], FileNotFoundError)
+            assert index._files == names[:2] + names[3:]
+            assert index._index['cycl'] == [1, 2, 3, 4, 5, 6]
+            assert index._index['word3'] == [4]
+
+    def test_worker_processes_get_the_analyzer_once(self):
+        with mock.patch('model.index.Config', autospec=True, spec_set=True) as mock_config:
+            mock_config.return_value.remove_stopwords.return_value = False
+            mock_config.return_value.language.return_value = 'english'
+            mock_config.return_value.use_stemming.return_value = True
+            mock_config.return_value.stem_cache_size.return_value = 1000
+            with tempfile.TemporaryDirectory() as directory:
+                names = []
+                for number in range(4):
+                    name = os.path.join(directory, f'doc{number}')
+                    with open(name, 'w') as file:
+                        file.write(f'cycling word{number}')
+                    names.append(name)
+                index = Index()
+                functions = []
+
+                class Executor(ThreadPoolExecutor):
+                    def submit(self, function, *args, **kwargs):
+                        functions.append(function)
+                        return super().submit(function, *args, **kwargs)
+
+                with mock.patch('model.index.ProcessPoolExecutor', Executor):
+                    index.add_files(names[:2], workers=2)
+                    index.add_directory(directory, workers=2)
+            # The analyzer is given to the workers when they start, not with
+            # the files they scan
+            assert all('analyzer' not in function.keywords for function in functions)
+            assert index._files == names[:2] + sorted(names[2:])
+            assert index._index['cycl'] == [1, 2, 3, 4]
+
+    def test_add_files_reports_files_that_are_not_utf_8(self):
+        with mock.patch('model.index.Config', autospec=True, spec_set=True) as mock_config:
+            mock_config.return_value.remove_stopwords.return_value = False
+            mock_config.return_value.language.return_value = 'english'
+            mock_config.return_value.use_stemming.return_value = False
+            with tempfile.TemporaryDirectory() as directory:
+                names = [os.path.join(directory, name) for name in ('doc1', 'latin', 'doc2')]
+                for name, data in zip(names, (b'kernel', 'caf\xe9 kernel'.encode('latin-1'), b'panic')):
+                    with open(name, 'wb') as file:
+                        file.write(data)
+                for workers in (1, 2):
+                    index = Index()
+                    results = index.add_files(names, workers=workers)
+                    assert isinstance(results[1], ValueError)
+                    assert str(results[1]) == f'[Error] "{names[1]}" is not valid utf-8 text!'
+                    assert results[2] == f'[Success] The file "{names[2]}" was added to index!'
+                    assert index._files == [names[0], names[2]]
+                    with self.assertRaises(ValueError):
+                        index.add_file(names[1])
+
+    def test_config_is_read_once_for_many_files(self):
+        with mock.patch('model.index.Config', autospec=True, spec_set=True) as mock_config:
+            mock_config.return_value.remove_stopwords.return_value = False
+            mock_config.return_value.language.return_value = 'english'
+            mock_config.return_value.use_stemming.return_value = True
+            mock_config.return_value.stem_cache_size.return_value = 1000
+            with mock.patch('builtins.open', mock.mock_open(read_data='cycling')):
+                index = Index()
+                for number in range(5):
+                    index.add_file(f'doc{number}')
+            assert index.get_result_for_query('cycles') == [f'doc{number}' for number in range(5)]
+            assert mock_config.return_value.use_stemming.call_count == 1
+
+    def test_stem_cache_stats(self):
+        with mock.patch('model.index.Config', autospec=True, spec_set=True) as mock_config:
+            mock_config.return_value.remove_stopwords.return_value = False
+            mock_config.return_value.language.return_value = 'english'
+            mock_config.return_value.use_stemming.return_value = False
+            assert Index().stem_cache_stats() is None
+            mock_config.return_value.use_stemming.return_value = True
+            mock_config.return_value.stem_cache_size.return_value = 1000
+            with mock.patch('builtins.open', mock.mock_open(read_data='cycling data')):
+                index = Index()
+                index.add_file('doc1')
+                index.add_file('doc2')
+            stats = index.stem_cache_stats()
+            assert stats['hits'] == 2
+            assert stats['misses'] == 2
+
+    def test_save_and_load(self):
+        with mock.patch('model.index.Config', autospec=True, spec_set=True) as mock_config:
+            mock_config.return_value.remove_stopwords.return_value = False
+            mock_config.return_value.language.return_value = 'english'
+            mock_config.return_value.use_stemming.return_value = True
+            mock_config.return_value.stem_cache_size.return_value = 1000
+            with tempfile.TemporaryDirectory() as directory:
+                file_name = os.path.join(directory, 'index')
+                index = Index()
+                index._index = defaultdict(list, {'data': [1, 3], 'some': [1, 2], 'hello': [1]})
+                index._files = ['doc1', 'doc2', 'doc3']
+                index.get_result_for_query('cycling')
+                index.save(file_name)
+                loaded = Index.load(file_name)
+                assert loaded._files == index._files
+                assert loaded.get_result_for_query('data && !hello') == ['doc3']
+                assert loaded.get_result_for_query('missing') == []
+                assert dict(loaded._index) == dict(index._index)
+                assert 'cycling' in loaded._analyzer.stem_cache
+                with mock.patch('builtins.open', mock.mock_open(read_data='data new')):
+                    loaded.add_file('doc4')
+                assert loaded.get_result_for_query('data') == ['doc1', 'doc3', 'doc4']
+                assert loaded.get_result_for_query('new') == ['doc4']
+
+    def test_load_warns_when_analysis_settings_changed(self):
+        with mock.patch('model.index.Config', autospec=True, spec_set=True) as mock_config:
+            mock_config.return_value.remove_stopwords.return_value = False
+            mock_config.return_value.language.return_value = 'english'
+            mock_config.return_value.use_stemming.return_value = False
+            with tempfile.TemporaryDirectory() as directory:
+                file_name = os.path.join(directory, 'index')
+                Index().save(file_name)
+                mock_config.return_value.remove_stopwords.return_value = True
+                with self.assertWarns(UserWarning):
+                    Index.load(file_name)
+
+    def test_load_file_that_does_not_exist(self):
+        with mock.patch('model.index.Config', autospec=True, spec_set=True):
+            with self.assertRaises(FileNotFoundError):
+                Index.load('not_an_index')
+
+    def test_sync_adds_updates_removes_and_skips_files(self):
+        with mock.patch('model.index.Config', autospec=True, spec_set=True) as mock_config:
+            mock_config.return_value.remove_stopwords.return_value = False
+            mock_config.return_value.language.return_value = 'english'
+            mock_config.return_value.use_stemming.return_value = False
+            with tempfile.TemporaryDirectory() as directory:
+                names = [os.path.join(directory, f'doc{number}') for number in range(4)]
+                for name, data in zip(names, ['kernel panic', 'kernel', 'panic', 'other']):
+                    with open(name, 'w') as file:
+                        file.write(data)
+                index = Index()
+                report = index.sync(names[:3], workers=1)
+                assert report == {'added': 3, 'updated': 0, 'removed': 0, 'skipped': 0, 'errors': []}
+
+                # doc0 changes, doc1 is deleted, doc3 is new, doc2 is left alone
+                with open(names[0], 'w') as file:
+                    file.write('something else entirely')
+                os.remove(names[1])
+                report = index.sync(names, workers=1)
+                assert report['added'] == 1
+                assert report['updated'] == 1
+                assert report['removed'] == 1
+                assert report['skipped'] == 1
+                assert index._files == [names[2], names[0], names[3]]
+                assert index.get_result_for_query('kernel') == []
+                assert index.get_result_for_query('panic') == [names[2]]
+                assert index.get_result_for_query('else || other') == [names[0], names[3]]
+                assert 'kernel' not in index._index
+
+                # Files left out of the list are removed too
+                report = index.sync([names[3]], workers=1)
+                assert report['removed'] == 2
+                assert report['skipped'] == 1
+                assert index._files == [names[3]]
+                assert index._index == {'other': [1]}
+
+    def test_sync_with_hash_skips_touched_files(self):
+        with mock.patch('model.index.Config', autospec=True, spec_set=True) as mock_config:
+            mock_config.return_value.remove_stopwords.return_value = False
+            mock_config.return_value.language.return_value = 'english'
+            mock_config.return_value.use_stemming.return_value = False
+            with tempfile.TemporaryDirectory() as directory:
+                name = os.path.join(directory, 'doc')
+                with open(name, 'w') as file:
+                    file.write('data')
+                index = Index()
+                index.sync([name], workers=1)
+                stat = os.stat(name)
+                os.utime(name, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+                assert index.sync([name], workers=1)['updated'] == 1
+                os.utime(name, ns=(stat.st_atime_ns, stat.st_mtime_ns + 2 * 10 ** 9))
+                report = index.sync([name], use_hash=True, workers=1)
+                assert report['skipped'] == 1
+                assert report['updated'] == 0
+                assert index.sync([name], workers=1)['skipped'] == 1
+
+    def test_file_stats_survive_save_and_load(self):
+        with mock.patch('model.index.Config', autospec=True, spec_set=True) as mock_config:
+            mock_config.return_value.remove_stopwords.return_value = False
+            mock_config.return_value.language.return_value = 'english'
+            mock_config.return_value.use_stemming.return_value = False
+            with tempfile.TemporaryDirectory() as directory:
+                name = os.path.join(directory, 'doc')
+                with open(name, 'w') as file:
+                    file.write('data')
+                index = Index()
+                index.add_file(name)
+                index.save(os.path.join(directory, 'index'))
+                loaded = Index.load(os.path.join(directory, 'index'))
+                # They are only read from the file when they are needed
+                assert loaded._read_lengths is not None
+                assert loaded._documents._read_stats is not None
+                assert loaded._file_stats == index._file_stats
+                assert list(loaded._lengths) == [1]
+                assert loaded.sync([name], workers=1)['skipped'] == 1
@@ -1,3 +1,4 @@
+from model.bitmap import Bitmap
 from model.list import IndexList
 
 import unittest
@@ -12,9 +13,10 @@ class IndexListTestCase(unittest.TestCase):
         self.data2 = [0, 1, 1, 0, 0, 1, 0, 1, 0, 1, 0]
 
     def test_pass_list_of_1_and_0(self):
-        # this tests the actual list inside the IndexList
+        # this tests the compressed bitmap inside the IndexList
         indexlist = IndexList(self.good_data)
-        assert indexlist._lst == self.good_data
+        assert list(indexlist._bitmap) == [0, 4, 5, 7, 9, 10]
+        assert indexlist._size == len(self.good_data)
 
     def test_lst_getter_works(self):
         # this tests the property getter
@@ -53,4 +55,24 @@ class IndexListTestCase(unittest.TestCase):
 
     def test_str_overriden_method(self):
         indexlist = IndexList(self.good_data)
-        assert str(indexlist) == f"IndexList({indexlist._lst})"
+        assert str(indexlist) == f"IndexList({self.good_data})"
+
+    def test_sub_overriden_method(self):
+        expected = [1, 0, 0, 0, 1, 0, 0, 0, 1, 0, 1]
+        il1 = IndexList(self.data1)
+        il2 = IndexList(self.data2)
+        assert list(il1 - il2) == expected
+
+    def test_from_bitmap_and_positions(self):
+        indexlist = IndexList.from_bitmap(Bitmap([1, 3]), 5)
+        assert indexlist.lst == [0, 1, 0, 1, 0]
+        assert list(indexlist.positions()) == [1, 3]
+        assert indexlist.cardinality() == 2
+        assert len(indexlist) == 5
+
+    def test_operations_on_lists_of_different_sizes(self):
+        il1 = IndexList([1, 1, 1, 1])
+        il2 = IndexList([0, 1])
+        assert list(il1 | il2) == [1, 1]
+        assert list(il1 & il2) == [0, 1]
+        assert list(il1 - il2) == [1, 0]
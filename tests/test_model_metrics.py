@@ -0,0 +1,67 @@
+from model.metrics import Metrics, NullMetrics, MeteredReader
+
+import io
+import unittest
+
+
+class MetricsTestCase(unittest.TestCase):
+
+    def test_timers_and_counters(self):
+        metrics = Metrics()
+        metrics.add_time('a', 2.0)
+        metrics.add_time('a', 1.0)
+        with metrics.timer('b'):
+            pass
+        metrics.count('c')
+        metrics.count('c', 4)
+        timers = metrics.timers()
+        assert timers['a'] == {'count': 2, 'total': 3.0, 'mean': 1.5,
+                               'min': 1.0, 'max': 2.0}
+        assert timers['b']['count'] == 1
+        assert metrics.counters() == {'c': 5}
+        metrics.reset()
+        assert metrics.snapshot() == {'timers': {}, 'counters': {}}
+
+    def test_hooks_receive_every_measurement(self):
+        metrics = Metrics()
+        received = []
+        hook = lambda *args: received.append(args)
+        metrics.add_hook(hook)
+        metrics.add_time('a', 0.5)
+        metrics.count('c', 2)
+        metrics.remove_hook(hook)
+        metrics.count('c')
+        assert received == [('time', 'a', 0.5), ('count', 'c', 2)]
+
+    def test_merge(self):
+        metrics = Metrics()
+        metrics.add_time('a', 1.0)
+        other = Metrics()
+        other.add_time('a', 3.0)
+        other.add_time('b', 2.0)
+        other.count('c', 7)
+        received = []
+        metrics.add_hook(lambda *args: received.append(args))
+        metrics.merge(other)
+        assert metrics.timers()['a'] == {'count': 2, 'total': 4.0,
+                                         'mean': 2.0, 'min': 1.0, 'max': 3.0}
+        assert metrics.counters() == {'c': 7}
+        assert ('count', 'c', 7) in received
+
+    def test_null_metrics_record_nothing(self):
+        metrics = NullMetrics()
+        with metrics.timer('a'):
+            pass
+        metrics.count('c')
+        metrics.merge(Metrics())
+        assert not metrics.enabled
+        assert metrics.snapshot() == {'timers': {}, 'counters': {}}
+        with self.assertRaises(ValueError):
+            metrics.add_hook(print)
+
+    def test_metered_reader(self):
+        reader = MeteredReader(io.BytesIO(b'some data'))
+        assert reader.read(4) == b'some'
+        assert reader.read() == b' data'
+        assert reader.bytes == 9
+        assert reader.seconds >= 0
@@ -0,0 +1,96 @@
+from model.positional import PositionCursor, Pattern, match
+from model.storage import encode_postings
+
+import random
+import unittest
+
+
+class PositionalTestCase(unittest.TestCase):
+
+    def setUp(self):
+        # 1: 'kernel panic at boot', 2: 'panic kernel x panic',
+        # 3: 'kernel x x x panic'
+        self.postings = {'kernel': [1, 2, 3], 'panic': [1, 2, 3],
+                         'boot': [1]}
+        positions = {'kernel': [[0], [1], [0]], 'panic': [[1], [0, 3], [4]],
+                     'boot': [[3]]}
+        self.positions = {term: [encode_postings(found) for found in lists]
+                          for term, lists in positions.items()}
+
+    def test_cursor_decodes_positions_of_a_file(self):
+        cursor = PositionCursor(self.postings['panic'],
+                                self.positions['panic'])
+        assert cursor.positions(2) == [0, 3]
+        assert cursor.positions(3) == [4]
+        assert PositionCursor([1], None).positions(1) is None
+
+    def test_phrase(self):
+        phrase = Pattern([(0, 'kernel'), (1, 'panic')], 2)
+        assert match([phrase], self.postings, self.positions) == [1]
+        phrase = Pattern([(0, 'panic'), (1, 'kernel')], 2)
+        assert match([phrase], self.postings, self.positions) == [2]
+        # 'kernel' and 'boot' with 2 words left out in between
+        phrase = Pattern([(0, 'kernel'), (3, 'boot')], 4)
+        assert match([phrase], self.postings, self.positions) == [1]
+        assert match([Pattern([], 1)], self.postings, self.positions) == []
+
+    def test_near(self):
+        kernel = Pattern([(0, 'kernel')], 1)
+        panic = Pattern([(0, 'panic')], 1)
+        assert match([kernel, panic], self.postings, self.positions, 1) == \
+            [1, 2]
+        assert match([panic, kernel], self.postings, self.positions, 4) == \
+            [1, 2, 3]
+        phrase = Pattern([(0, 'kernel'), (1, 'panic')], 2)
+        boot = Pattern([(0, 'boot')], 1)
+        assert match([boot, phrase], self.postings, self.positions, 2) == [1]
+        assert match([boot, phrase], self.postings, self.positions, 1) == []
+
+    def test_near_does_not_match_overlapping_patterns(self):
+        kernel = Pattern([(0, 'kernel')], 1)
+        # Every file has a single 'kernel', which is not near itself
+        assert match([kernel, kernel], self.postings, self.positions,
+                     1) == []
+        phrase = Pattern([(0, 'kernel'), (1, 'panic')], 2)
+        assert match([kernel, phrase], self.postings, self.positions,
+                     5) == []
+        assert match([phrase, kernel], self.postings, self.positions,
+                     5) == []
+        # 'panic' twice in file 2, 2 words apart
+        panic = Pattern([(0, 'panic')], 1)
+        assert match([panic, panic], self.postings, self.positions, 3) == [2]
+        assert match([panic, panic], self.postings, self.positions, 2) == []
+
+    def test_near_matches_a_brute_force_search(self):
+        rng = random.Random(3)
+        for _ in range(200):
+            words = [rng.choice('ab') for _ in range(rng.randrange(1, 9))]
+            positions = {word: [position for position, found
+                                in enumerate(words) if found == word]
+                         for word in 'ab'}
+            postings = {word: [1] if positions[word] else []
+                        for word in 'ab'}
+            encoded = {word: [encode_postings(positions[word])]
+                       for word in 'ab'}
+            left = rng.choice([Pattern([(0, 'a')], 1),
+                               Pattern([(0, 'a'), (1, 'b')], 2)])
+            right = rng.choice([Pattern([(0, 'a')], 1),
+                                Pattern([(0, 'b')], 1),
+                                Pattern([(0, 'b'), (1, 'a')], 2)])
+            distance = rng.randrange(1, 4)
+            expected = any(
+                    second >= first + left.length
+                    and second - (first + left.length - 1) <= distance
+                    or first >= second + right.length
+                    and first - (second + right.length - 1) <= distance
+                    for first in _starts(words, left)
+                    for second in _starts(words, right))
+            assert match([left, right], postings, encoded, distance) == (
+                    [1] if expected else []), (words, distance)
+
+
+def _starts(words, pattern):
+    return [start for start in range(len(words))
+            if all(start + offset < len(words)
+                   and words[start + offset] == term
+                   for offset, term in pattern.terms)]
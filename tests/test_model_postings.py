@@ -0,0 +1,43 @@
+from model.postings import (gallop, intersect, intersect_all, union,
+                            difference, complement)
+
+import unittest
+
+
+class PostingsTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.data1 = [1, 3, 4, 7, 9, 12, 15, 20]
+        self.data2 = [2, 3, 7, 8, 15, 21]
+
+    def test_gallop(self):
+        for target in range(0, 23):
+            expected = len([value for value in self.data1 if value < target])
+            assert gallop(self.data1, target) == expected
+        assert gallop(self.data1, 9, 5) == 5
+        assert gallop(self.data1, 10, 2) == 5
+        assert gallop([], 3) == 0
+
+    def test_intersect(self):
+        assert intersect(self.data1, self.data2) == [3, 7, 15]
+        assert intersect(self.data2, self.data1) == [3, 7, 15]
+        assert intersect(self.data1, []) == []
+
+    def test_intersect_all(self):
+        assert intersect_all([self.data1, self.data2, [7, 15, 30]]) == [7, 15]
+        assert intersect_all([self.data1, [], self.data2]) == []
+
+    def test_union(self):
+        assert union([self.data1, self.data2]) == sorted(set(self.data1) |
+                                                         set(self.data2))
+        assert union([[], self.data2]) == self.data2
+        assert union([]) == []
+
+    def test_difference(self):
+        assert difference(self.data1, self.data2) == [1, 4, 9, 12, 20]
+        assert difference(self.data1, []) == self.data1
+
+    def test_complement(self):
+        assert complement([2, 3, 6], 7) == [1, 4, 5, 7]
+        assert complement([], 3) == [1, 2, 3]
+        assert complement([1, 2, 3], 3) == []
@@ -0,0 +1,206 @@
+from model.query import (CompiledQuery, QuerySyntaxError, Term, Phrase, Near,
+                         Wildcard, Not, And, Or, Constant, canonical, parse,
+                         plan, tokenize)
+from model.cache import LRUCache
+from model.list import IndexList
+
+import unittest
+import unittest.mock as mock
+
+
+class QueryTestCase(unittest.TestCase):
+
+    def test_tokenize(self):
+        tokens = tokenize('a && !(b||c) ')
+        assert tokens == [('word', 'a', 0), ('operator', '&&', 2),
+                          ('operator', '!', 5), ('operator', '(', 6),
+                          ('word', 'b', 7), ('operator', '||', 8),
+                          ('word', 'c', 10), ('operator', ')', 11),
+                          ('end', '', 13)]
+
+    def test_parse_precedence(self):
+        ast = parse('from || !source && (kernel || input)')
+        expected = Or([Term('from'),
+                       And([Not(Term('source')),
+                            Or([Term('kernel'), Term('input')])])])
+        assert ast == expected
+
+    def test_parse_chains_are_flat(self):
+        assert parse('a && b && c') == And([Term('a'), Term('b'), Term('c')])
+
+    def test_parse_double_negation(self):
+        assert parse('!!a') == Not(Not(Term('a')))
+
+    def test_unknown_character_reports_position(self):
+        with self.assertRaises(QuerySyntaxError) as context:
+            parse('data &&  some. hello')
+        assert context.exception.position == 13
+
+    def test_missing_operand_reports_position(self):
+        with self.assertRaises(QuerySyntaxError) as context:
+            parse('data && ')
+        assert context.exception.position == 8
+
+    def test_missing_operator_reports_position(self):
+        with self.assertRaises(QuerySyntaxError) as context:
+            parse('data some')
+        assert context.exception.position == 5
+
+    def test_unbalanced_parentheses(self):
+        with self.assertRaises(QuerySyntaxError) as context:
+            parse('(data || some')
+        assert context.exception.position == 13
+        with self.assertRaises(QuerySyntaxError):
+            parse('data)')
+
+    def test_parse_phrases_and_near(self):
+        assert tokenize('"Kernel, panic" NEAR/3 x') == [
+                ('phrase', ('Kernel', 'panic'), 0), ('operator', 'NEAR/3', 16),
+                ('word', 'x', 23), ('end', '', 24)]
+        ast = parse('!"kernel panic" && boot NEAR/2 "at" || NEARBY')
+        expected = Or([And([Not(Phrase(['kernel', 'panic'])),
+                            Near([Term('boot'), Term('at')], 2)]),
+                       Term('NEARBY')])
+        assert ast == expected
+        assert canonical(parse('"B a" NEAR/2 c')) == \
+            canonical(parse('C NEAR/2 "b A"'))
+        assert CompiledQuery('"a b" && c').terms == ['a', 'b', 'c']
+
+    def test_wrong_phrases_and_near(self):
+        with self.assertRaises(QuerySyntaxError) as context:
+            parse('data && "kernel panic')
+        assert context.exception.position == 8
+        with self.assertRaises(QuerySyntaxError) as context:
+            parse('data && " "')
+        assert context.exception.position == 8
+        with self.assertRaises(QuerySyntaxError) as context:
+            parse('a NEAR/2 b NEAR/2 c')
+        assert context.exception.position == 11
+        with self.assertRaises(QuerySyntaxError):
+            parse('a NEAR/2 (b || c)')
+        with self.assertRaises(QuerySyntaxError):
+            parse('a NEAR/2')
+        with self.assertRaises(QuerySyntaxError) as context:
+            parse('"a b" NEAR/0 c')
+        assert context.exception.position == 6
+        assert 'at least 1' in str(context.exception)
+
+    def test_parse_wildcards(self):
+        assert parse('kern* && !*NEL || k?rn') == \
+            Or([And([Wildcard('kern*'), Not(Wildcard('*NEL'))]),
+                Wildcard('k?rn')])
+        assert canonical(parse('Kern* && a')) == \
+            And([Term('a'), Wildcard('kern*')])
+        assert CompiledQuery('kern* && a').terms == ['a']
+        with self.assertRaises(QuerySyntaxError) as context:
+            parse('a && *?')
+        assert context.exception.position == 5
+        with self.assertRaises(QuerySyntaxError):
+            parse('"kernel pan*"')
+        with self.assertRaises(QuerySyntaxError):
+            parse('kern* NEAR/2 panic')
+        with self.assertRaises(QuerySyntaxError):
+            parse('panic NEAR/2 kern*')
+
+    def test_syntax_error_is_value_error(self):
+        with self.assertRaises(ValueError):
+            parse('&&')
+
+    def test_terms_are_distinct_and_ordered(self):
+        query = CompiledQuery('b && (a || b) && !c')
+        assert query.terms == ['b', 'a', 'c']
+
+    def test_execute_looks_up_every_term_once(self):
+        lists = {'a': IndexList([1, 1, 0, 0]), 'b': IndexList([0, 1, 1, 0])}
+        index = mock.Mock()
+        index._get_index_list_for_word.side_effect = lists.get
+        query = CompiledQuery('(a && b) || (a && !b)')
+        assert list(query.execute(index)) == [1, 1, 0, 0]
+        assert index._get_index_list_for_word.call_count == 2
+
+    def test_sparse_and_dense_modes_give_the_same_documents(self):
+        index = mock.Mock()
+        index._files = ['doc'] * 10
+        postings = {'a': [1, 2, 3, 8], 'b': [2, 3, 9, 10], 'c': [5],
+                    'd': []}
+        index._get_postings.side_effect = postings.get
+        queries = ['a && b', 'a || c', '!a', '!a && !b', '!a || b',
+                   '!(a || b) || c', 'a && !b && !c', '!a || !b',
+                   '(a || d) && !(b && c)', 'd', '!d && !!c']
+        for text in queries:
+            query = CompiledQuery(text)
+            sparse = query.documents(index, 'sparse')
+            assert sparse == query.documents(index, 'dense'), text
+            assert sparse == query.documents(index, 'auto'), text
+
+    def test_plan(self):
+        postings = {'a': [1, 2, 3, 4, 5, 6], 'b': [2, 7, 9], 'c': [],
+                    'd': list(range(1, 11))}
+        cases = {
+            # Negations are pushed down to the words
+            '!(a && b)': Or([Not(Term('a')), Not(Term('b'))]),
+            '!(a || !b)': And([Term('b'), Not(Term('a'))]),
+            # The rarest operand of && comes first
+            'a && (b && a)': And([Term('b'), Term('a')]),
+            # Words in no file or in every file are folded
+            'a && c': Constant(False),
+            'b || c': Term('b'),
+            '!c && a && d': Term('a'),
+            'b || !d || c': Term('b'),
+            'a && !a': Constant(False),
+            'a || !a': Constant(True),
+        }
+        for text, expected in cases.items():
+            assert plan(parse(text), postings, 10) == expected, text
+
+    def test_and_stops_at_the_first_empty_result(self):
+        index = mock.Mock()
+        index._files = ['doc'] * 10
+        postings = {'a': [1, 2], 'b': [3, 4], 'c': [1, 2, 3, 4, 5]}
+        index._get_postings.side_effect = postings.get
+        query = CompiledQuery('a && b && !c')
+        # a && b is empty, so !c is never subtracted
+        with mock.patch('model.query.difference') as difference:
+            assert query.documents(index, 'sparse') == []
+        difference.assert_not_called()
+
+    def test_explain(self):
+        index = mock.Mock()
+        index._files = ['doc'] * 10
+        postings = {'a': [1, 2, 3, 4, 5, 6], 'b': [2, 7, 9], 'c': []}
+        index._get_postings.side_effect = postings.get
+        assert CompiledQuery('b && !(a || c)').explain(index) == (
+                "ANDNOT: ~1 files, cost 9\n"
+                "  Term('b'): ~3 files, cost 0\n"
+                "  NOT: ~4 files, cost 0\n"
+                "    Term('a'): ~6 files, cost 0")
+        assert CompiledQuery('!a').explain(index).endswith(
+                'COMPLEMENT: cost 10')
+
+    def test_unknown_mode_raises_value_error(self):
+        with self.assertRaises(ValueError):
+            CompiledQuery('a').documents(mock.Mock(), 'fast')
+
+    def test_canonical_form(self):
+        assert canonical(parse('B && a')) == canonical(parse('a && b'))
+        assert canonical(parse('(a || b) || (c || a)')) == \
+            Or([Term('a'), Term('b'), Term('c')])
+        assert canonical(parse('!!a && a')) == Term('a')
+        assert canonical(parse('!(b && a) || c')) == \
+            canonical(parse('c || !(a && b)'))
+        assert canonical(parse('a && b')) != canonical(parse('a || b'))
+
+    def test_subquery_cache_is_used(self):
+        index = mock.Mock()
+        index._files = ['doc'] * 10
+        postings = {'a': [1, 2, 3, 8], 'b': [2, 3, 9, 10], 'c': [5],
+                    'd': [7]}
+        index._get_postings.side_effect = postings.get
+        cache = LRUCache(10)
+        first = CompiledQuery('(a && b) || c')
+        assert first.documents(index, 'sparse', cache) == [2, 3, 5]
+        assert cache.misses == 2
+        second = CompiledQuery('d || (B && A)')
+        assert second.documents(index, 'sparse', cache) == [2, 3, 7]
+        assert cache.hits == 1
+        assert cache.get(And([Term('a'), Term('b')])) == ([2, 3], False)
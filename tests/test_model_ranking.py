@@ -0,0 +1,98 @@
+from model.query import parse
+from model.ranking import (BM25, TermCursor, scoring_words, is_disjunction,
+                           top_k_wand, top_k_max_score)
+
+import random
+import unittest
+
+
+class RankingTestCase(unittest.TestCase):
+
+    def setUp(self):
+        generator = random.Random(7)
+        self.size = 400
+        self.bm25 = BM25([generator.randint(1, 60)
+                          for _ in range(self.size)])
+        self.terms = {}
+        for word in 'abcde':
+            postings = sorted(generator.sample(range(1, self.size + 1),
+                                               generator.randint(1, 200)))
+            frequencies = [generator.randint(1, 6) for _ in postings]
+            self.terms[word] = (postings, frequencies)
+
+    def cursors(self, words):
+        cursors = []
+        for word in words:
+            postings, frequencies = self.terms[word]
+            idf = self.bm25.idf(len(postings))
+            cursors.append(TermCursor(postings, frequencies, idf,
+                                      self.bm25.upper_bound(
+                                          idf, max(frequencies))))
+        return cursors
+
+    def brute_force(self, words, candidates, k):
+        scores = []
+        for number in candidates:
+            score = 0.0
+            for word in words:
+                postings, frequencies = self.terms[word]
+                if number in postings:
+                    score += self.bm25.score(
+                            self.bm25.idf(len(postings)),
+                            frequencies[postings.index(number)],
+                            self.bm25.length(number))
+            scores.append((number, score))
+        scores.sort(key=lambda pair: (-pair[1], pair[0]))
+        return scores[:k]
+
+    def assert_same_ranking(self, result, expected):
+        assert [number for number, _ in result] == \
+            [number for number, _ in expected]
+        for (_, score), (_, expected_score) in zip(result, expected):
+            self.assertAlmostEqual(score, expected_score)
+
+    def test_bm25(self):
+        bm25 = BM25([10, 20, 0])
+        assert bm25.documents == 3
+        assert bm25.length(3) == 15
+        assert bm25.idf(1) > bm25.idf(2) > bm25.idf(3) > 0
+        assert bm25.score(1.0, 2, 10) > bm25.score(1.0, 1, 10)
+        assert bm25.score(1.0, 1, 10) > bm25.score(1.0, 1, 20)
+        assert bm25.upper_bound(1.0, 2) >= bm25.score(1.0, 2, 10)
+
+    def test_scoring_words(self):
+        assert scoring_words(parse('a && !(b || c) || a || d')) == ['a', 'd']
+        assert is_disjunction(parse('a || b || c'))
+        assert is_disjunction(parse('a'))
+        assert not is_disjunction(parse('a || b && c'))
+        assert not is_disjunction(parse('a || !b'))
+
+    def test_wand_matches_brute_force(self):
+        words = ['a', 'b', 'c', 'd']
+        candidates = sorted(set().union(*(self.terms[word][0]
+                                          for word in words)))
+        for k in (1, 3, 10, 50, 1000):
+            result = top_k_wand(self.cursors(words), k, self.bm25)
+            self.assert_same_ranking(
+                    result, self.brute_force(words, candidates, k))
+
+    def test_max_score_matches_brute_force(self):
+        # (a && d) || e
+        candidates = sorted(set(self.terms['a'][0]) & set(self.terms['d'][0])
+                            | set(self.terms['e'][0]))
+        words = ['a', 'd', 'e']
+        for k in (1, 3, 10, 50, 1000):
+            result = top_k_max_score(self.cursors(words), candidates, k,
+                                     self.bm25)
+            self.assert_same_ranking(
+                    result, self.brute_force(words, candidates, k))
+
+    def test_ties_keep_the_order_of_the_files(self):
+        bm25 = BM25([5] * 6)
+        idf = bm25.idf(4)
+        cursor = TermCursor([2, 3, 5, 6], None, idf,
+                            bm25.upper_bound(idf, 1))
+        assert [number for number, _ in top_k_wand([cursor], 2, bm25)] == \
+            [2, 3]
+        assert top_k_max_score([], [1, 4, 6], 2, bm25) == \
+            [(1, 0.0), (4, 0.0)]
@@ -0,0 +1,59 @@
+from model import Index, ShardedIndex
+
+import os
+import tempfile
+import unittest
+
+
+class ShardedIndexTestCase(unittest.TestCase):
+
+    # The shards live in other processes, so the config can't be mocked:
+    # they read the config.json of the repository
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.names = []
+        for number in range(30):
+            name = os.path.join(self.directory.name, f'doc{number}')
+            with open(name, 'w') as file:
+                file.write(f'word{number % 3} word{number % 5} common')
+            self.names.append(name)
+        self.index = ShardedIndex(3)
+        self.addCleanup(self.index.close)
+
+    def test_sharded_index_matches_index(self):
+        missing = os.path.join(self.directory.name, 'missing')
+        results = self.index.add_files(self.names[:20] + [missing, self.names[0]])
+        assert isinstance(results[20], FileNotFoundError)
+        assert isinstance(results[21], IndexError)
+        for name in self.names[20:]:
+            self.index.add_file(name)
+        with self.assertRaises(IndexError):
+            self.index.add_file(self.names[0])
+        assert len(self.index) == 30
+        assert sum(self.index.shards) == 30
+        assert all(self.index.shards)
+
+        index = Index()
+        index.add_files(self.names, workers=1)
+        for query in ('word1 && word2', 'word0 || !word4', '!common', 'word1 || word3'):
+            for mode in ('sparse', 'dense'):
+                assert self.index.get_result_for_query(query, mode) == \
+                    index.get_result_for_query(query, mode)
+        self.index.freeze()
+        top = self.index.get_top_results('word1 || word3', k=4)
+        assert len(top) == 4
+        assert [score for _, score in top] == sorted((score for _, score in top), reverse=True)
+        assert self.index.get_result_for_query('word1', top_k=2) == [name for name, _ in self.index.get_top_results('word1', 2)]
+        assert self.index.get_result_for_query('') is None
+
+    def test_errors_of_the_shards_are_raised(self):
+        with self.assertRaises(ValueError):
+            self.index.get_result_for_query('word1 &&')
+        with self.assertRaises(ValueError):
+            self.index.get_result_for_query('"word1 word2"')
+        with self.assertRaises(ValueError):
+            self.index.get_top_results('word1', k=0)
+        with self.assertRaises(FileNotFoundError):
+            self.index.add_file(os.path.join(self.directory.name, 'missing'))
@@ -0,0 +1,166 @@
+from model.storage import (encode_postings, decode_postings, write_index,
+                           encode_frequencies, decode_frequencies,
+                           encode_positions, decode_positions,
+                           encode_array, IndexFile, LazyPostings, MAGIC_V1,
+                           _HEADER_V1, _ENTRY_V1)
+
+import json
+import os
+import struct
+import tempfile
+import unittest
+
+
+class StorageTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.file_name = os.path.join(self.directory.name, 'index')
+        self.files = ['doc1', 'dir/doc2', 'dïr/doc3']
+        self.index = {'data': [1, 3], 'some': [1, 2], 'hello': [1],
+                      'wörld': [3], 'empty': []}
+        self.frequencies = {'data': [2, 1], 'some': [1, 300], 'hello': [5]}
+        self.positions = {'data': [encode_postings([0, 7]),
+                                   encode_postings([3])]}
+        write_index(self.file_name, self.files, self.index, {'key': 'value'},
+                    self.frequencies, self.positions)
+        self.index_file = IndexFile(self.file_name)
+
+    def tearDown(self):
+        self.index_file.close()
+        self.directory.cleanup()
+
+    def test_encode_and_decode_postings(self):
+        postings = [1, 5, 300, 301, 100000, 2 ** 32 + 7]
+        assert encode_postings([1, 5, 300]) == b'\x01\x04\xa7\x02'
+        assert decode_postings(encode_postings(postings)) == postings
+        assert decode_postings(encode_postings([])) == []
+
+    def test_files_and_metadata(self):
+        assert self.index_file.files() == self.files
+        assert self.index_file.metadata() == {'key': 'value'}
+
+    def test_terms_are_sorted_and_empty_postings_skipped(self):
+        assert list(self.index_file.terms()) == ['data', 'hello', 'some',
+                                                 'wörld']
+        assert len(self.index_file) == 4
+
+    def test_find_and_postings(self):
+        for term in ['data', 'hello', 'some', 'wörld']:
+            position = self.index_file.find(term)
+            assert self.index_file.postings(position) == self.index[term]
+            assert self.index_file.document_frequency(position) == \
+                len(self.index[term])
+        assert self.index_file.find('missing') is None
+        assert self.index_file.find('aaa') is None
+        assert self.index_file.find('zzz') is None
+
+    def test_not_an_index_file(self):
+        with open(self.file_name, 'wb') as file:
+            file.write(b'something else entirely, but long enough to read')
+        with self.assertRaises(ValueError):
+            IndexFile(self.file_name)
+
+    def test_truncated_or_corrupt_index_file(self):
+        write_index(self.file_name, self.files, self.index, {'key': 'value'},
+                    sections={'raw': b'\0\1'})
+        with open(self.file_name, 'rb') as file:
+            data = file.read()
+        # The section table is at the end of the file, the length of the
+        # last section in its last 8 bytes
+        for broken in (data[:-1], data[:-8] + struct.pack('<Q', 1 << 40)):
+            with open(self.file_name, 'wb') as file:
+                file.write(broken)
+            with self.assertRaises(ValueError) as context:
+                IndexFile(self.file_name)
+            assert str(context.exception) == \
+                f'[Error] "{self.file_name}" is not an index file!'
+
+    def test_lazy_postings_are_decoded_once(self):
+        postings = LazyPostings(self.index_file)
+        assert postings._decoded == {}
+        assert postings['some'] == [1, 2]
+        assert postings['some'] is postings['some']
+        assert list(postings._decoded) == ['some']
+        with self.assertRaises(KeyError):
+            postings['missing']
+        assert postings.get('missing') is None
+
+    def test_lazy_postings_can_be_changed(self):
+        postings = LazyPostings(self.index_file)
+        postings.setdefault('data', []).append(4)
+        postings.setdefault('new', []).append(4)
+        del postings['hello']
+        assert 'hello' not in postings
+        assert 'new' in postings
+        assert dict(postings) == {'data': [1, 3, 4], 'some': [1, 2],
+                                  'wörld': [3], 'new': [4]}
+        assert len(postings) == 4
+
+    def test_lazy_postings_compact(self):
+        postings = LazyPostings(self.index_file)
+        assert postings['some'] == [1, 2]
+        postings.compact(tuple)
+        assert postings._decoded == {'some': (1, 2)}
+        # The lists decoded afterwards are converted too
+        assert postings['data'] == (1, 3)
+
+    def test_frequencies(self):
+        assert decode_frequencies(encode_frequencies([1, 300, 0])) == \
+            [1, 300, 0]
+        for term, frequencies in self.frequencies.items():
+            position = self.index_file.find(term)
+            assert self.index_file.frequencies(position) == frequencies
+        assert self.index_file.frequencies(self.index_file.find('wörld')) \
+            is None
+        frequencies = LazyPostings(self.index_file,
+                                   self.index_file.frequencies)
+        assert frequencies['some'] == [1, 300]
+        assert frequencies.get('wörld') is None
+
+    def test_positions(self):
+        encoded = [encode_postings([0, 200]), b'', encode_postings([5])]
+        assert decode_positions(encode_positions(encoded)) == encoded
+        positions = self.index_file.positions(self.index_file.find('data'))
+        assert [decode_postings(found) for found in positions] == [[0, 7],
+                                                                   [3]]
+        assert self.index_file.positions(self.index_file.find('some')) \
+            is None
+
+    def test_sections(self):
+        assert self.index_file.section('lengths') is None
+        write_index(self.file_name, self.files, self.index, {'key': 'value'},
+                    sections={'lengths': encode_array([3, 2 ** 32 - 1], 'I'),
+                              'raw': b'\0\1'})
+        index_file = IndexFile(self.file_name)
+        assert index_file.has_section('raw')
+        assert not index_file.has_section('missing')
+        assert index_file.section('raw') == b'\0\1'
+        assert list(index_file.array('lengths', 'I')) == [3, 2 ** 32 - 1]
+        assert index_file.array('missing', 'I') is None
+        assert index_file.files() == self.files
+        assert index_file.metadata() == {'key': 'value'}
+        index_file.close()
+
+    def test_read_first_version_of_the_format(self):
+        names = b'doc1\0doc2'
+        table = _ENTRY_V1.pack(0, 4, 0, 2, 2)
+        meta = json.dumps({'key': 'value'}).encode()
+        offset = len(MAGIC_V1) + _HEADER_V1.size
+        with open(self.file_name, 'wb') as file:
+            file.write(MAGIC_V1)
+            file.write(_HEADER_V1.pack(
+                    2, 1, offset, offset + len(names),
+                    offset + len(names) + len(table),
+                    offset + len(names) + len(table) + 4,
+                    offset + len(names) + len(table) + 6, len(meta)))
+            file.write(names + table + b'data' + encode_postings([1, 2])
+                       + meta)
+        index_file = IndexFile(self.file_name)
+        assert index_file.files() == ['doc1', 'doc2']
+        assert index_file.metadata() == {'key': 'value'}
+        position = index_file.find('data')
+        assert index_file.postings(position) == [1, 2]
+        assert index_file.frequencies(position) is None
+        assert index_file.positions(position) is None
+        index_file.close()
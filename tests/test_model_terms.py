@@ -0,0 +1,50 @@
+from model.terms import TermDictionary
+
+import random
+import re
+import unittest
+
+
+class TermDictionaryTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.terms = TermDictionary(['kernel', 'kernels', 'kern', 'panic',
+                                     'panicking', 'colonel', 'karen'])
+
+    def test_prefix(self):
+        assert self.terms.prefix('kern') == ['kern', 'kernel', 'kernels']
+        assert self.terms.prefix('k') == ['karen', 'kern', 'kernel',
+                                          'kernels']
+        assert self.terms.prefix('x') == []
+
+    def test_suffix(self):
+        assert self.terms.suffix('nel') == ['colonel', 'kernel']
+        assert self.terms.suffix('kernels') == ['kernels']
+        assert self.terms.suffix('z') == []
+
+    def test_wildcard(self):
+        assert self.terms.wildcard('k*n*l') == ['kernel']
+        assert self.terms.wildcard('k?rn*') == ['kern', 'kernel', 'kernels']
+        assert self.terms.wildcard('*ic*') == ['panic', 'panicking']
+        assert self.terms.wildcard('pan?c') == ['panic']
+        assert self.terms.wildcard('kern') == ['kern']
+        assert self.terms.wildcard('ker') == []
+        assert len(self.terms.wildcard('*')) == len(self.terms) == 7
+
+    def test_added_terms_are_found(self):
+        self.terms.add('kennel')
+        self.terms.add('abc')
+        assert len(self.terms) == 9
+        assert self.terms.suffix('nel') == ['colonel', 'kennel', 'kernel']
+        assert self.terms.wildcard('a?c') == ['abc']
+
+    def test_wildcard_matches_a_scan(self):
+        generator = random.Random(3)
+        words = {''.join(generator.choice('abc')
+                         for _ in range(generator.randint(1, 6)))
+                 for _ in range(300)}
+        terms = TermDictionary(words)
+        for pattern in ('a*', '*b', 'a?c*', '*a*b', 'c*a?', '??', 'a*b*c'):
+            regex = re.compile(pattern.replace('*', '.*').replace('?', '.'))
+            assert terms.wildcard(pattern) == sorted(
+                    word for word in words if regex.fullmatch(word))
@@ -0,0 +1,80 @@
+from model.tokenizer import unique_words, new_digest
+
+import io
+import unittest
+
+
+class TokenizerTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.text = 'Some DATA here, some_more data;\nkernel panic 42 x'
+        self.expected = {'some', 'data', 'here', 'some_more', 'kernel',
+                         'panic', '42', 'x'}
+
+    def test_text_file(self):
+        assert unique_words(io.StringIO(self.text)) == self.expected
+
+    def test_binary_file(self):
+        file = io.BytesIO(self.text.encode())
+        assert unique_words(file, encoding='utf-8') == self.expected
+
+    def test_words_spanning_chunks(self):
+        for chunk_size in range(1, 12):
+            file = io.BytesIO(self.text.encode())
+            assert unique_words(file, chunk_size, 'utf-8') == self.expected
+            file = io.StringIO(self.text)
+            assert unique_words(file, chunk_size) == self.expected
+
+    def test_non_ascii_characters_spanning_chunks(self):
+        text = 'café Ÿes naïve ascii ÉCOLE'
+        expected = set(text.lower().split())
+        for chunk_size in range(1, 8):
+            file = io.BytesIO(text.encode('utf-8'))
+            assert unique_words(file, chunk_size, 'utf-8') == expected
+
+    def test_same_words_as_reading_the_whole_file(self):
+        text = 'ascii start ' * 50 + 'ünïcödé wörds ' * 30 + 'end_word'
+        expected = set(text.lower().split())
+        file = io.BytesIO(text.encode('utf-8'))
+        assert unique_words(file, 64, 'utf-8') == expected
+
+    def test_empty_file(self):
+        assert unique_words(io.BytesIO(b''), encoding='utf-8') == set()
+
+    def test_wrong_encoding_raises_unicode_decode_error(self):
+        with self.assertRaises(UnicodeDecodeError):
+            unique_words(io.BytesIO(b'ok \xff\xfe'), encoding='utf-8')
+
+    def test_digest_is_computed_while_reading(self):
+        data = self.text.encode()
+        digest = new_digest()
+        unique_words(io.BytesIO(data), 7, 'utf-8', digest)
+        expected = new_digest()
+        expected.update(data)
+        assert digest.hexdigest() == expected.hexdigest()
+
+    def test_tokens_are_counted(self):
+        for file in (io.StringIO(self.text), io.BytesIO(self.text.encode())):
+            for chunk_size in (3, 100):
+                file.seek(0)
+                counts = {'tokens': 0}
+                unique_words(file, chunk_size, 'utf-8', counts=counts)
+                assert counts['tokens'] == 9
+
+    def test_word_frequencies(self):
+        text = 'Data café data ünï café DATA x'
+        expected = {'data': 3, 'café': 2, 'ünï': 1, 'x': 1}
+        for chunk_size in (2, 5, 100):
+            file = io.BytesIO(text.encode('utf-8'))
+            assert unique_words(file, chunk_size, 'utf-8',
+                                frequencies=True) == expected
+
+    def test_word_positions(self):
+        text = 'Data café data ünï café DATA x'
+        expected = {'data': [0, 2, 5], 'café': [1, 4], 'ünï': [3], 'x': [6]}
+        for chunk_size in (2, 5, 100):
+            file = io.BytesIO(text.encode('utf-8'))
+            assert unique_words(file, chunk_size, 'utf-8',
+                                positions=True) == expected
+            assert unique_words(io.StringIO(text), chunk_size,
+                                positions=True) == expected
@@ -0,0 +1,76 @@
+from model.query import CompiledQuery
+from model.list import IndexList
+from model.vector import BitVector, HAVE_NUMPY
+
+import random
+import unittest
+import unittest.mock as mock
+
+
+@unittest.skipUnless(HAVE_NUMPY, 'NumPy is not installed')
+class BitVectorTestCase(unittest.TestCase):
+
+    def test_operators_match_index_list(self):
+        rng = random.Random(7)
+        # Around the 64 bits of a word, where the tail mask matters
+        for size in (1, 63, 64, 65, 130):
+            first = sorted(rng.sample(range(1, size + 1), size // 2))
+            second = sorted(rng.sample(range(1, size + 1), size // 3))
+            vectors = (BitVector.from_postings(first, size),
+                       BitVector.from_postings(second, size))
+            lists = (IndexList.from_postings(first, size),
+                     IndexList.from_postings(second, size))
+            for operation in (lambda a, b: a & b, lambda a, b: a | b,
+                              lambda a, b: a - b, lambda a, b: ~a,
+                              lambda a, b: ~(a | b)):
+                vector = operation(*vectors)
+                expected = operation(*lists)
+                assert vector.positions() == list(expected.positions()), size
+                assert vector.cardinality() == expected.cardinality(), size
+
+    def test_invert_leaves_the_tail_empty(self):
+        vector = ~BitVector.from_postings([], 3)
+        assert vector.positions() == [0, 1, 2]
+        assert vector.cardinality() == 3
+        assert (~vector).positions() == []
+
+    def test_empty_index(self):
+        vector = BitVector.from_postings([], 0)
+        assert (~vector).positions() == []
+        assert vector.cardinality() == 0
+
+
+class VectorModeTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.index = mock.Mock()
+        self.index._files = ['doc'] * 70
+        postings = {'a': [1, 2, 3, 8, 64, 65], 'b': [2, 3, 9, 10, 65, 70],
+                    'c': [5, 66], 'd': []}
+        self.index._get_postings.side_effect = postings.get
+        self.queries = ['a && b', 'a || c', '!a', '!a && !b', '!a || b',
+                        '!(a || b) || c', 'a && !b && !c', 'd', '!d && c']
+
+    @unittest.skipUnless(HAVE_NUMPY, 'NumPy is not installed')
+    def test_vector_and_sparse_modes_give_the_same_documents(self):
+        vectors = {}
+        for text in self.queries:
+            query = CompiledQuery(text)
+            assert (query.documents(self.index, 'vector', vectors=vectors)
+                    == query.documents(self.index, 'sparse')), text
+        # The BitVectors of the words are kept and used again
+        vector = vectors['a']
+        CompiledQuery('a && c').documents(self.index, 'vector',
+                                          vectors=vectors)
+        assert vectors['a'] is vector
+
+    @mock.patch('model.query.HAVE_NUMPY', False)
+    def test_falls_back_to_dense_without_numpy(self):
+        query = CompiledQuery('a && !c')
+        with self.assertWarns(RuntimeWarning):
+            result = query.documents(self.index, 'vector')
+        assert result == query.documents(self.index, 'sparse')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,141 @@
+from model import Index
+from server import QueryServer
+
+import asyncio
+import json
+import os
+import tempfile
+import time
+import unittest
+import unittest.mock as mock
+
+
+class QueryServerTestCase(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        with mock.patch('model.index.Config', autospec=True, spec_set=True) as mock_config:
+            mock_config.return_value.remove_stopwords.return_value = False
+            mock_config.return_value.language.return_value = 'english'
+            mock_config.return_value.use_stemming.return_value = False
+            self.index = Index()
+        self.index._add_words('doc1', {'some', 'data'})
+        self.index._add_words('doc2', {'data', 'here'})
+        self.index._add_words('doc3', {'kernel'})
+
+    async def start(self, **kwargs):
+        server = QueryServer(self.index, **kwargs)
+        host, port = await server.start()
+        self.addAsyncCleanup(server.close)
+        reader, writer = await asyncio.open_connection(host, port)
+        self.addCleanup(writer.close)
+        return server, reader, writer
+
+    async def request(self, reader, writer, *requests):
+        for request in requests:
+            line = request if isinstance(request, str) else json.dumps(request)
+            writer.write(line.encode() + b'\n')
+        await writer.drain()
+        return [json.loads(await reader.readline()) for _ in requests]
+
+    async def test_queries(self):
+        server, reader, writer = await self.start()
+        responses = await self.request(
+                reader, writer,
+                {'id': 1, 'query': 'data && !here'},
+                {'id': 2, 'query': 'data', 'mode': 'dense'},
+                {'id': 3, 'query': 'data &&'},
+                {'id': 4},
+                'not json',
+                {'op': 'stats'})
+        assert responses[0] == {'id': 1, 'files': ['doc1']}
+        assert responses[1] == {'id': 2, 'files': ['doc1', 'doc2']}
+        assert 'position' in responses[2]['error']
+        assert responses[3]['error'] == '[Error] The request has no query!'
+        assert 'error' in responses[4]
+        assert responses[5]['stats']['requests'] == 6
+        assert server.stats['errors'] == 3
+
+    async def test_ranked_queries(self):
+        _, reader, writer = await self.start()
+        responses = await self.request(
+                reader, writer,
+                {'id': 1, 'query': 'data || kernel', 'top_k': 1},
+                {'id': 2, 'query': 'data', 'top_k': 0})
+        assert responses[0] == {'id': 1, 'files': ['doc3']}
+        assert 'positive integer' in responses[1]['error']
+
+    async def test_pipelined_responses_keep_the_order_of_the_requests(self):
+        _, reader, writer = await self.start(max_concurrency=4,
+                                             max_pending=8)
+        queries = [{'id': number, 'query': ['data', 'kernel', 'some'][number % 3]}
+                   for number in range(100)]
+        responses = await self.request(reader, writer, *queries)
+        assert [response['id'] for response in responses] == list(range(100))
+        assert responses[1]['files'] == ['doc3']
+
+    async def test_slow_query_times_out(self):
+        query = self.index.get_result_for_query
+
+        def slow_query(*args):
+            time.sleep(0.2)
+            return query(*args)
+
+        self.index.get_result_for_query = slow_query
+        server, reader, writer = await self.start(timeout=0.05)
+        responses = await self.request(reader, writer, {'query': 'data'})
+        assert responses[0]['error'] == '[Error] The query took too long!'
+        assert server.stats['timeouts'] == 1
+
+    async def test_timed_out_query_keeps_its_slot_until_it_ends(self):
+        query = self.index.get_result_for_query
+
+        def slow_query(*args):
+            time.sleep(0.3)
+            return query(*args)
+
+        self.index.get_result_for_query = slow_query
+        server, reader, writer = await self.start(timeout=0.05,
+                                                  max_concurrency=1)
+        responses = await self.request(reader, writer, {'query': 'data'})
+        assert responses[0]['error'] == '[Error] The query took too long!'
+        # The slow query is still evaluated, so the next one waits for it
+        assert server._semaphore.locked()
+        self.index.get_result_for_query = query
+        start = time.monotonic()
+        responses = await self.request(reader, writer, {'query': 'kernel'})
+        assert responses[0] == {'id': None, 'files': ['doc3']}
+        assert time.monotonic() - start > 0.15
+        assert not server._semaphore.locked()
+
+    async def test_unix_socket_and_worker_processes(self):
+        server = QueryServer(self.index, workers=2)
+        self.addAsyncCleanup(server.close)
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'server.sock')
+            assert await server.start(path=path) == path
+            reader, writer = await asyncio.open_unix_connection(path)
+            responses = await self.request(reader, writer,
+                                           {'query': 'data || kernel'},
+                                           {'query': 'here'})
+            writer.close()
+        assert responses == [{'id': None, 'files': ['doc1', 'doc2', 'doc3']},
+                             {'id': None, 'files': ['doc2']}]
+
+    async def test_two_servers_with_worker_processes_keep_their_index(self):
+        with mock.patch('model.index.Config', autospec=True, spec_set=True) as mock_config:
+            mock_config.return_value.remove_stopwords.return_value = False
+            mock_config.return_value.language.return_value = 'english'
+            mock_config.return_value.use_stemming.return_value = False
+            other = Index()
+        other._add_words('other', {'data'})
+        connections = []
+        for index in (self.index, other):
+            server = QueryServer(index, workers=1)
+            self.addAsyncCleanup(server.close)
+            connections.append(await asyncio.open_connection(
+                    *await server.start()))
+            self.addCleanup(connections[-1][1].close)
+        for (reader, writer), files in zip(connections,
+                                           (['doc1', 'doc2'], ['other'])):
+            responses = await self.request(reader, writer, {'query': 'data'})
+            assert responses == [{'id': None, 'files': files}]